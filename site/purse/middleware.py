@@ -0,0 +1,218 @@
+"""Middlewares of the purse project."""
+
+import functools
+import logging
+import re
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import (DatabaseError, connections)
+from django.db.backends.utils import CursorWrapper
+from django.utils.deprecation import MiddlewareMixin
+
+from purse.routers import (get_replica, use_replica)
+
+logger = logging.getLogger(__name__)
+
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+LISTS = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)')
+
+
+def normalize(sql):
+    """Return ``sql`` with literal values replaced by placeholders."""
+    return LISTS.sub('(?)', LITERALS.sub('?', sql))
+
+
+class CountingCursorWrapper(CursorWrapper):
+    """Cursor counting its statements and their duration.
+
+    ``counter`` is a list of the number of statements and their total
+    duration in seconds, updated in place.
+    """
+    def __init__(self, cursor, db, counter):
+        super(CountingCursorWrapper, self).__init__(cursor, db)
+        self.counter = counter
+
+    def execute(self, sql, params=None):
+        start = time.time()
+        try:
+            return super(CountingCursorWrapper, self).execute(sql, params)
+        finally:
+            self.counter[0] += 1
+            self.counter[1] += time.time() - start
+
+    def executemany(self, sql, param_list):
+        start = time.time()
+        try:
+            return super(CountingCursorWrapper, self).executemany(
+                sql, param_list)
+        finally:
+            self.counter[0] += 1
+            self.counter[1] += time.time() - start
+
+
+class TimingMiddleware(MiddlewareMixin):
+    """Measure the database, view and template times of requests.
+
+    The statements executed by all database connections during the
+    request are counted and timed. The number of queries and the
+    durations in milliseconds are added to the response in a
+    ``Server-Timing`` header and logged on one line of ``key=value``
+    pairs.
+
+    The SQL of the statements is only recorded, which keeps it in
+    memory during the request, when the ``TIMING_QUERIES`` setting is
+    true, or when it is ``None`` and ``DEBUG`` is true. Otherwise
+    cursors are wrapped to count statements only.
+
+    Template rendering is measured for template responses only; the
+    rendering done inside views is part of the view time.
+
+    When the SQL is recorded and a statement is executed, with
+    different literal values, at least ``TIMING_DUPLICATE_QUERIES``
+    times (a setting, ``None`` to disable the check), a warning with
+    the statement is logged since this usually denotes a query issued
+    in a loop.
+
+    This middleware should be the first one to time the others too.
+    """
+    def process_request(self, request):
+        request._timing = {'start': time.time(), 'connections': {},
+                           'counters': {}}
+        record = getattr(settings, 'TIMING_QUERIES', None)
+        if record is None:
+            record = settings.DEBUG
+        for connection in connections.all():
+            if record or connection.queries_logged:
+                request._timing['connections'][connection.alias] = (
+                    connection.force_debug_cursor,
+                    len(connection.queries_log))
+                connection.force_debug_cursor = True
+            else:
+                counter = [0, 0.0]
+                request._timing['counters'][connection.alias] = counter
+                connection.make_cursor = functools.partial(
+                    CountingCursorWrapper, db=connection, counter=counter)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timing = getattr(request, '_timing', None)
+        if timing is not None:
+            timing['view'] = time.time()
+
+    def process_template_response(self, request, response):
+        timing = getattr(request, '_timing', None)
+        if timing is not None:
+            timing['view'] = time.time() - timing.get('view', time.time())
+            timing['render'] = time.time()
+
+            def rendered(response):
+                timing['template'] = time.time() - timing['render']
+            response.add_post_render_callback(rendered)
+        return response
+
+    def process_response(self, request, response):
+        timing = getattr(request, '_timing', None)
+        if timing is None:
+            return response
+        total = time.time() - timing['start']
+        if 'render' not in timing and 'view' in timing:
+            timing['view'] = time.time() - timing['view']
+
+        queries = []
+        for alias, (force, start) in timing['connections'].items():
+            connection = connections[alias]
+            queries.extend(list(connection.queries_log)[start:])
+            connection.force_debug_cursor = force
+        count = len(queries)
+        db = sum(float(q['time']) for q in queries)
+        for alias, counter in timing['counters'].items():
+            # Restore the method of the class
+            connections[alias].__dict__.pop('make_cursor', None)
+            count += counter[0]
+            db += counter[1]
+        metrics = [('db', db, '{0} queries'.format(count))]
+        if 'view' in timing:
+            metrics.append(('view', timing['view'], None))
+        if 'template' in timing:
+            metrics.append(('template', timing['template'], None))
+        metrics.append(('total', total, None))
+        response['Server-Timing'] = ', '.join(
+            '{0};dur={1:.1f}'.format(name, value * 1000) +
+            (';desc="{0}"'.format(desc) if desc else '')
+            for name, value, desc in metrics)
+
+        logger.info('method=%s path=%s status=%s queries=%d %s',
+                    request.method, request.path, response.status_code,
+                    count,
+                    ' '.join('{0}_ms={1:.1f}'.format(name, value * 1000)
+                             for name, value, _ in metrics))
+        self.check_duplicates(request, queries)
+        return response
+
+    def check_duplicates(self, request, queries):
+        """Warn about statements executed too many times."""
+        threshold = getattr(settings, 'TIMING_DUPLICATE_QUERIES', None)
+        if threshold is None:
+            return
+        counts = Counter(normalize(q['sql']) for q in queries)
+        for sql, count in counts.most_common():
+            if count < threshold:
+                break
+            logger.warning('path=%s duplicated=%d sql=%s',
+                           request.path, count, sql)
+
+
+def disable_replica(**kwargs):
+    """Stop reading from the replica once the response is sent."""
+    use_replica(False)
+
+
+request_finished.connect(disable_replica)
+
+
+class ReplicaMiddleware(MiddlewareMixin):
+    """Send the reads of read-only views to the replica database.
+
+    Reads are routed to the replica (see ``purse.routers``) for safe
+    requests handled by views whose ``read_replica`` attribute, or the
+    one of their class, is true. They stay on the primary database
+    when the replica can't be connected to, and during
+    ``REPLICA_STICKY_DELAY`` seconds after a request with an unsafe
+    method from the same client, recorded in a cookie, so that users
+    read their own writes.
+
+    The replica is used until the response has been sent, which
+    includes the iteration of streaming responses.
+    """
+    cookie_name = 'primary_reads'
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    def process_request(self, request):
+        use_replica(False)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = getattr(view_func, 'view_class', view_func)
+        if (not getattr(view, 'read_replica', False) or
+                request.method not in self.safe_methods or
+                self.cookie_name in request.COOKIES):
+            return None
+        alias = get_replica()
+        if alias is None:
+            return None
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError:
+            logger.warning('path=%s replica=%s unavailable', request.path,
+                           alias)
+        else:
+            use_replica(True)
+        return None
+
+    def process_response(self, request, response):
+        if request.method not in self.safe_methods:
+            delay = getattr(settings, 'REPLICA_STICKY_DELAY', 10)
+            response.set_cookie(self.cookie_name, '1', max_age=delay,
+                                httponly=True)
+        return response
@@ -0,0 +1,51 @@
+"""Database routers of the purse project.
+
+Reads may be sent to a replica of the primary database, named by the
+``REPLICA_DATABASE`` setting (``None`` to disable it). The replica is
+only used while it is enabled for the current thread, which
+``purse.middleware.ReplicaMiddleware`` does for the requests of views
+with a true ``read_replica`` attribute. Writes always go to the
+primary database.
+
+"""
+
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+_state = threading.local()
+
+
+def get_replica():
+    """Return the alias of the replica database, if configured."""
+    alias = getattr(settings, 'REPLICA_DATABASE', None)
+    return alias if alias in settings.DATABASES else None
+
+
+def use_replica(enabled=True):
+    """Enable or disable reads from the replica for the current thread."""
+    _state.replica = enabled
+
+
+def replica_enabled():
+    """Check whether reads of the current thread go to the replica."""
+    return getattr(_state, 'replica', False)
+
+
+class ReplicaRouter(object):
+    """Route reads to the replica when enabled for the current thread."""
+
+    def db_for_read(self, model, **hints):
+        if replica_enabled():
+            return get_replica()
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = (DEFAULT_DB_ALIAS, get_replica())
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
@@ -96,6 +96,8 @@ STATICFILES_FINDERS = (
 SECRET_KEY = os.environ['DJANGO_SECRET_KEY']
 
 MIDDLEWARE_CLASSES = (
+    'purse.middleware.TimingMiddleware',
+    'purse.middleware.ReplicaMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -184,3 +186,50 @@ MESSAGE_TAGS = {
 }
 
 X_FRAME_OPTIONS = 'DENY'
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'purse',
+    }
+}
+
+# Lifetime, in seconds, of the reports and fragments cached by the
+# tracker application (see tracker.cache)
+TRACKER_CACHE_TIMEOUT = 3600
+TRACKER_CACHE_FRAGMENT_TIMEOUT = 300
+
+# Count the hits and misses of the tracker cache (see the cachestats
+# command), at the cost of a cache write per lookup
+TRACKER_CACHE_STATS = False
+
+# Record the following occurrences of an expenditure as a recurrence
+# expanded when reading, instead of generated expenditures. Occurrences
+# are only shown by the month lists and counted in the monthly
+# statistics: they are missing from searches, exports and purse totals,
+# and can't be updated nor deleted from the site
+TRACKER_LAZY_RECURRENCES = False
+
+# Maintain tags out of the request: saving an expenditure records a
+# tag job processed by the runtagworker command, which must then be
+# kept running (see README.rst)
+TRACKER_TAG_QUEUE = False
+
+# Database alias of a replica receiving the reads of read-only views
+# (None to read from the primary database only), and delay in seconds
+# during which the reads of a client stay on the primary database
+# after it changed data (see purse.routers)
+DATABASE_ROUTERS = ['purse.routers.ReplicaRouter']
+REPLICA_DATABASE = None
+REPLICA_STICKY_DELAY = 10
+
+# Record the SQL of the queries of requests in the timing middleware,
+# which keeps it in memory during each request, to report duplicated
+# statements (None to record it only when DEBUG is true). Queries are
+# counted and timed in any case
+TIMING_QUERIES = None
+
+# Number of executions of a statement, with different literal values,
+# from which a request is reported by the timing middleware (None to
+# disable the check)
+TIMING_DUPLICATE_QUERIES = 10
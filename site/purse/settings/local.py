@@ -34,6 +34,7 @@ TEMPLATES = [
                 'django.template.context_processors.static',
                 'django.template.context_processors.tz',
                 'django.contrib.messages.context_processors.messages',
+                'tracker.context_processors.purses',
             ],
             'loaders': [
                 'django.template.loaders.filesystem.Loader',
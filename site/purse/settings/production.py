@@ -21,6 +21,12 @@ DATABASES = {
     }
 }
 
+if 'DJANGO_REPLICA_HOST' in os.environ:
+    DATABASES['replica'] = dict(DATABASES['default'],
+                                HOST=os.environ['DJANGO_REPLICA_HOST'],
+                                TEST={'MIRROR': 'default'})
+    REPLICA_DATABASE = 'replica'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -35,6 +41,7 @@ TEMPLATES = [
                 'django.template.context_processors.static',
                 'django.template.context_processors.tz',
                 'django.contrib.messages.context_processors.messages',
+                'tracker.context_processors.purses',
             ],
             'loaders': [
                 'django.template.loaders.cached.Loader',
@@ -52,6 +59,13 @@ CSRF_COOKIE_SECURE = True
 
 STATIC_ROOT = os.path.join(PROJECT_PATH, 'public/static/')
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(PROJECT_PATH, 'cache'),
+    }
+}
+
 EMAIL_HOST = os.environ['EMAIL_HOST']
 SERVER_EMAIL = os.environ['DJANGO_ADMIN_EMAIL']
 DEFAULT_FROM_EMAIL = SERVER_EMAIL
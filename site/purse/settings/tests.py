@@ -8,6 +8,12 @@ hasher is rather slow.
 Email messages are stored in a special attribute of the
 'django.core.mail' module.
 
+Nothing is cached, so that tests don't depend on each other through
+the cache.
+
+A second database is configured to test reads from a replica, which
+are disabled by default.
+
 """
 
 from purse.settings.base import *
@@ -23,6 +29,10 @@ DATABASES = {
         "HOST": "",
         "PORT": "",
     },
+    "replica": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": ":memory:",
+    },
 }
 
 TEMPLATES = [
@@ -39,6 +49,7 @@ TEMPLATES = [
                 'django.template.context_processors.static',
                 'django.template.context_processors.tz',
                 'django.contrib.messages.context_processors.messages',
+                'tracker.context_processors.purses',
             ],
             'loaders': [
                 'django.template.loaders.filesystem.Loader',
@@ -48,6 +59,12 @@ TEMPLATES = [
     },
 ]
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    }
+}
+
 PASSWORD_HASHERS = ('django.contrib.auth.hashers.MD5PasswordHasher',)
 
 EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
@@ -0,0 +1,95 @@
+"""Tests for middlewares of purse project."""
+
+import logging
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import (RequestFactory, TestCase, override_settings)
+from purse.middleware import (TimingMiddleware, normalize)
+from tracker.models import (Expenditure, Purse, User)
+
+
+class NormalizeTest(TestCase):
+    """Test SQL statements normalization."""
+    def test_normalize(self):
+        """Literal values are replaced by placeholders."""
+        self.assertEqual(normalize("SELECT a FROM t WHERE b = 'it''s' AND "
+                                   "c IN (1, 2, 3) AND d = 4.5"),
+                         'SELECT a FROM t WHERE b = ? AND c IN (?) AND '
+                         'd = ?')
+
+
+class RecordingHandler(logging.Handler):
+    """Logging handler keeping the formatted messages."""
+    def __init__(self):
+        super(RecordingHandler, self).__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append((record.levelname, record.getMessage()))
+
+
+class TimingMiddlewareTest(TestCase):
+    """Test timing middleware."""
+    def setUp(self):
+        self.handler = RecordingHandler()
+        self.logger = logging.getLogger('purse.middleware')
+        self.logger.addHandler(self.handler)
+        self.level = self.logger.level
+        self.logger.setLevel(logging.INFO)
+        self.credentials = {'username': 'username',
+                            'password': 'password'}
+        u = User.objects.create_user(**self.credentials)
+        p = Purse.objects.create(name='test')
+        p.users.add(u)
+        for i in range(3):
+            Expenditure.objects.create(amount=10, date='2014-12-2',
+                                       description='desc', author=u,
+                                       purse=p)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.logger.setLevel(self.level)
+
+    @override_settings(TIMING_QUERIES=True)
+    def test_header(self):
+        """The response has a Server-Timing header."""
+        self.client.login(**self.credentials)
+        url = reverse('tracker:archive', kwargs={'year': 2014,
+                                                 'month': 12})
+        response = self.client.get(url)
+        header = response['Server-Timing']
+        self.assertRegexpMatches(header,
+                                 r'^db;dur=[\d.]+;desc="\d+ queries", '
+                                 r'view;dur=[\d.]+, template;dur=[\d.]+, '
+                                 r'total;dur=[\d.]+$')
+        self.assertIn('status=200', self.handler.messages[-1][1])
+
+    @override_settings(TIMING_DUPLICATE_QUERIES=1)
+    def test_count(self):
+        """Queries are counted without recording them by default."""
+        self.client.login(**self.credentials)
+        url = reverse('tracker:archive', kwargs={'year': 2014,
+                                                 'month': 12})
+        logged = len(connection.queries_log)
+        response = self.client.get(url)
+        self.assertRegexpMatches(response['Server-Timing'],
+                                 r'^db;dur=[\d.]+;desc="[1-9]\d* queries", ')
+        self.assertRegexpMatches(self.handler.messages[-1][1],
+                                 r'queries=[1-9]')
+        self.assertEqual([m for level, m in self.handler.messages
+                          if level == 'WARNING'], [])
+        self.assertEqual(len(connection.queries_log), logged)
+        self.assertNotIn('make_cursor', connection.__dict__)
+
+    @override_settings(TIMING_DUPLICATE_QUERIES=2)
+    def test_duplicates(self):
+        """Repeated statements are reported."""
+        request = RequestFactory().get('/')
+        queries = [{'sql': 'SELECT * FROM t WHERE id = {0}'.format(i),
+                    'time': '0.001'} for i in range(2)]
+        TimingMiddleware().check_duplicates(request, queries[:1])
+        self.assertEqual(self.handler.messages, [])
+        TimingMiddleware().check_duplicates(request, queries)
+        warnings = [m for level, m in self.handler.messages
+                    if level == 'WARNING']
+        self.assertIn('duplicated=', warnings[0])
@@ -0,0 +1,80 @@
+"""Tests for database routers of purse project."""
+
+from django.contrib.sessions.models import Session
+from django.core.urlresolvers import reverse
+from django.test import (TestCase, override_settings)
+from purse.middleware import ReplicaMiddleware
+from purse.routers import (ReplicaRouter, replica_enabled, use_replica)
+from tracker.models import (Expenditure, MonthStat, Purse, User)
+
+
+class ReplicaRouterTest(TestCase):
+    """Test routing of reads to the replica."""
+    multi_db = True
+
+    def tearDown(self):
+        use_replica(False)
+
+    @override_settings(REPLICA_DATABASE='replica')
+    def test_routing(self):
+        """Reads go to the replica only when enabled."""
+        router = ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Expenditure))
+        use_replica()
+        self.assertTrue(replica_enabled())
+        self.assertEqual(router.db_for_read(Expenditure), 'replica')
+        self.assertEqual(router.db_for_write(Expenditure), 'default')
+
+    @override_settings(REPLICA_DATABASE='unknown')
+    def test_unknown(self):
+        """Reads stay on the primary database without replica."""
+        use_replica()
+        self.assertIsNone(ReplicaRouter().db_for_read(Expenditure))
+
+
+@override_settings(REPLICA_DATABASE='replica')
+class ReplicaMiddlewareTest(TestCase):
+    """Test reads of read-only views from the replica."""
+    multi_db = True
+
+    def setUp(self):
+        credentials = {'username': 'username', 'password': 'password'}
+        u = User.objects.create_user(**credentials)
+        self.purse = Purse.objects.create(name='test')
+        self.purse.users.add(u)
+        u.default_purse = self.purse
+        u.save()
+        Expenditure.objects.create(amount=10, date='2014-12-2',
+                                   description='on primary', author=u,
+                                   purse=self.purse)
+        self.client.login(**credentials)
+        for model in (User, Session, Purse, Purse.users.through,
+                      Expenditure, MonthStat):
+            model.objects.using('replica').bulk_create(
+                list(model.objects.using('default')))
+        Expenditure.objects.using('replica').update(description='on replica')
+        self.url = reverse('tracker:archive', kwargs={'year': 2014,
+                                                      'month': 12})
+
+    def test_replica(self):
+        """Read-only views read from the replica."""
+        response = self.client.get(self.url)
+        self.assertContains(response, 'On replica')
+        self.assertNotContains(response, 'On primary')
+        self.assertFalse(replica_enabled())
+
+    def test_read_your_writes(self):
+        """Reads stay on the primary database after a change."""
+        response = self.client.post(reverse('tracker:purse_update',
+                                            kwargs={'pk': self.purse.pk}),
+                                    {'name': 'new', 'description': ''})
+        self.assertIn(ReplicaMiddleware.cookie_name, response.cookies)
+        response = self.client.get(self.url)
+        self.assertContains(response, 'On primary')
+        self.assertNotContains(response, 'On replica')
+
+    @override_settings(REPLICA_DATABASE=None)
+    def test_disabled(self):
+        """Reads stay on the primary database without replica."""
+        response = self.client.get(self.url)
+        self.assertContains(response, 'On primary')
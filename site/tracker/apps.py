@@ -0,0 +1,19 @@
+"""Tracker application configuration."""
+
+from django.apps import AppConfig
+from django.db.models.signals import (m2m_changed, post_migrate)
+
+
+class TrackerConfig(AppConfig):
+    """Configuration of the tracker application.
+
+    Search index structures are created after migrations, and purses
+    record the changes of their users.
+    """
+    name = 'tracker'
+
+    def ready(self):
+        from tracker import search
+        from tracker.models import (Purse, touch_members)
+        post_migrate.connect(search.setup, sender=self)
+        m2m_changed.connect(touch_members, sender=Purse.users.through)
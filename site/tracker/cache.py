@@ -0,0 +1,85 @@
+"""Cache of computed reports and rendered fragments.
+
+Entries are keyed on the purse identifier and version. Since the
+version is incremented on every change of a purse (see
+``PurseManager.touch``), writes invalidate the entries of a purse
+implicitly: the old entries are no longer read and expire.
+
+The cache alias is given by the ``TRACKER_CACHE`` setting (default
+to ``default``) and the entries lifetime, in seconds, by
+``TRACKER_CACHE_TIMEOUT`` (default to one hour). When the
+``TRACKER_CACHE_STATS`` setting is true, cache hits and misses are
+counted in the cache itself, so that the counters are shared by
+processes using a shared backend. Counting costs a cache write per
+lookup, and increments aren't atomic with every backend (such as the
+file-based one), so that it is meant for measurements only.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.encoding import force_bytes
+
+HITS_KEY = 'tracker:cache:hits'
+MISSES_KEY = 'tracker:cache:misses'
+
+
+def get_cache():
+    """Return the cache used by the tracker application."""
+    return caches[getattr(settings, 'TRACKER_CACHE', 'default')]
+
+
+def make_key(purse, name, parts=()):
+    """Return the cache key of an entry of ``purse``.
+
+    ``parts`` are the values the entry depends on, besides the purse.
+    """
+    digest = hashlib.md5(force_bytes(repr(list(parts)))).hexdigest()
+    return 'tracker:{0}:{1}:{2}:{3}'.format(purse.pk, purse.version, name,
+                                            digest)
+
+
+def incr(key):
+    """Increment the counter stored at ``key``, if counting."""
+    if not getattr(settings, 'TRACKER_CACHE_STATS', False):
+        return
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def get_or_set(purse, name, parts, compute, timeout=None):
+    """Return the entry of ``purse``, computing it on cache misses.
+
+    ``compute`` is called without arguments and its result is stored
+    for ``timeout`` seconds (default to the ``TRACKER_CACHE_TIMEOUT``
+    setting).
+    """
+    cache = get_cache()
+    key = make_key(purse, name, parts)
+    value = cache.get(key)
+    if value is not None:
+        incr(HITS_KEY)
+        return value
+    incr(MISSES_KEY)
+    value = compute()
+    if timeout is None:
+        timeout = getattr(settings, 'TRACKER_CACHE_TIMEOUT', 3600)
+    cache.set(key, value, timeout)
+    return value
+
+
+def get_stats():
+    """Return the numbers of cache hits and misses."""
+    values = get_cache().get_many([HITS_KEY, MISSES_KEY])
+    return {'hits': values.get(HITS_KEY, 0),
+            'misses': values.get(MISSES_KEY, 0)}
+
+
+def reset_stats():
+    """Reset the cache hits and misses counters."""
+    get_cache().delete_many([HITS_KEY, MISSES_KEY])
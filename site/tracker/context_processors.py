@@ -0,0 +1,33 @@
+"""Context processors and request-scoped loaders of tracker application."""
+
+from django.utils.functional import SimpleLazyObject
+
+from tracker.models import Purse
+
+
+def get_user_purses(request):
+    """Return the list of purses of the logged in user.
+
+    Purses are annotated with their number of users (see
+    ``PurseManager.for_user``). They are loaded once per request and
+    cached on the request, so that views, mixins and templates share
+    the same list. Anonymous users have no purse.
+    """
+    try:
+        return request._user_purses
+    except AttributeError:
+        user = request.user
+        if user.is_authenticated():
+            request._user_purses = list(Purse.objects.for_user(user))
+        else:
+            request._user_purses = []
+        return request._user_purses
+
+
+def purses(request):
+    """Extend the context with the purses of the logged in user.
+
+    The list is available as ``user_purses`` and is only loaded when
+    used.
+    """
+    return {'user_purses': SimpleLazyObject(lambda: get_user_purses(request))}
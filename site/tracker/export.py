@@ -0,0 +1,78 @@
+"""Export of expenditures.
+
+Expenditures are serialized as CSV or newline delimited JSON
+(NDJSON). Rows are fetched by keyset chunks so that memory usage
+doesn't depend on the number of exported expenditures. Amounts are
+written with two decimal places, as strings in NDJSON so that they
+are read back exactly.
+
+"""
+
+import csv
+import json
+
+from django.utils import six
+from django.utils.encoding import force_text
+
+from tracker.utils import iter_chunks
+
+FORMATS = ('csv', 'ndjson')
+
+CONTENT_TYPES = {'csv': 'text/csv',
+                 'ndjson': 'application/x-ndjson'}
+
+FIELDS = ('id', 'date', 'amount', 'description', 'author', 'generated',
+          'created')
+
+
+class Echo(object):
+    """File-like object returning what is written to it."""
+    def write(self, value):
+        return value
+
+
+def get_values(e):
+    """Return the exported values of the expenditure ``e``."""
+    return [e.pk, e.date.isoformat(), e.amount, e.description,
+            e.author.get_username(), e.generated, e.created.isoformat()]
+
+
+def iter_csv(qs, chunk_size):
+    writer = csv.writer(Echo())
+    yield writer.writerow(FIELDS)
+    for chunk in iter_chunks(qs, chunk_size):
+        rows = []
+        for e in chunk:
+            values = get_values(e)
+            if six.PY2:
+                values = [force_text(v).encode('utf-8') for v in values]
+            rows.append(writer.writerow(values))
+        yield ''.join(rows)
+
+
+def iter_ndjson(qs, chunk_size):
+    for chunk in iter_chunks(qs, chunk_size):
+        yield ''.join(json.dumps(dict(zip(FIELDS, get_values(e))),
+                                 default=str) + '\n'
+                      for e in chunk)
+
+
+def export(qs, fmt='csv', chunk_size=1000):
+    """Yield the serialization of the expenditures of ``qs`` by chunks.
+
+    Expenditures are ordered by primary key.
+    """
+    if fmt not in FORMATS:
+        raise ValueError('Unknown format: {0}'.format(fmt))
+    qs = qs.select_related('author')
+    serializer = iter_csv if fmt == 'csv' else iter_ndjson
+    return serializer(qs, chunk_size)
+
+
+def filter_dates(qs, start=None, end=None):
+    """Restrict ``qs`` to expenditures between two dates included."""
+    if start is not None:
+        qs = qs.filter(date__gte=start)
+    if end is not None:
+        qs = qs.filter(date__lte=end)
+    return qs
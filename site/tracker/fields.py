@@ -0,0 +1,77 @@
+"""Tracker model fields."""
+
+from decimal import (Decimal, InvalidOperation, ROUND_HALF_UP)
+
+from django import forms
+from django.core.exceptions import ValidationError
+from django.core.validators import (MaxValueValidator, MinValueValidator)
+from django.db.models import (BigIntegerField, Field)
+from django.utils import six
+from django.utils.translation import ugettext_lazy as _
+
+CENT = Decimal('0.01')
+
+# Largest amount whose number of cents fits in a 64-bit integer
+MAX_AMOUNT = Decimal(2 ** 63 - 1).scaleb(-2)
+
+
+class AmountField(BigIntegerField):
+    """Monetary amount stored as an integer number of cents.
+
+    Values are ``Decimal`` instances with two decimal places in
+    Python, and 64-bit integers of minor units in the database, so
+    that sums computed by the database are exact. Conversions happen
+    when loading values (including aggregates whose output field is an
+    amount) and when preparing them for queries, so that lookups and
+    assignments accept decimals, floats, integers and strings in
+    major units.
+
+    Amounts are limited to the range of the cents column, both by the
+    model field and by its form field.
+    """
+    default_error_messages = {
+        'invalid': _("'%(value)s' value must be a decimal number."),
+    }
+    default_validators = [MinValueValidator(-MAX_AMOUNT),
+                          MaxValueValidator(MAX_AMOUNT)]
+
+    def to_python(self, value):
+        if value is None or value == '':
+            return None
+        try:
+            if isinstance(value, float):
+                value = repr(value)
+            value = Decimal(value)
+        except (InvalidOperation, TypeError, ValueError):
+            value = None
+        if value is not None and value.is_finite():
+            try:
+                return value.quantize(CENT, rounding=ROUND_HALF_UP)
+            except InvalidOperation:
+                pass
+        raise ValidationError(self.error_messages['invalid'],
+                              code='invalid', params={'value': value})
+
+    def from_db_value(self, value, expression, connection, context):
+        if value is None:
+            return None
+        if not isinstance(value, six.integer_types):
+            # Sums may be decimals, and averages floats
+            if isinstance(value, float):
+                value = repr(value)
+            value = Decimal(value).to_integral_value(ROUND_HALF_UP)
+        return Decimal(value).scaleb(-2)
+
+    def get_prep_value(self, value):
+        value = Field.get_prep_value(self, value)
+        if value is None:
+            return None
+        return int(self.to_python(value).scaleb(2))
+
+    def formfield(self, **kwargs):
+        defaults = {'form_class': forms.DecimalField,
+                    'decimal_places': 2,
+                    'min_value': -MAX_AMOUNT,
+                    'max_value': MAX_AMOUNT}
+        defaults.update(kwargs)
+        return Field.formfield(self, **defaults)
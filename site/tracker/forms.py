@@ -8,9 +8,12 @@ from django.contrib.auth.forms import (
     SetPasswordForm as OrigSetPasswordForm)
 from django.core.exceptions import ValidationError
 from django.forms import (ModelForm, ChoiceField, CharField)
+from django.template.loader import render_to_string
 from django.utils.translation import ugettext_lazy as _
 
 from tracker.models import (Expenditure, Purse)
+from tracker.utils import add_months
+from users.models import OutboxEmail
 from bootstrap.forms import (BootstrapWidgetMixin, StaticControl)
 
 User = get_user_model()
@@ -21,7 +24,9 @@ OCCURRENCES_CHOICES = (('1', _('unique')),
                        ('4', _('next four months')),
                        ('5', _('next five months')),
                        ('6', _('next six months')),
-                       ('12', _('forthcoming year')))
+                       ('12', _('forthcoming year')),
+                       ('24', _('next two years')),
+                       ('36', _('next three years')))
 
 
 class ExpenditureForm(BootstrapWidgetMixin, ModelForm):
@@ -79,9 +84,8 @@ class MultipleExpenditureForm(ExpenditureForm):
         the field named date by increasing its month as many times as
         specified by the field named occurences.
 
-        When a build date raises a ``ValueError``, up to four previous
-        days are tried to handle leap years and month with less than
-        31 days.
+        Up to three previous days are tried to handle leap years and
+        month with less than 31 days (see ``tracker.utils.add_months``).
 
         """
         cleaned_data = super(MultipleExpenditureForm, self).clean()
@@ -89,25 +93,13 @@ class MultipleExpenditureForm(ExpenditureForm):
             count = int(cleaned_data['occurrences'])
             start = cleaned_data.get('date')
             if start:
-                for delta in range(1, count):
-                    total = start.month + delta
-                    year = start.year if total <= 12 else start.year + 1
-                    month = total if total <= 12 else total - 12
-                    for i in range(4):
-                        try:
-                            next_date = start.replace(day=start.day - i,
-                                                      month=month,
-                                                      year=year)
-                        except ValueError:
-                            next_date = None
-                        else:
-                            self.other_dates.append(next_date)
-                            break
-                    if next_date is None:
-                        msg = _('All expenditures must occur on valid dates.')
-                        self._errors["occurrences"] = self.error_class([msg])
-                        del cleaned_data['occurrences']
-                        break
+                try:
+                    self.other_dates = [add_months(start, delta)
+                                        for delta in range(1, count)]
+                except ValueError:
+                    msg = _('All expenditures must occur on valid dates.')
+                    self._errors["occurrences"] = self.error_class([msg])
+                    del cleaned_data['occurrences']
         return cleaned_data
 
 
@@ -170,8 +162,22 @@ class PasswordChangeForm(BootstrapWidgetMixin,
 
 class PasswordResetForm(BootstrapWidgetMixin,
                         OrigPasswordResetForm):
-    """Improve default form with Bootstrap aware widgets."""
-    pass
+    """Improve default form with Bootstrap aware widgets.
+
+    Emails are queued in the outbox instead of being sent.
+    """
+
+    def send_mail(self, subject_template_name, email_template_name,
+                  context, from_email, to_email,
+                  html_email_template_name=None):
+        """Queue the password reset email."""
+        subject = render_to_string(subject_template_name, context)
+        subject = ''.join(subject.splitlines())
+        body = render_to_string(email_template_name, context)
+        html_body = (render_to_string(html_email_template_name, context)
+                     if html_email_template_name is not None else '')
+        OutboxEmail.objects.enqueue(subject, body, to_email, from_email,
+                                    html_body)
 
 
 class SetPasswordForm(BootstrapWidgetMixin,
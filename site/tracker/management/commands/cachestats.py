@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from tracker.cache import (get_stats, reset_stats)
+
+
+class Command(BaseCommand):
+    """Display or reset the counters of the tracker cache."""
+    help = 'Display the hits and misses of the tracker cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help='reset the counters after displaying them')
+
+    def handle(self, *args, **options):
+        if not getattr(settings, 'TRACKER_CACHE_STATS', False):
+            self.stdout.write('Counters are disabled (see the '
+                              'TRACKER_CACHE_STATS setting)\n')
+        stats = get_stats()
+        total = stats['hits'] + stats['misses']
+        ratio = 100.0 * stats['hits'] / total if total else 0
+        self.stdout.write('Hits: {0}, misses: {1} ({2:.1f}% hits)\n'.format(
+            stats['hits'], stats['misses'], ratio))
+        if options['reset']:
+            reset_stats()
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+from django.db import (connection, transaction)
+from django.db.models import FloatField
+from tracker.models import (Expenditure, MonthStat, Recurrence, TagStat)
+
+MODELS = (Expenditure, Recurrence, TagStat, MonthStat)
+
+
+class Command(BaseCommand):
+    """Convert amount columns from floating point to integer cents.
+
+    Amounts used to be stored as floating point numbers. Each amount
+    column still having a floating point type is rounded to cents and
+    altered to a 64-bit integer column, in its own transaction.
+    Columns which are already converted are left unchanged, so that
+    the command may be run several times.
+    """
+    help = 'Convert amounts from floating point numbers to integer cents'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            dest='dry_run',
+                            help='only report the columns to convert')
+
+    def handle(self, *args, **options):
+        for model in MODELS:
+            field = model._meta.get_field('amount')
+            name = '{0}.{1}'.format(model._meta.db_table, field.column)
+            if self.get_field_type(model, field) != 'FloatField':
+                self.stdout.write('{0}: already converted\n'.format(name))
+                continue
+            if not options['dry_run']:
+                self.convert(model, field)
+            self.stdout.write('{0}: {1}\n'.format(
+                name, 'to convert' if options['dry_run'] else 'converted'))
+
+    def get_field_type(self, model, field):
+        """Return the field type of the column of ``field``."""
+        introspection = connection.introspection
+        with connection.cursor() as cursor:
+            description = introspection.get_table_description(
+                cursor, model._meta.db_table)
+        for row in description:
+            if row.name == field.column:
+                return introspection.get_field_type(row.type_code, row)
+
+    def convert(self, model, field):
+        """Round the amounts to cents and alter their column type."""
+        name, path, args, kwargs = field.deconstruct()
+        old_field = FloatField(*args, **kwargs)
+        old_field.set_attributes_from_name(name)
+        old_field.model = model
+        qn = connection.ops.quote_name
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('UPDATE {0} SET {1} = ROUND({1} * 100)'.format(
+                    qn(model._meta.db_table), qn(field.column)))
+            with connection.schema_editor() as editor:
+                editor.alter_field(model, old_field, field)
@@ -0,0 +1,114 @@
+import datetime
+
+from django.core.management.base import (BaseCommand, CommandError)
+from django.db import transaction
+from tracker.models import (Expenditure, Purse, Recurrence)
+from tracker.utils import add_months
+
+
+class Command(BaseCommand):
+    """Convert generated expenditures into recurrences.
+
+    Generated expenditures are grouped in series sharing their purse,
+    author, amount and description, created within ``--delay``
+    seconds and occurring on consecutive months. The source of a
+    series is the expenditure which isn't generated, with the same
+    values, created just before and occurring the month before the
+    first generated one. Its date is the start of the recurrence;
+    without source, the start is the month before the first
+    occurrence. Series whose dates can't be produced by a recurrence
+    are left unchanged.
+
+    Each purse is converted in its own transaction: recurrences are
+    created, generated expenditures deleted and monthly statistics of
+    the affected months recomputed.
+    """
+    help = 'Convert generated expenditures into recurrences'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--purse', type=int,
+                            help='identifier of the purse to handle')
+        parser.add_argument('--delay', type=int, default=60,
+                            help='maximal creation delay, in seconds, '
+                            'between expenditures of a series')
+        parser.add_argument('--dry-run', action='store_true',
+                            dest='dry_run',
+                            help='only report the series found')
+
+    def handle(self, *args, **options):
+        purses = Purse.objects.order_by('pk')
+        if options['purse'] is not None:
+            purses = purses.filter(pk=options['purse'])
+            if not purses.exists():
+                raise CommandError('Unknown purse: {0}'.format(
+                    options['purse']))
+        self.delay = datetime.timedelta(seconds=options['delay'])
+        series_count, expenditure_count = 0, 0
+        for purse_id in purses.values_list('pk', flat=True):
+            with transaction.atomic():
+                series = self.get_series(purse_id)
+                for start, expenditures in series:
+                    if start is None:
+                        continue
+                    series_count += 1
+                    expenditure_count += len(expenditures)
+                    if not options['dry_run']:
+                        self.convert(start, expenditures)
+        msg = 'Series: {0}, generated expenditures: {1}\n'
+        if options['dry_run']:
+            msg = '(dry run) ' + msg
+        self.stdout.write(msg.format(series_count, expenditure_count))
+
+    def same_values(self, e, f):
+        return (e.author_id == f.author_id and e.amount == f.amount and
+                e.description == f.description)
+
+    def get_series(self, purse_id):
+        """Return the series of generated expenditures of a purse.
+
+        Series are ``(start, expenditures)`` pairs.
+        """
+        qs = Expenditure.objects.filter(purse_id=purse_id, generated=True) \
+            .order_by('author', 'description', 'amount', 'created', 'date')
+        series = []
+        for e in qs.iterator():
+            if series:
+                start, current = series[-1]
+                last = current[-1]
+                if (start is not None and self.same_values(last, e) and
+                        e.created - current[0].created <= self.delay and
+                        e.date == add_months(start, len(current) + 1)):
+                    current.append(e)
+                    continue
+            series.append((self.get_start(e), [e]))
+        return series
+
+    def get_start(self, e):
+        """Return the start date of a series beginning with ``e``.
+
+        ``None`` is returned when no start gives the date of ``e``.
+        """
+        previous = add_months(e.date, -1)
+        sources = Expenditure.objects.filter(
+            purse_id=e.purse_id, generated=False, author_id=e.author_id,
+            amount=e.amount, description=e.description,
+            created__gte=e.created - self.delay, created__lte=e.created,
+            date__year=previous.year, date__month=previous.month)
+        for source in sources.order_by('-created'):
+            if add_months(source.date, 1) == e.date:
+                return source.date
+        if add_months(previous, 1) == e.date:
+            return previous
+        return None
+
+    def convert(self, start, expenditures):
+        """Replace a series of expenditures by a recurrence."""
+        first = expenditures[0]
+        Recurrence.objects.create(amount=first.amount,
+                                  description=first.description,
+                                  author_id=first.author_id,
+                                  purse_id=first.purse_id, start=start,
+                                  count=len(expenditures))
+        # The query set refreshes the statistics of the months
+        Expenditure.objects.filter(
+            pk__in=[e.pk for e in expenditures]).delete()
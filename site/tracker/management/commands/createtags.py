@@ -1,14 +1,125 @@
+import json
+import multiprocessing
+import os
+import time
+
 from django.core.management.base import BaseCommand
-from tracker.models import (Expenditure, Tag)
+from django.db import (connections, transaction)
+from tracker.models import (Expenditure, Purse, Tag)
+from tracker.utils import iter_chunks
+
+
+def update_chunk(purse_id, after, chunk_size):
+    """Update the tags of the next chunk of a purse expenditures.
+
+    Return the purse identifier, the primary key of the last handled
+    expenditure (``None`` when the purse has been completely handled),
+    the number of handled expenditures and the tags statistics.
+    """
+    qs = Expenditure.objects.filter(purse_id=purse_id)
+    stats = [0, 0]
+    with transaction.atomic():
+        for chunk in iter_chunks(qs, chunk_size, after):
+            Tag.objects.update_from_many(chunk, stats)
+            Purse.objects.touch([purse_id])
+            return purse_id, chunk[-1].pk, len(chunk), stats
+    return purse_id, None, 0, stats
+
+
+def init_worker():
+    """Make sure workers don't share the parent database connections."""
+    connections.close_all()
 
 
 class Command(BaseCommand):
-    """Create or update tags."""
+    """Create or update tags.
+
+    Expenditures are handled purse by purse, in chunks fetched by
+    primary key order. Each chunk is committed in its own transaction.
+    Purses may be handled in parallel by a pool of processes.
+
+    When a checkpoint file is given, the last handled expenditure of
+    each purse is recorded in that file after each chunk, and an
+    interrupted run is resumed from it. The file is removed once all
+    purses have been handled.
+    """
     help = 'Create or update tags'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            dest='chunk_size',
+                            help='number of expenditures per transaction')
+        parser.add_argument('--jobs', type=int, default=1,
+                            help='number of worker processes (requires a '
+                            'database supporting concurrent writes)')
+        parser.add_argument('--checkpoint',
+                            help='file used to resume an interrupted run')
+
     def handle(self, *args, **options):
-        qs = Expenditure.objects.order_by('created')
-        stats = [0, 0]
-        for e in qs:
-            Tag.objects.update_from(e, stats)
-        print('Tags created: {0}, updated: {1}'.format(stats[0], stats[1]))
+        chunk_size = options['chunk_size']
+        jobs = options['jobs']
+        path = options['checkpoint']
+        checkpoint = self.load_checkpoint(path)
+        purses = Purse.objects.order_by('pk').values_list('pk', flat=True)
+        pending = [(p, checkpoint.get(str(p))) for p in purses
+                   if checkpoint.get(str(p), 0) is not None]
+
+        stats, total, start = [0, 0], 0, time.time()
+        if jobs > 1:
+            connections.close_all()
+            pool = multiprocessing.Pool(jobs, init_worker)
+            results = [pool.apply_async(update_chunk,
+                                        (p, after, chunk_size))
+                       for p, after in pending]
+        else:
+            pool = None
+        while pending:
+            if pool is not None:
+                result = results.pop(0).get()
+            else:
+                result = update_chunk(pending[0][0], pending[0][1],
+                                      chunk_size)
+            purse_id, after, count, chunk_stats = result
+            pending.pop(0)
+            checkpoint[str(purse_id)] = after
+            self.save_checkpoint(path, checkpoint)
+            stats = [a + b for a, b in zip(stats, chunk_stats)]
+            total += count
+            if after is not None:
+                pending.append((purse_id, after))
+                if pool is not None:
+                    results.append(pool.apply_async(
+                        update_chunk, (purse_id, after, chunk_size)))
+                elapsed = time.time() - start
+                msg = ('{1} expenditures handled, purse {0} in progress '
+                       '({2:.0f} rows/s)\n')
+                self.stdout.write(msg.format(purse_id, total,
+                                             total / elapsed
+                                             if elapsed else 0))
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+        self.stdout.write('Tags created: {0}, updated: {1}\n'.format(
+            stats[0], stats[1]))
+
+    def load_checkpoint(self, path):
+        """Return the checkpoint read from ``path``.
+
+        A checkpoint maps purse identifiers to the primary key of the
+        last handled expenditure, or ``None`` for completed purses.
+        """
+        if path is None or not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+    def save_checkpoint(self, path, checkpoint):
+        """Atomically write ``checkpoint`` to ``path``."""
+        if path is None:
+            return
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(checkpoint, f)
+        os.rename(tmp, path)
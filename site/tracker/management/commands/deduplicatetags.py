@@ -0,0 +1,95 @@
+from django.core.management.base import (BaseCommand, CommandError)
+from django.db import (connection, transaction)
+from django.db.models import (Count, Min)
+from tracker.models import (Purse, Tag, TagStat)
+from tracker.utils import chunks
+
+
+class Command(BaseCommand):
+    """Merge duplicate tags and enforce their uniqueness.
+
+    Tags sharing a purse and a name are merged into the oldest one:
+    links of the other tags to expenditures not linked to it yet are
+    moved to it, then the other tags are deleted with their remaining
+    links and statistics. Tag statistics of the affected purses are
+    rebuilt. Each purse is handled in its own transaction.
+
+    Once no duplicate is left, the unique constraint on purse and name
+    is created when the database lacks it, since tables created before
+    it aren't altered.
+    """
+    help = 'Merge duplicate tags and add their unique constraint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--purse', type=int,
+                            help='identifier of the purse to handle')
+        parser.add_argument('--dry-run', action='store_true',
+                            dest='dry_run',
+                            help='only report the duplicate tags')
+
+    def handle(self, *args, **options):
+        qs = Tag.objects.values('purse_id', 'name') \
+            .annotate(count=Count('id'), keep=Min('id')) \
+            .filter(count__gt=1).order_by('purse_id', 'name')
+        if options['purse'] is not None:
+            if not Purse.objects.filter(pk=options['purse']).exists():
+                raise CommandError('Unknown purse: {0}'.format(
+                    options['purse']))
+            qs = qs.filter(purse_id=options['purse'])
+        duplicates = {}
+        for d in qs:
+            duplicates.setdefault(d['purse_id'], []).append(d)
+        merged, moved = 0, 0
+        for purse_id, tags in sorted(duplicates.items()):
+            merged += sum(d['count'] - 1 for d in tags)
+            if options['dry_run']:
+                continue
+            with transaction.atomic():
+                for d in tags:
+                    moved += self.merge(d['purse_id'], d['name'], d['keep'])
+                TagStat.objects.rebuild(purse_id)
+                Purse.objects.touch([purse_id])
+        msg = 'Duplicate tags merged: {0}, links moved: {1}\n'
+        if options['dry_run']:
+            msg = '(dry run) ' + msg
+        self.stdout.write(msg.format(merged, moved))
+        if not options['dry_run'] and options['purse'] is None:
+            self.add_constraint()
+
+    def merge(self, purse_id, name, keep):
+        """Merge the tags of a purse named ``name`` into ``keep``.
+
+        Return the number of moved links.
+        """
+        Link = Tag.expenditures.through
+        ids = list(Tag.objects.filter(purse_id=purse_id, name=name)
+                   .exclude(pk=keep).values_list('pk', flat=True))
+        seen = set(Link.objects.filter(tag_id=keep)
+                   .values_list('expenditure_id', flat=True))
+        links = []
+        for pk, e_id in Link.objects.filter(tag_id__in=ids) \
+                .order_by('pk').values_list('pk', 'expenditure_id'):
+            if e_id not in seen:
+                seen.add(e_id)
+                links.append(pk)
+        for chunk in chunks(links, Tag.objects.batch_size):
+            Link.objects.filter(pk__in=chunk).update(tag_id=keep)
+        Tag.objects.filter(pk__in=ids).delete()
+        return len(links)
+
+    def add_constraint(self):
+        """Create the unique constraint on tags when it is missing."""
+        table = Tag._meta.db_table
+        columns = set(Tag._meta.get_field(f).column
+                      for f in ('purse', 'name'))
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor,
+                                                                   table)
+        if any(c['unique'] and set(c['columns']) == columns
+               for c in constraints.values()):
+            return
+        with connection.schema_editor() as editor:
+            editor.alter_unique_together(Tag, [],
+                                         Tag._meta.unique_together)
+        self.stdout.write('Unique constraint created on {0}\n'.format(
+            table))
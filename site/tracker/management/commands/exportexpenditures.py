@@ -0,0 +1,53 @@
+import datetime
+import sys
+
+from django.core.management.base import (BaseCommand, CommandError)
+from tracker.export import (FORMATS, export, filter_dates)
+from tracker.models import Purse
+from tracker.search import filter_by_keywords
+
+
+def parse_date(value):
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError('Invalid date: {0}'.format(value))
+
+
+class Command(BaseCommand):
+    """Export the expenditures of a purse."""
+    help = 'Export the expenditures of a purse as CSV or NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('purse', type=int,
+                            help='identifier of the purse to export')
+        parser.add_argument('--format', choices=FORMATS, default='csv',
+                            help='output format')
+        parser.add_argument('--start', type=parse_date,
+                            help='first date (YYYY-MM-DD)')
+        parser.add_argument('--end', type=parse_date,
+                            help='last date (YYYY-MM-DD)')
+        parser.add_argument('--filter', default='',
+                            help='space separated keywords to match')
+        parser.add_argument('--output',
+                            help='output file (default to standard output)')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            dest='chunk_size',
+                            help='number of expenditures per query')
+
+    def handle(self, *args, **options):
+        try:
+            purse = Purse.objects.get(pk=options['purse'])
+        except Purse.DoesNotExist:
+            raise CommandError('Unknown purse: {0}'.format(options['purse']))
+        qs = filter_dates(purse.expenditure_set.all(),
+                          options['start'], options['end'])
+        qs = filter_by_keywords(qs, options['filter'].split())
+        out = (open(options['output'], 'w') if options['output']
+               else self.stdout)
+        try:
+            for data in export(qs, options['format'], options['chunk_size']):
+                out.write(data)
+        finally:
+            if out is not self.stdout:
+                out.close()
@@ -0,0 +1,190 @@
+import csv
+import io
+import json
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import (BaseCommand, CommandError)
+from django.db import (connection, transaction)
+from django.db.models import Max
+from django.utils import (six, timezone)
+from django.utils.encoding import force_text
+from tracker.export import FORMATS
+from tracker.models import (Expenditure, MonthStat, Purse, Tag)
+from tracker.utils import iter_chunks
+
+COLUMNS = ('date', 'amount', 'description', 'author', 'generated')
+
+REQUIRED = ('date', 'amount', 'description')
+
+
+def read_csv(path):
+    """Yield the line numbers and dictionaries of the rows of a CSV file."""
+    if six.PY2:
+        with open(path, 'rb') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, dict((k, force_text(v, 'utf-8'))
+                                            for k, v in row.items())
+    else:
+        with io.open(path, newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+
+
+def read_ndjson(path):
+    """Yield the line numbers and dictionaries of a NDJSON file."""
+    with io.open(path, encoding='utf-8') as f:
+        for line_num, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_num, e
+            else:
+                yield line_num, row
+
+
+def copy_expenditures(expenditures):
+    """Insert expenditures with the PostgreSQL ``COPY`` statement."""
+    fields = [f for f in Expenditure._meta.concrete_fields
+              if not f.primary_key]
+    buf = six.StringIO()
+    writer = csv.writer(buf)
+    for e in expenditures:
+        values = [f.get_db_prep_save(getattr(e, f.attname), connection)
+                  for f in fields]
+        if six.PY2:
+            values = [force_text(v).encode('utf-8') for v in values]
+        writer.writerow(values)
+    buf.seek(0)
+    sql = 'COPY {0} ({1}) FROM STDIN WITH CSV'.format(
+        connection.ops.quote_name(Expenditure._meta.db_table),
+        ', '.join(connection.ops.quote_name(f.column) for f in fields))
+    with connection.cursor() as cursor:
+        cursor.copy_expert(sql, buf)
+
+
+class Command(BaseCommand):
+    """Import expenditures into a purse.
+
+    Rows are read from a CSV file with a header line or from a NDJSON
+    file, with the columns ``date`` (``YYYY-MM-DD``), ``amount``,
+    ``description`` and optionally ``author`` (username of a purse
+    user, default to the ``--author`` option) and ``generated``.
+    Other columns, such as those of exported files, are ignored.
+
+    Valid rows are inserted by batches, each one in its own
+    transaction, with ``COPY`` on PostgreSQL and multi-rows inserts on
+    other databases. Invalid rows are reported and skipped.
+
+    Tags and statistics aren't updated on insertion: the imported
+    expenditures are tagged by chunks once all rows have been loaded,
+    and the monthly statistics of the affected months are then
+    recomputed. Imported expenditures are found by primary keys
+    greater than the largest one before the import.
+    """
+    help = 'Import expenditures from a CSV or NDJSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('purse', type=int,
+                            help='identifier of the purse to import into')
+        parser.add_argument('path', help='file to import')
+        parser.add_argument('--format', choices=FORMATS,
+                            help='input format (default from the file '
+                            'extension)')
+        parser.add_argument('--author',
+                            help='username of the author of rows without '
+                            'one')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            dest='batch_size',
+                            help='number of expenditures per transaction')
+
+    def handle(self, *args, **options):
+        try:
+            purse = Purse.objects.get(pk=options['purse'])
+        except Purse.DoesNotExist:
+            raise CommandError('Unknown purse: {0}'.format(options['purse']))
+        self.authors = dict(purse.users.values_list('username', 'pk'))
+        self.default_author = options['author']
+        if (self.default_author is not None and
+                self.default_author not in self.authors):
+            raise CommandError('Unknown author: {0}'.format(
+                self.default_author))
+        path = options['path']
+        fmt = options['format']
+        if fmt is None:
+            fmt = 'ndjson' if path.endswith('.ndjson') else 'csv'
+        reader = read_ndjson if fmt == 'ndjson' else read_csv
+        batch_size = options['batch_size']
+
+        last = Expenditure.objects.aggregate(pk=Max('pk'))['pk'] or 0
+        created = timezone.now()
+        batch, months = [], set()
+        imported, rejected, start = 0, 0, time.time()
+        for line_num, row in reader(path):
+            try:
+                e = self.get_expenditure(purse, row, created)
+            except ValidationError as exc:
+                rejected += 1
+                self.stderr.write('Line {0}: {1}\n'.format(
+                    line_num, '; '.join(exc.messages)))
+                continue
+            batch.append(e)
+            months.add((e.date.year, e.date.month))
+            if len(batch) >= batch_size:
+                imported += self.insert(batch)
+                batch = []
+                elapsed = time.time() - start
+                msg = '{0} expenditures imported, {1} rejected ({2:.0f} ' \
+                    'rows/s)\n'
+                self.stdout.write(msg.format(imported, rejected,
+                                             imported / elapsed
+                                             if elapsed else 0))
+        imported += self.insert(batch)
+
+        stats = [0, 0]
+        qs = Expenditure.objects.filter(purse=purse)
+        for chunk in iter_chunks(qs, batch_size, last):
+            with transaction.atomic():
+                Tag.objects.update_from_many(chunk, stats)
+        MonthStat.objects.refresh(purse.pk, months)
+        Purse.objects.touch([purse.pk])
+        self.stdout.write('Imported: {0}, rejected: {1}, tags created: {2}, '
+                          'updated: {3}\n'.format(imported, rejected,
+                                                  stats[0], stats[1]))
+
+    def get_expenditure(self, purse, row, created):
+        """Return the expenditure built from an input ``row``.
+
+        ``ValidationError`` is raised for invalid rows.
+        """
+        if not isinstance(row, dict):
+            raise ValidationError(force_text(row))
+        missing = [c for c in REQUIRED if row.get(c) in (None, '')]
+        if missing:
+            raise ValidationError('Missing fields: {0}'.format(
+                ', '.join(missing)))
+        author = row.get('author') or self.default_author
+        if author not in self.authors:
+            raise ValidationError('Unknown author: {0}'.format(author))
+        e = Expenditure(purse=purse, author_id=self.authors[author],
+                        created=created,
+                        **dict((c, row[c]) for c in COLUMNS
+                               if c != 'author' and
+                               row.get(c) not in (None, '')))
+        e.clean_fields(exclude=['purse', 'author'])
+        return e
+
+    def insert(self, expenditures):
+        """Insert a batch of expenditures in a transaction."""
+        if not expenditures:
+            return 0
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                copy_expenditures(expenditures)
+            else:
+                Expenditure.objects.bulk_create(expenditures)
+        return len(expenditures)
@@ -0,0 +1,123 @@
+import time
+
+from django.core.management.base import (BaseCommand, CommandError)
+from django.db import connection
+from tracker.models import (Expenditure, MonthStat, Purse, Recurrence, Tag,
+                            TagJob, TagStat)
+from tracker.utils import delete_chunks
+
+
+def raw_delete(model, pks):
+    """Delete rows of ``model`` by primary keys.
+
+    A single statement is executed, without collecting the related
+    objects nor sending signals. Return the number of deleted rows.
+    """
+    qn = connection.ops.quote_name
+    sql = 'DELETE FROM {0} WHERE {1} IN ({2})'.format(
+        qn(model._meta.db_table), qn(model._meta.pk.column),
+        ', '.join(['%s'] * len(pks)))
+    with connection.cursor() as cursor:
+        cursor.execute(sql, pks)
+        return cursor.rowcount
+
+
+class Command(BaseCommand):
+    """Purge the rows of deleted purses.
+
+    Rows referencing a deleted purse are deleted table by table, from
+    the links between tags and expenditures to the memberships, by
+    chunks of primary keys. Each chunk is deleted by a single raw
+    statement in its own transaction, since the rows depending on it
+    have already been deleted. The purse itself is deleted last.
+
+    A purge stopped by its time budget or interrupted is resumed by
+    the next run.
+    """
+    help = 'Delete the rows of deleted purses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--purse', type=int,
+                            help='identifier of the deleted purse to purge')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            dest='batch_size',
+                            help='maximal number of rows per transaction')
+        parser.add_argument('--pause', type=float, default=0,
+                            help='delay, in seconds, between transactions')
+        parser.add_argument('--time-budget', type=float, dest='budget',
+                            help='duration, in seconds, after which no '
+                            'transaction is started')
+        parser.add_argument('--dry-run', action='store_true',
+                            dest='dry_run',
+                            help='only count the rows to delete')
+
+    def get_steps(self, purse_id):
+        """Return the query sets of rows to delete, in order."""
+        Link = Tag.expenditures.through
+        Member = Purse.users.through
+        return [Link.objects.filter(tag__purse_id=purse_id),
+                TagJob.objects.filter(expenditure__purse_id=purse_id),
+                TagStat.objects.filter(purse_id=purse_id),
+                MonthStat.objects.filter(purse_id=purse_id),
+                Recurrence.objects.filter(purse_id=purse_id),
+                Tag.objects.filter(purse_id=purse_id),
+                Expenditure.objects.filter(purse_id=purse_id),
+                Member.objects.filter(purse_id=purse_id)]
+
+    def handle(self, *args, **options):
+        purses = Purse.deleted_objects.order_by('deleted', 'pk')
+        if options['purse'] is not None:
+            purses = purses.filter(pk=options['purse'])
+            if not purses.exists():
+                raise CommandError('Unknown deleted purse: {0}'.format(
+                    options['purse']))
+        self.start = time.time()
+        purged = 0
+        for purse in purses:
+            if options['dry_run']:
+                counts = [qs.count() for qs in self.get_steps(purse.pk)]
+                self.stdout.write('(dry run) Purse {0}: {1} rows to '
+                                  'delete\n'.format(purse.pk,
+                                                    sum(counts) + 1))
+                continue
+            rows, complete = self.purge(purse, options)
+            if not complete:
+                self.report(purse.pk, rows, 'in progress')
+                self.stdout.write('Time budget exhausted\n')
+                break
+            purse_id = purse.pk
+            purse.delete()
+            purged += 1
+            self.report(purse_id, rows + 1, 'purged')
+        if not options['dry_run']:
+            self.stdout.write('Purses purged: {0}\n'.format(purged))
+
+    def purge(self, purse, options):
+        """Delete the rows referencing a purse.
+
+        Return the number of deleted rows and whether all of them have
+        been deleted within the time budget.
+        """
+        budget = options['budget']
+        rows = 0
+        for qs in self.get_steps(purse.pk):
+            remaining = (None if budget is None
+                         else budget - (time.time() - self.start))
+            for count, deleted in delete_chunks(
+                    qs, options['batch_size'], options['pause'], remaining,
+                    delete=lambda pks, model=qs.model: raw_delete(model,
+                                                                  pks)):
+                rows += deleted
+            if not self.has_time(budget) and qs.exists():
+                return rows, False
+        return rows, True
+
+    def has_time(self, budget):
+        return budget is None or time.time() - self.start < budget
+
+    def report(self, purse_id, rows, status):
+        elapsed = time.time() - self.start
+        self.stdout.write('Purse {0} {1}: {2} rows deleted ({3:.0f} '
+                          'rows/s)\n'.format(purse_id, status, rows,
+                                             rows / elapsed
+                                             if elapsed else 0))
@@ -0,0 +1,41 @@
+from django.core.management.base import (BaseCommand, CommandError)
+from tracker.models import (MonthStat, Purse)
+
+
+class Command(BaseCommand):
+    """Rebuild or check monthly statistics."""
+    help = 'Rebuild monthly statistics from expenditures'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--purse', type=int,
+                            help='identifier of the purse to handle')
+        parser.add_argument('--check', action='store_true',
+                            help='only compare statistics with the '
+                            'expenditures')
+
+    def handle(self, *args, **options):
+        purse = None
+        if options['purse'] is not None:
+            try:
+                purse = Purse.objects.get(pk=options['purse'])
+            except Purse.DoesNotExist:
+                raise CommandError('Unknown purse: {0}'.format(
+                    options['purse']))
+        if options['check']:
+            errors = MonthStat.objects.check(purse)
+            for (purse_id, author_id, year, month), stored, expected \
+                    in errors:
+                msg = ('Purse {0}, author {1}, {2}-{3:02}: stored {4}, '
+                       'expected {5}\n')
+                self.stdout.write(msg.format(purse_id, author_id, year,
+                                             month, stored, expected))
+            if errors:
+                raise CommandError('{0} invalid monthly statistics'.format(
+                    len(errors)))
+            self.stdout.write('Monthly statistics are consistent\n')
+        else:
+            count = MonthStat.objects.rebuild(purse)
+            Purse.objects.touch(Purse.objects.values_list('pk', flat=True)
+                                if purse is None else [purse.pk])
+            self.stdout.write('Monthly statistics rebuilt: {0}\n'.format(
+                count))
@@ -0,0 +1,37 @@
+from django.core.management.base import (BaseCommand, CommandError)
+from tracker.models import (Purse, TagStat)
+
+
+class Command(BaseCommand):
+    """Rebuild or check tag statistics."""
+    help = 'Rebuild tag statistics from tagged expenditures'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--purse', type=int,
+                            help='identifier of the purse to handle')
+        parser.add_argument('--check', action='store_true',
+                            help='only compare statistics with the '
+                            'tagged expenditures')
+
+    def handle(self, *args, **options):
+        purse = None
+        if options['purse'] is not None:
+            try:
+                purse = Purse.objects.get(pk=options['purse'])
+            except Purse.DoesNotExist:
+                raise CommandError('Unknown purse: {0}'.format(
+                    options['purse']))
+        if options['check']:
+            errors = TagStat.objects.check(purse)
+            for (tag_id, year), stored, expected in errors:
+                msg = 'Tag {0}, year {1}: stored {2}, expected {3}\n'
+                self.stdout.write(msg.format(tag_id, year, stored, expected))
+            if errors:
+                raise CommandError('{0} invalid tag statistics'.format(
+                    len(errors)))
+            self.stdout.write('Tag statistics are consistent\n')
+        else:
+            count = TagStat.objects.rebuild(purse)
+            Purse.objects.touch(Purse.objects.values_list('pk', flat=True)
+                                if purse is None else [purse.pk])
+            self.stdout.write('Tag statistics rebuilt: {0}\n'.format(count))
@@ -0,0 +1,136 @@
+import json
+import time
+
+from django.core.management.base import (BaseCommand, CommandError)
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from tracker import urls
+from tracker.models import (Expenditure, User)
+
+# Views skipped since they change the session, need one-time tokens or
+# don't support GET requests
+SKIPPED = ('logout', 'user_activation', 'password_reset_confirm',
+           'user_default_purse')
+
+QUERIES = {'expenditure-search': {'filter': 'bread'},
+           'tags': {'year': '{year}'},
+           'export': {'start': '{year}-01-01', 'end': '{year}-12-31'}}
+
+
+def percentile(values, p):
+    """Return the ``p`` percentile of ``values`` (nearest rank)."""
+    values = sorted(values)
+    rank = max(int(round(p / 100.0 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+class Command(BaseCommand):
+    """Time the views of the tracker application.
+
+    Each named URL of ``tracker.urls`` is requested ``--repeat``
+    times by a test client logged in as ``--username``, after
+    ``--warmup`` untimed requests. URL arguments are taken from the
+    user default purse and its latest expenditure. Streamed responses
+    are consumed while timing.
+
+    Latency percentiles (in milliseconds) and the number of SQL
+    queries of each view are reported and may be saved as JSON. A
+    previous JSON report can be given to print the latency ratios.
+    """
+    help = 'Benchmark the views of the tracker application'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', default='bench0',
+                            help='user logged in during the benchmark')
+        parser.add_argument('--password', default='password',
+                            help='password of the user')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='number of timed requests per view')
+        parser.add_argument('--warmup', type=int, default=2,
+                            help='number of untimed requests per view')
+        parser.add_argument('--host', default='localhost',
+                            help='host name of the requests')
+        parser.add_argument('--output', help='JSON report file')
+        parser.add_argument('--compare', help='previous JSON report')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError('Unknown user: {0}'.format(
+                options['username']))
+        client = Client(SERVER_NAME=options['host'])
+        if not client.login(username=user.username,
+                            password=options['password']):
+            raise CommandError('Invalid credentials')
+        previous = {}
+        if options['compare']:
+            with open(options['compare']) as f:
+                previous = dict((r['name'], r)
+                                for r in json.load(f)['results'])
+
+        results = []
+        for name, url, query in self.get_urls(user):
+            for _ in range(options['warmup']):
+                self.request(client, url, query)
+            timings, queries = [], []
+            for _ in range(options['repeat']):
+                with CaptureQueriesContext(connection) as context:
+                    start = time.time()
+                    status = self.request(client, url, query)
+                    timings.append((time.time() - start) * 1000)
+                queries.append(len(context.captured_queries))
+            result = {'name': name, 'url': url, 'query': query,
+                      'status': status,
+                      'p50': percentile(timings, 50),
+                      'p95': percentile(timings, 95),
+                      'queries': max(queries)}
+            results.append(result)
+            msg = '{name:<24} {status} {p50:8.1f} ms {p95:8.1f} ms ' \
+                '{queries:4d} queries'.format(**result)
+            if name in previous:
+                msg += ' ({0:.2f}x)'.format(
+                    result['p50'] / previous[name]['p50']
+                    if previous[name]['p50'] else 0)
+            self.stdout.write(msg + '\n')
+
+        if options['output']:
+            report = {'date': timezone.now().isoformat(),
+                      'database': connection.vendor,
+                      'repeat': options['repeat'],
+                      'expenditures': Expenditure.objects.count(),
+                      'results': results}
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+
+    def get_urls(self, user):
+        """Yield the name, path and query parameters of the views."""
+        purse = user.default_purse
+        expenditure = Expenditure.objects.filter(purse=purse) \
+            .order_by('-date', '-pk').first()
+        if purse is None or expenditure is None:
+            raise CommandError('The user default purse has no expenditure')
+        date = expenditure.date
+        values = {'year': date.year, 'end_year': date.year,
+                  'month': date.month}
+        pks = {'update': expenditure.pk, 'delete': expenditure.pk}
+        for pattern in urls.urlpatterns:
+            name = pattern.name
+            if name is None or name in SKIPPED:
+                continue
+            kwargs = dict((k, values.get(k, pks.get(name, purse.pk)))
+                          for k in pattern.regex.groupindex)
+            query = dict((k, v.format(**values))
+                         for k, v in QUERIES.get(name, {}).items())
+            yield name, reverse('tracker:' + name, kwargs=kwargs), query
+
+    def request(self, client, url, query):
+        """Get ``url`` and return the response status code."""
+        response = client.get(url, query)
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        return response.status_code
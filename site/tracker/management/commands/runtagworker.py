@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+from tracker.models import TagJob
+
+
+class Command(BaseCommand):
+    """Process the tag jobs recorded when saving expenditures.
+
+    Jobs are processed by batches, each in its own transaction, so
+    that the worker may be stopped at any time and restarted later:
+    an interrupted batch is processed again. When the queue is empty,
+    the worker waits ``--sleep`` seconds before polling it again,
+    unless ``--once`` is given.
+    """
+    help = 'Process the pending tag jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            dest='batch_size',
+                            help='maximal number of jobs per transaction')
+        parser.add_argument('--sleep', type=float, default=5,
+                            help='delay, in seconds, between polls of an '
+                            'empty queue')
+        parser.add_argument('--once', action='store_true',
+                            help='exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        stats, total, start = [0, 0], 0, time.time()
+        try:
+            while True:
+                count = TagJob.objects.process(options['batch_size'], stats)
+                if count:
+                    total += count
+                    elapsed = time.time() - start
+                    self.stdout.write('{0} jobs processed ({1:.0f} '
+                                      'jobs/s)\n'.format(
+                                          total,
+                                          total / elapsed if elapsed else 0))
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write('Tags created: {0}, updated: {1}\n'.format(
+            stats[0], stats[1]))
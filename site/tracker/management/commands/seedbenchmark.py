@@ -0,0 +1,189 @@
+import bisect
+import datetime
+import itertools
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import (BaseCommand, CommandError)
+from django.db import transaction
+from django.utils import timezone
+from tracker.models import (Expenditure, MonthStat, Purse, Tag, TagStat,
+                            User)
+from tracker.utils import (chunks, unique)
+
+WORDS = ('bread', 'cheese', 'wine', 'beer', 'coffee', 'fruits',
+         'vegetables', 'meat', 'fish', 'rice', 'pasta', 'milk', 'eggs',
+         'butter', 'chocolate', 'market', 'supermarket', 'bakery',
+         'restaurant', 'pizza', 'lunch', 'dinner', 'breakfast', 'cinema',
+         'theatre', 'concert', 'books', 'newspaper', 'train', 'bus',
+         'taxi', 'fuel', 'parking', 'toll', 'rent', 'electricity', 'gas',
+         'water', 'internet', 'phone', 'insurance', 'doctor', 'pharmacy',
+         'clothes', 'shoes', 'haircut', 'gift', 'birthday', 'holidays',
+         'hotel', 'flight', 'furniture', 'tools', 'garden', 'plants',
+         'cleaning', 'laundry', 'repairs', 'bicycle', 'sport')
+
+PASSWORD = 'password'
+
+
+class Vocabulary(object):
+    """Draw words with frequencies following Zipf's law."""
+    def __init__(self, rng, words=WORDS):
+        self.rng = rng
+        self.words = words
+        self.cumulated = []
+        total = 0
+        for rank in range(1, len(words) + 1):
+            total += 1.0 / rank
+            self.cumulated.append(total)
+
+    def word(self):
+        x = self.rng.random() * self.cumulated[-1]
+        return self.words[bisect.bisect(self.cumulated, x)]
+
+    def description(self):
+        return ' '.join(self.word() for _ in range(self.rng.randint(1, 3)))
+
+
+class Command(BaseCommand):
+    """Generate a synthetic dataset for benchmarks.
+
+    Users named after ``--prefix`` (with the password ``password``)
+    share purses: each purse has ``--members`` users and each user
+    belongs to several purses. Every purse gets ``--per-month``
+    expenditures per month over the last ``--years`` years, with
+    descriptions drawn from a vocabulary following Zipf's law.
+
+    Expenditures are bulk inserted by batches, each one in its own
+    transaction, and tagged as they are inserted. Tag and monthly
+    statistics are rebuilt once a purse is complete. The total number
+    of expenditures is ``purses * years * 12 * per_month``.
+    """
+    help = 'Generate purses, users, expenditures and tags for benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20,
+                            help='number of users')
+        parser.add_argument('--purses', type=int, default=10,
+                            help='number of purses')
+        parser.add_argument('--members', type=int, default=3,
+                            help='number of users per purse')
+        parser.add_argument('--years', type=int, default=3,
+                            help='number of years of expenditures')
+        parser.add_argument('--per-month', type=int, default=100,
+                            dest='per_month',
+                            help='number of expenditures per purse and '
+                            'month')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            dest='batch_size',
+                            help='number of expenditures per transaction')
+        parser.add_argument('--prefix', default='bench',
+                            help='prefix of the usernames and purse names')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='random generator seed')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError('Users named {0}* already exist, use another '
+                               'prefix'.format(prefix))
+        if options['members'] > options['users']:
+            raise CommandError('More members per purse than users')
+        self.rng = random.Random(options['seed'])
+        self.vocabulary = Vocabulary(self.rng)
+        self.batch_size = options['batch_size']
+        self.per_month = options['per_month']
+        last_year = timezone.now().year
+        self.months = [(y, m)
+                       for y in range(last_year - options['years'] + 1,
+                                      last_year + 1)
+                       for m in range(1, 13)]
+
+        users, purses = self.create_owners(prefix, options['users'],
+                                           options['purses'],
+                                           options['members'])
+        total = len(purses) * len(self.months) * self.per_month
+        self.count, self.start = 0, time.time()
+        for purse in purses:
+            self.create_expenditures(purse, users[purse.pk], total)
+        self.stdout.write('Users: {0}, purses: {1}, expenditures: {2}\n'
+                          .format(options['users'], len(purses),
+                                  self.count))
+
+    def create_owners(self, prefix, user_count, purse_count, members):
+        """Create the users and purses.
+
+        Return the purses and the dictionary mapping purse
+        identifiers to the identifiers of their users.
+        """
+        password = make_password(PASSWORD)
+        with transaction.atomic():
+            User.objects.bulk_create([
+                User(username='{0}{1}'.format(prefix, i), password=password)
+                for i in range(user_count)])
+            user_ids = list(User.objects
+                            .filter(username__startswith=prefix)
+                            .order_by('pk').values_list('pk', flat=True))
+            Purse.objects.bulk_create([
+                Purse(name='{0} {1}'.format(prefix, i))
+                for i in range(purse_count)])
+            purses = list(Purse.objects
+                          .filter(name__startswith=prefix + ' ')
+                          .order_by('pk'))
+            Member = Purse.users.through
+            users = {}
+            for i, purse in enumerate(purses):
+                users[purse.pk] = [user_ids[(i + k) % user_count]
+                                   for k in range(members)]
+            Member.objects.bulk_create([
+                Member(purse_id=p, user_id=u)
+                for p, ids in users.items() for u in ids])
+            for i, user_id in enumerate(user_ids):
+                if purses:
+                    User.objects.filter(pk=user_id).update(
+                        default_purse=purses[i % len(purses)])
+        return users, purses
+
+    def generate(self, purse, authors):
+        """Yield the expenditures of a purse, month by month."""
+        for year, month in self.months:
+            for _ in range(self.per_month):
+                date = datetime.date(year, month, self.rng.randint(1, 28))
+                yield Expenditure(
+                    purse=purse, author_id=self.rng.choice(authors),
+                    date=date,
+                    amount=round(self.rng.lognormvariate(3, 1), 2),
+                    description=self.vocabulary.description())
+
+    def create_expenditures(self, purse, authors, total):
+        """Insert and tag the expenditures of a purse."""
+        Tag.objects.create_missing(purse.pk, Tag.objects.get_tag_names(
+            ' '.join(WORDS)))
+        tag_ids = dict(purse.tag_set.values_list('name', 'pk'))
+        Link = Tag.expenditures.through
+        expenditures = self.generate(purse, authors)
+        while True:
+            batch = list(itertools.islice(expenditures, self.batch_size))
+            if not batch:
+                break
+            with transaction.atomic():
+                last = purse.expenditure_set.order_by('-pk') \
+                    .values_list('pk', flat=True).first() or 0
+                Expenditure.objects.bulk_create(batch)
+                pks = purse.expenditure_set.filter(pk__gt=last) \
+                    .order_by('pk').values_list('pk', flat=True)
+                links = [Link(expenditure_id=pk, tag_id=tag_ids[n])
+                         for pk, e in zip(pks, batch)
+                         for n in unique(Tag.objects.get_tag_names(
+                             e.description))]
+                for chunk in chunks(links, self.batch_size):
+                    Link.objects.bulk_create(chunk)
+            self.count += len(batch)
+            elapsed = time.time() - self.start
+            self.stdout.write('{0}/{1} expenditures created ({2:.0f} '
+                              'rows/s)\n'.format(self.count, total,
+                                                 self.count / elapsed
+                                                 if elapsed else 0))
+        TagStat.objects.rebuild(purse)
+        MonthStat.objects.rebuild(purse)
+        Purse.objects.touch([purse.pk])
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db.models import (Count, Min)
+from django.utils import timezone
+from tracker.models import TagJob
+
+
+class Command(BaseCommand):
+    """Report the pending tag jobs."""
+    help = 'Show the pending tag jobs'
+
+    def handle(self, *args, **options):
+        status = TagJob.objects.aggregate(
+            jobs=Count('id'), expenditures=Count('expenditure', distinct=True),
+            oldest=Min('created'))
+        self.stdout.write('Pending jobs: {0}, expenditures: {1}\n'.format(
+            status['jobs'], status['expenditures']))
+        if status['oldest'] is not None:
+            delay = timezone.now() - status['oldest']
+            self.stdout.write('Oldest job: {0} ({1:.0f} seconds '
+                              'ago)\n'.format(status['oldest'].isoformat(),
+                                              delay.total_seconds()))
+        purses = TagJob.objects.values('expenditure__purse_id') \
+            .annotate(jobs=Count('id')).order_by('-jobs')[:10]
+        for d in purses:
+            self.stdout.write('Purse {0}: {1} jobs\n'.format(
+                d['expenditure__purse_id'], d['jobs']))
@@ -0,0 +1,89 @@
+from django.core.management.base import BaseCommand
+from django.db import (connection, transaction)
+from tracker.models import (Expenditure, Purse)
+from users.models import Registration
+
+FIELDS = ((Purse, 'version'), (Purse, 'modified'), (Purse, 'deleted'))
+INDEXES = ((Expenditure, ('purse', 'date')), (Registration, ('key',)),
+           (Registration, ('created',)))
+
+
+class Command(BaseCommand):
+    """Add the columns and indexes missing from tables created by older
+    versions.
+
+    Tables are created when the site is installed, and aren't altered
+    afterwards. Each missing column is added in its own transaction,
+    and existing rows are filled with the default value of its field:
+    purses get version 0 and the current time as modification date,
+    so that cached reports are computed again, and none of them is
+    deleted. Indexes of added columns are created too. Columns which
+    already exist are left unchanged, so that the command may be run
+    several times.
+
+    Missing indexes are then created, each in its own transaction, as
+    the ``index_together`` option or the ``db_index`` attribute of a
+    field would.
+    """
+    help = ('Add the missing columns and indexes of tables created by '
+            'older versions')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            dest='dry_run',
+                            help='only report the columns and indexes to add')
+
+    def handle(self, *args, **options):
+        for model, name in FIELDS:
+            field = model._meta.get_field(name)
+            label = '{0}.{1}'.format(model._meta.db_table, field.column)
+            if field.column in self.get_columns(model):
+                self.stdout.write('{0}: already present\n'.format(label))
+                continue
+            if not options['dry_run']:
+                with transaction.atomic():
+                    with connection.schema_editor() as editor:
+                        editor.add_field(model, field)
+            self.stdout.write('{0}: {1}\n'.format(
+                label, 'to add' if options['dry_run'] else 'added'))
+        for model, names in INDEXES:
+            columns = [model._meta.get_field(n).column for n in names]
+            label = '{0}({1}) index'.format(model._meta.db_table,
+                                            ', '.join(columns))
+            if columns in self.get_indexes(model):
+                self.stdout.write('{0}: already present\n'.format(label))
+                continue
+            if not options['dry_run']:
+                with transaction.atomic():
+                    self.create_index(model, names)
+            self.stdout.write('{0}: {1}\n'.format(
+                label, 'to create' if options['dry_run'] else 'created'))
+
+    def create_index(self, model, names):
+        """Create the index of ``model`` on the fields ``names``."""
+        with connection.schema_editor() as editor:
+            if len(names) > 1:
+                editor.alter_index_together(model, [], [names])
+                return
+            field = model._meta.get_field(names[0])
+            name, path, args, kwargs = field.deconstruct()
+            kwargs['db_index'] = False
+            old_field = field.__class__(*args, **kwargs)
+            old_field.set_attributes_from_name(name)
+            old_field.model = model
+            editor.alter_field(model, old_field, field)
+
+    def get_columns(self, model):
+        """Return the names of the columns of the table of ``model``."""
+        with connection.cursor() as cursor:
+            description = connection.introspection.get_table_description(
+                cursor, model._meta.db_table)
+        return set(row.name for row in description)
+
+    def get_indexes(self, model):
+        """Return the column lists of the indexes on ``model``."""
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, model._meta.db_table)
+        return [c['columns'] for c in constraints.values()
+                if c['index'] or c['unique']]
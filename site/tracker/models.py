@@ -1,37 +1,164 @@
 """Tracker models."""
 
-from django.contrib.auth.models import AbstractUser
-from django.db.models import (Count, DateField, DateTimeField,
-                              FloatField, ForeignKey,
-                              BooleanField,
-                              CharField, ManyToManyField, Model,
-                              SET_NULL, Sum,
+import datetime
+from collections import defaultdict
+from django.conf import settings
+from django.contrib.auth import models as auth_models
+from django.core.exceptions import ValidationError
+from django.db.models import (Count, DateField, DateTimeField, F,
+                              ForeignKey,
+                              BooleanField, Case,
+                              CharField, ManyToManyField, Max, Model,
+                              PositiveIntegerField,
+                              PositiveSmallIntegerField,
+                              Q, QuerySet, SET_NULL, Sum, Value, When,
                               Manager)
+from django.db import (connections, router, transaction)
+from django.db.models.functions import (Coalesce, ExtractMonth,
+                                        ExtractYear)
 from django.utils import (six, timezone)
 from django.utils.functional import lazy
 from django.utils.safestring import mark_safe
 from django.utils.translation import ugettext_lazy as _
 
+from tracker.fields import AmountField
+from tracker.utils import (add_months, chunks, unique)
+
 mark_safe_lazy = lazy(mark_safe, six.text_type)
 
 
-class User(AbstractUser):
+class UserQuerySet(QuerySet):
+    """Query set of users refreshing statistics on deletion."""
+
+    def delete(self):
+        """Delete the users and refresh the statistics once.
+
+        Those are the statistics of the purses and tags of the
+        expenditures deleted by cascade.
+        """
+        with transaction.atomic(using=self.db):
+            expenditures = Expenditure.objects.filter(
+                author__in=self.order_by().values('pk'))
+            keys = expenditures.get_stat_keys()
+            res = super(UserQuerySet, self).delete()
+            refresh_stats(*keys)
+        return res
+
+
+class UserManager(auth_models.UserManager.from_queryset(UserQuerySet)):
+    """Manager of users whose query sets are ``UserQuerySet``."""
+    pass
+
+
+class User(auth_models.AbstractUser):
     """Extend the ``User`` class with a ``Purse`` field."""
     default_purse = ForeignKey('Purse', verbose_name=_('default purse'),
                                null=True, default=None,
                                on_delete=SET_NULL)
 
+    objects = UserManager()
+
+    def delete(self, *args, **kwargs):
+        """Delete the user and refresh the statistics once.
+
+        Those are the statistics of the purses and tags of the
+        expenditures deleted by cascade.
+        """
+        with transaction.atomic():
+            keys = Expenditure.objects.filter(author=self).get_stat_keys()
+            res = super(User, self).delete(*args, **kwargs)
+            refresh_stats(*keys)
+        return res
+
+
+class PurseManager(Manager):
+    """Custom manager for purses.
+
+    Deleted purses are excluded (see ``Purse.mark_deleted``). Queries
+    filtering on lists of values are split in batches of at most
+    ``batch_size`` values.
+    """
+    batch_size = 500
+
+    def get_queryset(self):
+        qs = super(PurseManager, self).get_queryset()
+        return qs.filter(deleted__isnull=True)
+
+    def for_user(self, user, members=True):
+        """Return the purses of ``user`` with their number of users.
+
+        The number of users is annotated as ``member_count``, unless
+        ``members`` is false. The purses and their counts are fetched
+        by a single query. Purses are filtered by a subquery so that
+        other aggregates may be annotated on the result.
+        """
+        Member = self.model.users.through
+        memberships = Member.objects.filter(user_id=user.pk)
+        qs = self.filter(pk__in=memberships.values('purse_id'))
+        if members:
+            qs = qs.annotate(member_count=Count('users'))
+        return qs
+
+    def touch(self, purse_ids):
+        """Record a change of the given purses.
+
+        Their version is incremented and their modification date set
+        to the current time.
+        """
+        modified = timezone.now()
+        for chunk in chunks(list(purse_ids), self.batch_size):
+            self.filter(pk__in=chunk).update(version=F('version') + 1,
+                                             modified=modified)
+
+
+class DeletedPurseManager(Manager):
+    """Manager handling deleted purses only."""
+    def get_queryset(self):
+        qs = super(DeletedPurseManager, self).get_queryset()
+        return qs.filter(deleted__isnull=False)
+
 
 class Purse(Model):
-    """Class representing purses."""
+    """Class representing purses.
+
+    Deleting a purse only records its deletion date: it is then
+    hidden, and its rows are purged later by the ``purgepurses``
+    command.
+    """
     name = CharField(_('purse name'), max_length=80)
     users = ManyToManyField(User, verbose_name=_('users'))
     description = CharField(_('description'), max_length=80, blank=True)
     created = DateTimeField(_('created'), auto_now_add=True)
+    version = PositiveIntegerField(_('version'), default=0, editable=False)
+    modified = DateTimeField(_('modified'), default=timezone.now,
+                             editable=False)
+    deleted = DateTimeField(_('deleted'), null=True, editable=False,
+                            db_index=True)
+
+    objects = PurseManager()
+    deleted_objects = DeletedPurseManager()
 
     def __str__(self):
         return u'{0}'.format(self.id)
 
+    def save(self, **kwargs):
+        """Record the change of the purse before saving it."""
+        if self.pk is not None:
+            self.version += 1
+            self.modified = timezone.now()
+        super(Purse, self).save(**kwargs)
+
+    def mark_deleted(self):
+        """Record the deletion of the purse.
+
+        It is no longer the default purse of its users.
+        """
+        with transaction.atomic():
+            self.deleted = timezone.now()
+            self.save()
+            User.objects.filter(default_purse=self).update(
+                default_purse=None)
+
     def usernames(self):
         """Return the comma separated list of usernames sorted."""
         names = [u.first_name or u.username for u in self.users.all()]
@@ -44,13 +171,72 @@ class Purse(Model):
         get_latest_by = 'created'
 
 
+def touch_members(sender, instance, action, reverse, pk_set, **kwargs):
+    """Record the change of purses whose users are added or removed.
+
+    It handles the ``m2m_changed`` signal of ``Purse.users``.
+    """
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        Purse.objects.touch([instance.pk])
+    elif action == 'pre_clear':
+        Purse.objects.touch(instance.purse_set.values_list('pk', flat=True))
+    else:
+        Purse.objects.touch(pk_set)
+
+
+class ExpenditureQuerySet(QuerySet):
+    """Query set of expenditures refreshing statistics on deletion."""
+
+    def get_stat_keys(self):
+        """Return the keys of the statistics of the expenditures.
+
+        Those are a dictionary mapping purse identifiers to sets of
+        ``(year, month)`` pairs, and the set of ``(tag_id, year)``
+        pairs of the tags of the expenditures.
+        """
+        months = defaultdict(set)
+        qs = self.order_by().annotate(year=ExtractYear('date'),
+                                      month=ExtractMonth('date'))
+        for purse_id, year, month in qs.values_list(
+                'purse_id', 'year', 'month').distinct():
+            months[purse_id].add((year, month))
+        links = Tag.expenditures.through.objects.filter(
+            expenditure__in=self.order_by().values('pk'))
+        tags = set(links.annotate(year=ExtractYear('expenditure__date'))
+                   .values_list('tag_id', 'year').distinct())
+        return months, tags
+
+    def delete(self):
+        """Delete the expenditures and refresh their statistics once."""
+        with transaction.atomic(using=self.db):
+            keys = self.get_stat_keys()
+            res = super(ExpenditureQuerySet, self).delete()
+            refresh_stats(*keys)
+        return res
+
+
+def refresh_stats(months, tags):
+    """Refresh statistics and record the change of their purses.
+
+    ``months`` maps purse identifiers to sets of ``(year, month)``
+    pairs, and ``tags`` is a set of ``(tag_id, year)`` pairs (see
+    ``ExpenditureQuerySet.get_stat_keys``).
+    """
+    TagStat.objects.refresh(set(t for t, y in tags), set(y for t, y in tags))
+    for purse_id, purse_months in months.items():
+        MonthStat.objects.refresh(purse_id, purse_months)
+    Purse.objects.touch(list(months))
+
+
 class Expenditure(Model):
     """Class representing expenditures.
 
     The attribute ``edit_delay`` controls the number of days from an
     expenditure creation to when it won't be editable anymore.
     """
-    amount = FloatField(_('amount'), db_index=True)
+    amount = AmountField(_('amount'), db_index=True)
     date = DateField(_('date'), default=timezone.now, db_index=True)
     description = CharField(_('description'), max_length=80, blank=False)
     author = ForeignKey(User, editable=False, verbose_name=_('author'))
@@ -58,6 +244,8 @@ class Expenditure(Model):
     generated = BooleanField(_('generated'), default=False, editable=False)
     created = DateTimeField(_('created'), auto_now_add=True)
 
+    objects = ExpenditureQuerySet.as_manager()
+
     edit_delay = 2
 
     def __str__(self):
@@ -67,15 +255,174 @@ class Expenditure(Model):
         """Check whether it is an editable expenditure or not."""
         return (timezone.now() - self.created).days <= self.edit_delay
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the date loaded from the database."""
+        instance = super(Expenditure, cls).from_db(db, field_names, values)
+        instance._loaded_date = instance.__dict__.get('date')
+        return instance
+
+    def get_dates(self):
+        """Return the dates affected by the last change of the instance.
+
+        It contains the current date and the date loaded from the
+        database, if any.
+        """
+        to_python = self._meta.get_field('date').to_python
+        dates = [self.date, getattr(self, '_loaded_date', None)]
+        return set(to_python(d) for d in dates if d is not None)
+
+    def get_years(self):
+        """Return the years affected by the last change of the instance."""
+        return set(d.year for d in self.get_dates())
+
+    def get_months(self):
+        """Return the months affected by the last change of the instance.
+
+        Months are represented by ``(year, month)`` pairs.
+        """
+        return set((d.year, d.month) for d in self.get_dates())
+
     def save(self, **kwargs):
-        """Update tags from the saved expenditure."""
-        super(Expenditure, self).save(**kwargs)
-        Tag.objects.update_from(self)
+        """Update tags and monthly statistics from the saved expenditure.
+
+        When the ``TRACKER_TAG_QUEUE`` setting is true, tags are not
+        updated: a tag job is recorded in the same transaction instead
+        (see ``TagJob``).
+        """
+        with transaction.atomic():
+            super(Expenditure, self).save(**kwargs)
+            if getattr(settings, 'TRACKER_TAG_QUEUE', False):
+                TagJob.objects.enqueue(self)
+            else:
+                Tag.objects.update_from(self)
+            MonthStat.objects.refresh(self.purse_id, self.get_months())
+            Purse.objects.touch([self.purse_id])
+        self._loaded_date = self.date
+
+    def delete(self, *args, **kwargs):
+        """Update statistics after the deletion."""
+        tag_ids = list(self.tag_set.values_list('pk', flat=True))
+        years, months = self.get_years(), self.get_months()
+        with transaction.atomic():
+            res = super(Expenditure, self).delete(*args, **kwargs)
+            TagStat.objects.refresh(tag_ids, years)
+            MonthStat.objects.refresh(self.purse_id, months)
+            Purse.objects.touch([self.purse_id])
+        return res
 
     class Meta(object):
         """Expenditure metadata."""
         ordering = ('-date', '-created', 'author')
         get_latest_by = 'date'
+        index_together = ('purse', 'date')
+
+
+class RecurrenceManager(Manager):
+    """Custom manager for recurrences."""
+
+    def get_occurrences(self, purse, first, last):
+        """Return the occurrences of a purse between two dates included.
+
+        Occurrences are unsaved generated expenditures, sorted by
+        date, whose authors are loaded.
+        """
+        qs = self.filter(purse=purse, start__lt=last, end__gte=first) \
+            .select_related('author')
+        occurrences = []
+        for recurrence in qs:
+            occurrences.extend(recurrence.get_occurrences(first, last))
+        occurrences.sort(key=lambda e: e.date)
+        return occurrences
+
+    def get_month_amounts(self, purse, first, last):
+        """Return the amounts of the occurrences between two dates.
+
+        The result maps ``(year, month)`` pairs to dictionaries
+        mapping author identifiers to ``[amount, count]`` lists.
+        """
+        amounts = defaultdict(dict)
+        for e in self.get_occurrences(purse, first, last):
+            values = amounts[(e.date.year, e.date.month)] \
+                .setdefault(e.author_id, [0, 0])
+            values[0] += e.amount
+            values[1] += 1
+        return amounts
+
+
+class Recurrence(Model):
+    """Class representing recurring expenditures.
+
+    A recurrence repeats an expenditure every month after its
+    ``start`` date, on the same day of the month or on the last day of
+    shorter months. It ends after ``count`` occurrences, or after the
+    date ``until``, whichever comes first. The date of the last
+    occurrence is stored as ``end``.
+
+    Occurrences aren't stored: they are expanded when listing or
+    summing the expenditures of a period.
+    """
+    amount = AmountField(_('amount'))
+    description = CharField(_('description'), max_length=80)
+    author = ForeignKey(User, verbose_name=_('author'))
+    purse = ForeignKey(Purse, verbose_name=_('purse'))
+    start = DateField(_('start'))
+    count = PositiveIntegerField(_('count'), null=True, blank=True)
+    until = DateField(_('until'), null=True, blank=True)
+    end = DateField(_('end'), editable=False)
+    created = DateTimeField(_('created'), auto_now_add=True)
+
+    objects = RecurrenceManager()
+
+    def __str__(self):
+        return u'{0}'.format(self.id)
+
+    def get_dates(self, first=None, last=None):
+        """Yield the occurrence dates, optionally between two dates."""
+        i = 1
+        while self.count is None or i <= self.count:
+            date = add_months(self.start, i)
+            if ((self.until is not None and date > self.until) or
+                    (last is not None and date > last)):
+                break
+            if first is None or date >= first:
+                yield date
+            i += 1
+
+    def get_occurrences(self, first=None, last=None):
+        """Return the occurrences as unsaved generated expenditures."""
+        return [Expenditure(amount=self.amount, date=date,
+                            description=self.description,
+                            author=self.author, purse_id=self.purse_id,
+                            generated=True, created=self.created)
+                for date in self.get_dates(first, last)]
+
+    def clean(self):
+        if self.count is None and self.until is None:
+            raise ValidationError(_('A recurrence requires a count of '
+                                    'occurrences or an end date.'))
+
+    def save(self, **kwargs):
+        """Compute the last occurrence date and record the purse change.
+
+        Recurrences without count nor end date have no last
+        occurrence, thus can't be saved (see ``clean``).
+        """
+        if self.count is not None or self.until is not None:
+            dates = list(self.get_dates())
+            self.end = dates[-1] if dates else self.start
+        super(Recurrence, self).save(**kwargs)
+        Purse.objects.touch([self.purse_id])
+
+    def delete(self, *args, **kwargs):
+        res = super(Recurrence, self).delete(*args, **kwargs)
+        Purse.objects.touch([self.purse_id])
+        return res
+
+    class Meta(object):
+        """Recurrence metadata."""
+        ordering = ('start', 'created')
+        index_together = ('purse', 'start', 'end')
 
 
 class TagManager(Manager):
@@ -83,8 +430,23 @@ class TagManager(Manager):
 
     Tags of length less than ``min_len`` are excluded. To allow tags
     of any length, set ``min_len`` to ``None``.
+
+    Queries filtering on lists of values are split in batches of at
+    most ``batch_size`` values.
+
+    Tags are unique by purse and name. Missing tags are inserted by
+    the statement of ``insert_templates`` matching the database
+    vendor, which ignores the rows conflicting with existing tags, so
+    that concurrent transactions neither fail nor create duplicates.
     """
     min_len = 2
+    batch_size = 500
+    insert_templates = {
+        'postgresql': ('INSERT INTO {table} ({columns}) VALUES {values} '
+                       'ON CONFLICT DO NOTHING'),
+        'sqlite': 'INSERT OR IGNORE INTO {table} ({columns}) VALUES {values}',
+        'mysql': 'INSERT IGNORE INTO {table} ({columns}) VALUES {values}',
+    }
 
     def get_tag_names(self, desc):
         """Split description and extract tag names."""
@@ -96,44 +458,130 @@ class TagManager(Manager):
 
         No treatment is done for generated expenditures.
         """
-        if not e.generated:
-            purse = e.purse
-            qs = purse.tag_set.all()
-            names = self.get_tag_names(e.description)
-            for n in names:
-                try:
-                    t = qs.get(name=n)
-                except Tag.DoesNotExist:
-                    t = Tag.objects.create(name=n, purse=purse)
-                    t.expenditures.add(e)
-                    if stats:
-                        stats[0] += 1
-                else:
-                    if e not in t.expenditures.all():
-                        t.expenditures.add(e)
-                        if stats:
-                            stats[1] += 1
-                        t.save()
-            for t in e.tag_set.all():
-                if t.name not in names:
-                    t.expenditures.remove(e)
-                    if stats:
-                        stats[1] += 1
+        return self.update_from_many([e], stats)
+
+    def update_from_many(self, expenditures, stats=None, years=()):
+        """Update tags after saving the given expenditures.
+
+        Tags and links between tags and expenditures are handled as
+        sets: existing tags are fetched with one query per purse,
+        missing tags are inserted by ``create_missing`` and links are
+        inserted or deleted in bulk through the intermediate table. Thus the
+        number of queries doesn't depend on the descriptions length.
+
+        No treatment is done for generated expenditures.
+
+        When ``stats`` is not ``None``, its first item is incremented
+        by the number of created tags and the second one by the
+        number of added or removed links to existing tags.
+
+        Statistics are refreshed for the years affected by the
+        expenditures changes and the additional ``years``.
+        """
+        expenditures = [e for e in expenditures if not e.generated]
+        if not expenditures:
+            return stats
+
+        names = {}
+        purse_names = defaultdict(list)
+        for e in expenditures:
+            names[e.pk] = self.get_tag_names(e.description)
+            purse_names[e.purse_id].extend(names[e.pk])
+
+        years = set(years)
+        for e in expenditures:
+            years |= e.get_years()
+
+        Link = self.model.expenditures.through
+        with transaction.atomic():
+            tag_ids, created = {}, set()
+            for purse_id, purse_tags in purse_names.items():
+                found = self._get_tag_ids(purse_id, purse_tags)
+                missing = unique(n for n in purse_tags if n not in found)
+                if missing:
+                    self.create_missing(purse_id, missing)
+                    new = self._get_tag_ids(purse_id, missing)
+                    created |= set(new.values())
+                    found.update(new)
+                tag_ids[purse_id] = found
+
+            wanted = set()
+            for e in expenditures:
+                found = tag_ids[e.purse_id]
+                wanted |= set((e.pk, found[n]) for n in names[e.pk])
 
+            existing = {}
+            pks = [e.pk for e in expenditures]
+            for chunk in chunks(pks, self.batch_size):
+                rows = Link.objects.filter(expenditure_id__in=chunk)
+                for pk, e_id, t_id in rows.values_list('pk',
+                                                       'expenditure_id',
+                                                       'tag_id'):
+                    existing[(e_id, t_id)] = pk
+
+            added = wanted - set(existing)
+            Link.objects.bulk_create([Link(expenditure_id=e_id, tag_id=t_id)
+                                      for e_id, t_id in added],
+                                     batch_size=self.batch_size)
+            removed = [pk for k, pk in existing.items() if k not in wanted]
+            for chunk in chunks(removed, self.batch_size):
+                Link.objects.filter(pk__in=chunk).delete()
+
+            affected = set(k[1] for k in wanted) | set(k[1] for k in existing)
+            TagStat.objects.refresh(affected, years)
+
+        if stats:
+            stats[0] += len(created)
+            stats[1] += len([k for k in added if k[1] not in created])
+            stats[1] += len(removed)
         return stats
 
-    def get_tags_for(self, purse, lookup_params=None):
-        """Return the the tags associated to ``purse``.
+    def create_missing(self, purse_id, names):
+        """Create the tags of a purse whose names don't exist yet.
+
+        Without insertion statement for the database vendor, tags are
+        created one by one by ``get_or_create``.
+        """
+        names = unique(names)
+        connection = connections[router.db_for_write(self.model)]
+        template = self.insert_templates.get(connection.vendor)
+        if template is None:
+            for name in names:
+                self.get_or_create(purse_id=purse_id, name=name)
+            return
+        fields = [self.model._meta.get_field(f) for f in ('name', 'purse')]
+        size = min(connection.ops.bulk_batch_size(fields, names),
+                   self.batch_size)
+        qn = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            for chunk in chunks(names, size):
+                sql = template.format(
+                    table=qn(self.model._meta.db_table),
+                    columns=', '.join(qn(f.column) for f in fields),
+                    values=', '.join(['(%s, %s)'] * len(chunk)))
+                cursor.execute(sql, [v for n in chunk for v in (n, purse_id)])
 
-        The default query set may be filtered using ``lookup_params``.
+    def _get_tag_ids(self, purse_id, names):
+        """Map the tag names of a purse to tag identifiers."""
+        found = {}
+        for chunk in chunks(unique(names), self.batch_size):
+            qs = self.filter(purse_id=purse_id, name__in=chunk)
+            found.update(qs.values_list('name', 'id'))
+        return found
+
+    def get_tags_for(self, purse, year=None):
+        """Return the the tags associated to ``purse``.
 
         The returned tags are extended with the associated
-        expenditures count and amount."""
+        expenditures count and amount, read from the tag
+        statistics. When ``year`` is given, only expenditures of that
+        year are taken into account and tags without expenditure that
+        year are excluded."""
         qs = purse.tag_set.all()
-        if lookup_params is not None:
-            qs = qs.filter(**lookup_params)
-        qs = qs.annotate(count=Count('expenditures'),
-                         amount=Sum('expenditures__amount'))
+        if year is not None:
+            qs = qs.filter(stats__year=year)
+        qs = qs.annotate(count=Coalesce(Sum('stats__count'), 0),
+                         amount=Sum('stats__amount'))
         return qs
 
 
@@ -148,3 +596,355 @@ class Tag(Model):
 
     def __str__(self):
         return u'{0}'.format(self.id)
+
+    class Meta(object):
+        """Tag metadata."""
+        unique_together = ('purse', 'name')
+
+
+class TagJobManager(Manager):
+    """Custom manager for tag jobs."""
+    batch_size = 500
+
+    def enqueue(self, e):
+        """Record that the tags of the expenditure ``e`` are outdated.
+
+        No job is recorded for generated expenditures.
+        """
+        if e.generated:
+            return None
+        return self.create(expenditure=e,
+                           date=getattr(e, '_loaded_date', None))
+
+    def process(self, batch_size=None, stats=None):
+        """Update the tags of the expenditures of the oldest jobs.
+
+        At most ``batch_size`` jobs are read, along with all the other
+        jobs of the same expenditures, so that repeated updates of an
+        expenditure are handled once. Tags are updated and jobs
+        deleted in one transaction: jobs of an interrupted batch are
+        processed again. The rows of the oldest jobs are locked on
+        databases supporting it, so that concurrent workers wait for
+        each other.
+
+        Return the number of processed jobs. ``stats`` is updated as
+        by ``TagManager.update_from_many``.
+        """
+        batch_size = batch_size or self.batch_size
+        with transaction.atomic():
+            ids = list(self.select_for_update().order_by('pk')
+                       .values_list('expenditure_id', flat=True)
+                       [:batch_size])
+            if not ids:
+                return 0
+            jobs, years = [], set()
+            for chunk in chunks(unique(ids), self.batch_size):
+                for pk, date in self.filter(expenditure_id__in=chunk) \
+                        .values_list('pk', 'date'):
+                    jobs.append(pk)
+                    if date is not None:
+                        years.add(date.year)
+            expenditures = []
+            for chunk in chunks(unique(ids), self.batch_size):
+                expenditures.extend(Expenditure.objects.filter(pk__in=chunk))
+            Tag.objects.update_from_many(expenditures, stats, years)
+            Purse.objects.touch(set(e.purse_id for e in expenditures))
+            for chunk in chunks(jobs, self.batch_size):
+                self.filter(pk__in=chunk).delete()
+        return len(jobs)
+
+
+class TagJob(Model):
+    """Class representing a pending update of an expenditure tags.
+
+    Jobs are recorded when saving expenditures if tags are maintained
+    asynchronously, and processed by the ``runtagworker`` command. The
+    date of the expenditure before its change is kept, so that the
+    statistics of its former year are refreshed too.
+    """
+    expenditure = ForeignKey(Expenditure, verbose_name=_('expenditure'))
+    date = DateField(_('date'), null=True)
+    created = DateTimeField(_('created'), auto_now_add=True)
+
+    objects = TagJobManager()
+
+    def __str__(self):
+        return u'{0}'.format(self.id)
+
+
+class StatManager(Manager):
+    """Base manager for statistics tables.
+
+    Statistics are maintained by recomputing the rows affected by a
+    change. Subclasses implement ``compute`` and list in
+    ``key_fields`` the fields identifying a row. Queries filtering on
+    lists of values are split in batches of at most ``batch_size``
+    values.
+    """
+    batch_size = 500
+    key_fields = ()
+    value_fields = ('count', 'amount')
+
+    def compute(self, purse=None):
+        """Aggregate the statistics from the expenditures.
+
+        Return a list of dictionaries whose keys are ``purse_id`` and
+        the names of the key and value fields. The aggregation may be
+        restricted to a purse.
+        """
+        raise NotImplementedError
+
+    def lock_purses(self, purse_ids):
+        """Lock the rows of the given purses until the end of the
+        transaction. ``purse_ids`` may be a list or a subquery.
+
+        Statistics are refreshed by deleting then inserting their
+        rows, so concurrent refreshes of a purse must wait for each
+        other: the second one would otherwise insert rows that the
+        first one inserted meanwhile. Rows are locked in a fixed order
+        to avoid deadlocks.
+        """
+        list(Purse._base_manager.select_for_update()
+             .filter(pk__in=purse_ids).order_by('pk')
+             .values_list('pk', flat=True))
+
+    def rebuild(self, purse=None):
+        """Recompute all the statistics, optionally those of a purse.
+
+        Return the number of statistics rows.
+        """
+        with transaction.atomic():
+            qs = self.all() if purse is None else self.filter(purse=purse)
+            qs.delete()
+            stats = [self.model(**d) for d in self.compute(purse=purse)]
+            self.bulk_create(stats, batch_size=self.batch_size)
+        return len(stats)
+
+    def check(self, purse=None):
+        """Compare the statistics with the expenditures.
+
+        Return the list of ``(key, stored, expected)`` tuples for rows
+        that differ, where ``key`` is the tuple of key field values
+        and ``stored`` and ``expected`` are ``(count, amount)`` pairs
+        or ``None`` for missing rows.
+        """
+        def index(rows):
+            return dict((tuple(d[f] for f in self.key_fields),
+                         tuple(d[f] for f in self.value_fields))
+                        for d in rows)
+
+        def same(a, b):
+            return (a is not None and b is not None and a[0] == b[0] and
+                    (a[1] or 0) == (b[1] or 0))
+
+        qs = self.all() if purse is None else self.filter(purse=purse)
+        stored = index(qs.values(*(self.key_fields + self.value_fields)))
+        expected = index(self.compute(purse=purse))
+        return [(k, stored.get(k), expected.get(k))
+                for k in sorted(set(stored) | set(expected))
+                if not same(stored.get(k), expected.get(k))]
+
+
+class TagStatManager(StatManager):
+    """Custom manager for tag statistics.
+
+    Rows are identified by tag and year.
+    """
+    key_fields = ('tag_id', 'year')
+
+    def compute(self, tag_ids=None, years=None, purse=None):
+        """Aggregate the tag statistics from the tagged expenditures.
+
+        The aggregation may be restricted to some tags, years or to a
+        purse.
+        """
+        qs = Tag.expenditures.through.objects.all()
+        if tag_ids is not None:
+            qs = qs.filter(tag_id__in=tag_ids)
+        if purse is not None:
+            qs = qs.filter(tag__purse=purse)
+        if years is not None:
+            q = Q(pk__in=[])
+            for year in years:
+                q |= Q(expenditure__date__gte=datetime.date(year, 1, 1),
+                       expenditure__date__lt=datetime.date(year + 1, 1, 1))
+            qs = qs.filter(q)
+        qs = qs.annotate(year=ExtractYear('expenditure__date'))
+        qs = qs.values('tag_id', 'year')
+        qs = qs.annotate(purse_id=Max('tag__purse_id'),
+                         count=Count('expenditure_id'),
+                         amount=Sum('expenditure__amount'))
+        return list(qs.order_by())
+
+    def refresh(self, tag_ids, years):
+        """Recompute the statistics of the given tags and years."""
+        tag_ids, years = list(tag_ids), list(years)
+        if not tag_ids or not years:
+            return
+        with transaction.atomic():
+            for chunk in chunks(tag_ids, self.batch_size):
+                self.lock_purses(Tag.objects.filter(pk__in=chunk)
+                                 .values('purse_id'))
+            for chunk in chunks(tag_ids, self.batch_size):
+                self.filter(tag_id__in=chunk, year__in=years).delete()
+                self.bulk_create([self.model(**d)
+                                  for d in self.compute(chunk, years)])
+
+
+class TagStat(Model):
+    """Class representing the statistics of a tag for a year.
+
+    Those are the count and amount of the tagged expenditures. They
+    are kept up to date on expenditure saving, deletion and tagging.
+    """
+    purse = ForeignKey(Purse, verbose_name=_('purse'))
+    tag = ForeignKey(Tag, verbose_name=_('tag'), related_name='stats')
+    year = PositiveSmallIntegerField(_('year'))
+    count = PositiveIntegerField(_('count'), default=0)
+    amount = AmountField(_('amount'), default=0)
+
+    objects = TagStatManager()
+
+    def __str__(self):
+        return u'{0}'.format(self.id)
+
+    class Meta(object):
+        """Tag statistics metadata."""
+        unique_together = ('tag', 'year')
+        index_together = ('purse', 'year')
+
+
+class MonthStatManager(StatManager):
+    """Custom manager for monthly statistics.
+
+    Rows are identified by purse, author, year and month.
+    """
+    key_fields = ('purse_id', 'author_id', 'year', 'month')
+
+    def compute(self, purse=None, months=None):
+        """Aggregate the monthly statistics from the expenditures.
+
+        The aggregation may be restricted to a purse and to some
+        months given as ``(year, month)`` pairs.
+        """
+        qs = Expenditure.objects.all()
+        if purse is not None:
+            qs = qs.filter(purse=purse)
+        if months is not None:
+            q = Q(pk__in=[])
+            for year, month in months:
+                start = datetime.date(year, month, 1)
+                end = (start.replace(month=month + 1) if month < 12
+                       else start.replace(year=year + 1, month=1))
+                q |= Q(date__gte=start, date__lt=end)
+            qs = qs.filter(q)
+        qs = qs.annotate(year=ExtractYear('date'), month=ExtractMonth('date'))
+        qs = qs.values('purse_id', 'author_id', 'year', 'month')
+        qs = qs.annotate(count=Count('id'), amount=Sum('amount'))
+        return list(qs.order_by())
+
+    def refresh(self, purse_id, months):
+        """Recompute the statistics of a purse for the given months."""
+        months = list(months)
+        if not months:
+            return
+        with transaction.atomic():
+            self.lock_purses([purse_id])
+            q = Q(pk__in=[])
+            for year, month in months:
+                q |= Q(year=year, month=month)
+            self.filter(q, purse_id=purse_id).delete()
+            self.bulk_create([self.model(**d)
+                              for d in self.compute(purse_id, months)])
+
+    def get_summary(self, purse, user, first_year, last_year=None):
+        """Return the monthly amounts of a purse over a span of years.
+
+        A dictionary is returned for each month with expenditures
+        between ``first_year`` and ``last_year`` included. Its keys
+        are ``month`` (first day of the month), ``amount`` (amount
+        authored by ``user``), ``average`` (total amount divided by
+        the number of purse users), ``delta`` (difference between
+        average and amount) and ``count`` (number of expenditures).
+        All months are computed by one grouped query, and the
+        occurrences of recurrences are added to them.
+        """
+        last_year = first_year if last_year is None else last_year
+        users = getattr(purse, 'member_count', None) or purse.users.count()
+        qs = self.filter(purse=purse, year__gte=first_year,
+                         year__lte=last_year)
+        user_amount = Case(When(author_id=user.pk, then='amount'),
+                           default=Value(0))
+        qs = qs.values('year', 'month').annotate(
+            user_amount=Sum(user_amount, output_field=AmountField()),
+            total_amount=Sum('amount'),
+            total_count=Sum('count'))
+        months = dict(((d['year'], d['month']),
+                       [d['user_amount'], d['total_amount'],
+                        d['total_count']])
+                      for d in qs)
+        recurring = Recurrence.objects.get_month_amounts(
+            purse, datetime.date(first_year, 1, 1),
+            datetime.date(last_year, 12, 31))
+        for key, authors in recurring.items():
+            totals = months.setdefault(key, [0, 0, 0])
+            for author_id, (amount, count) in authors.items():
+                if author_id == user.pk:
+                    totals[0] += amount
+                totals[1] += amount
+                totals[2] += count
+        values = []
+        for (year, month), (amount, total, count) in sorted(months.items()):
+            average = total / users
+            values.append({'month': datetime.date(year, month, 1),
+                           'amount': amount,
+                           'average': average,
+                           'delta': average - amount,
+                           'count': count})
+        return values
+
+    def get_totals(self, purse, user, year, month):
+        """Return the total amount of a month and the user part of it.
+
+        The occurrences of recurrences are included.
+        """
+        totals = {'total_amount': None, 'user_amount': None}
+        amounts = defaultdict(int)
+        qs = self.filter(purse=purse, year=year, month=month)
+        for author_id, amount in qs.values_list('author_id', 'amount'):
+            amounts[author_id] += amount
+        first = datetime.date(year, month, 1)
+        recurring = Recurrence.objects.get_month_amounts(
+            purse, first, add_months(first, 1) - datetime.timedelta(1))
+        for author_id, (amount, count) in recurring[(year, month)].items():
+            amounts[author_id] += amount
+        for author_id, amount in amounts.items():
+            totals['total_amount'] = (totals['total_amount'] or 0) + amount
+            if author_id == user.pk:
+                totals['user_amount'] = amount
+        return totals
+
+
+class MonthStat(Model):
+    """Class representing the expenditures of an author in a month.
+
+    Those are the count and amount of the expenditures of the
+    author. They are kept up to date on expenditure saving and
+    deletion.
+    """
+    purse = ForeignKey(Purse, verbose_name=_('purse'))
+    author = ForeignKey(User, verbose_name=_('author'))
+    year = PositiveSmallIntegerField(_('year'))
+    month = PositiveSmallIntegerField(_('month'))
+    count = PositiveIntegerField(_('count'), default=0)
+    amount = AmountField(_('amount'), default=0)
+
+    objects = MonthStatManager()
+
+    def __str__(self):
+        return u'{0}'.format(self.id)
+
+    class Meta(object):
+        """Monthly statistics metadata."""
+        unique_together = ('purse', 'year', 'month', 'author')
+        index_together = ('purse', 'year', 'month')
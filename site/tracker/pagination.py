@@ -0,0 +1,247 @@
+"""Keyset pagination.
+
+Pages are located from the values of the ordering fields of the
+first or last object of the adjacent page instead of an offset.
+Thus fetching a page doesn't depend on its rank, and the total
+number of objects is never counted.
+
+Unsaved objects, such as the occurrences of recurrences, may be
+merged into the pages according to the same ordering.
+
+"""
+
+from django.core import signing
+from django.db.models import Q
+from django.utils.encoding import force_text
+
+
+class InvalidCursor(Exception):
+    """Raised when a cursor token can't be decoded."""
+    pass
+
+
+class Descending(object):
+    """Wrapper reversing the comparisons of a value."""
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __ne__(self, other):
+        return self.value != other.value
+
+    def __lt__(self, other):
+        return self.value > other.value
+
+    def __gt__(self, other):
+        return self.value < other.value
+
+
+class Keyset(object):
+    """Total ordering of the objects of a model.
+
+    The ordering is read from the model metadata and extended with
+    the primary key to make it total. Unsaved objects are ordered as
+    if their primary key was 0, that is before the saved objects with
+    the same values of the other ordering fields.
+
+    """
+
+    def __init__(self, model):
+        opts = model._meta
+        ordering = list(opts.ordering)
+        if 'pk' not in ordering and opts.pk.name not in ordering:
+            ordering.append(opts.pk.name)
+        self.fields = [(opts.get_field(name.lstrip('-')),
+                        name.startswith('-'))
+                       for name in ordering]
+
+    def get_ordering(self, reverse=False):
+        """Return the ordering as a list of column names."""
+        return [('-' if desc != reverse else '') + f.attname
+                for f, desc in self.fields]
+
+    def get_key(self, obj):
+        """Return the ordering values of ``obj``."""
+        key = [getattr(obj, f.attname) for f, desc in self.fields]
+        return [0 if v is None and f.primary_key else v
+                for (f, desc), v in zip(self.fields, key)]
+
+    def sort_key(self, key, reverse=False):
+        """Return a value sorting keys in Python as in queries."""
+        return tuple(Descending(v) if desc != reverse else v
+                     for (f, desc), v in zip(self.fields, key))
+
+    def get_seek_filter(self, key, reverse=False):
+        """Return a filter selecting objects following ``key``.
+
+        When ``reverse`` is ``True``, the filter selects objects
+        preceding ``key``.
+        """
+        q = Q()
+        for i, (f, desc) in enumerate(self.fields):
+            lookup = 'lt' if desc != reverse else 'gt'
+            term = Q(**{'{0}__{1}'.format(f.attname, lookup): key[i]})
+            for g, value in zip(self.fields[:i], key[:i]):
+                term &= Q(**{g[0].attname: value})
+            q |= term
+        return q
+
+
+class CursorPaginator(Keyset):
+    """Paginator seeking pages from opaque cursor tokens.
+
+    Tokens are signed to prevent tampering. The unsaved objects of
+    ``extra`` are merged into the pages.
+
+    """
+    salt = 'tracker.pagination'
+
+    def __init__(self, object_list, per_page, extra=()):
+        super(CursorPaginator, self).__init__(object_list.model)
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.extra = list(extra)
+
+    def encode(self, direction, obj):
+        """Return the token of the page following or preceding ``obj``."""
+        values = [force_text(v) for v in self.get_key(obj)]
+        return signing.dumps([direction] + values, salt=self.salt,
+                             compress=True)
+
+    def decode(self, token):
+        """Return the direction and the key encoded in ``token``."""
+        try:
+            values = signing.loads(token, salt=self.salt)
+            direction, values = values[0], values[1:]
+            # Relations convert values like the fields they target
+            key = [(f.target_field if f.is_relation else f).to_python(v)
+                   for (f, desc), v in zip(self.fields, values)]
+        except Exception:
+            raise InvalidCursor(token)
+        if direction not in ('next', 'previous') or \
+           len(key) != len(self.fields):
+            raise InvalidCursor(token)
+        return direction, key
+
+    def page(self, token=None):
+        """Return the page located by ``token``.
+
+        The first page is returned when ``token`` is ``None``.
+        """
+        direction, key = (self.decode(token) if token else ('next', None))
+        reverse = direction == 'previous'
+        qs = self.object_list.order_by(*self.get_ordering(reverse))
+        if key is not None:
+            qs = qs.filter(self.get_seek_filter(key, reverse))
+        objects = list(qs[:self.per_page + 1])
+        if self.extra:
+            objects = self.merge(objects, key, reverse)
+        more = len(objects) > self.per_page
+        objects = objects[:self.per_page]
+        if reverse:
+            objects.reverse()
+            return CursorPage(objects, self, more, True)
+        return CursorPage(objects, self, key is not None, more)
+
+    def merge(self, objects, key, reverse):
+        """Merge the extra objects following ``key`` into ``objects``.
+
+        Only the first ``per_page + 1`` objects are returned, as
+        fetched from the database.
+        """
+        def sort_key(obj):
+            return self.sort_key(self.get_key(obj), reverse)
+        extra = self.extra
+        if key is not None:
+            start = self.sort_key(key, reverse)
+            extra = [o for o in extra if sort_key(o) > start]
+        return sorted(objects + extra, key=sort_key)[:self.per_page + 1]
+
+
+class CursorPage(object):
+    """A page of objects returned by a ``CursorPaginator``."""
+
+    def __init__(self, object_list, paginator, previous, next):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._previous = previous and len(object_list) > 0
+        self._next = next and len(object_list) > 0
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self._next
+
+    def has_previous(self):
+        return self._previous
+
+    def has_other_pages(self):
+        return self.has_previous() or self.has_next()
+
+    @property
+    def next_token(self):
+        """Token of the next page or ``None``."""
+        if not self.has_next():
+            return None
+        return self.paginator.encode('next', self.object_list[-1])
+
+    @property
+    def previous_token(self):
+        """Token of the previous page or ``None``."""
+        if not self.has_previous():
+            return None
+        return self.paginator.encode('previous', self.object_list[0])
+
+
+class MergedList(Keyset):
+    """Query set merged with a list of unsaved objects.
+
+    This sequence supports the counting and slicing done by Django's
+    ``Paginator``. The position of each unsaved object is found by
+    counting the saved objects preceding it, so that only the slices
+    of the query set are fetched.
+
+    """
+
+    def __init__(self, queryset, extra):
+        super(MergedList, self).__init__(queryset.model)
+        self.queryset = queryset.order_by(*self.get_ordering())
+        self.extra = sorted(extra,
+                            key=lambda o: self.sort_key(self.get_key(o)))
+        self._positions = None
+
+    @property
+    def positions(self):
+        """Positions of the unsaved objects in the merged list."""
+        if self._positions is None:
+            self._positions = [
+                self.queryset.filter(self.get_seek_filter(
+                    self.get_key(o), True)).count() + i
+                for i, o in enumerate(self.extra)]
+        return self._positions
+
+    def count(self):
+        return self.queryset.count() + len(self.extra)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start = index.start or 0
+        stop = self.count() if index.stop is None else index.stop
+        before = [sum(1 for p in self.positions if p < n)
+                  for n in (start, stop)]
+        objects = list(self.queryset[start - before[0]:stop - before[1]])
+        for p, o in zip(self.positions, self.extra):
+            if start <= p < stop:
+                objects.insert(p - start, o)
+        return objects
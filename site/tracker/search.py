@@ -0,0 +1,213 @@
+"""Search backends used to filter expenditures on their descriptions.
+
+A backend filters a query set on the text field of a model so that
+the field contains a keyword. The backend used is selected from the
+database vendor by ``get_backend``:
+
+- On PostgreSQL, a trigram GIN index is maintained on the upper-cased
+  text column, which is the expression used by Django for
+  case-insensitive ``contains`` lookups. A ``tsvector`` column would
+  match whole lexemes only, whereas users filter on any substring of
+  descriptions, so trigrams are used instead. The index requires the
+  ``pg_trgm`` extension: when the database role can't create it,
+  a warning is logged and filtering works without index until a
+  superuser runs ``CREATE EXTENSION pg_trgm`` and ``setup`` runs
+  again (for example by ``migrate``);
+
+- On SQLite, an FTS5 table using the trigram tokenizer shadows the
+  text column and is kept up to date by triggers;
+
+- Otherwise, plain ``contains`` lookups are used.
+
+Index structures are created by ``setup`` after migrations.
+
+"""
+
+import logging
+from decimal import (Decimal, InvalidOperation)
+
+from django.db import (DatabaseError, connections, transaction)
+from django.utils import formats
+
+from tracker.fields import MAX_AMOUNT
+
+logger = logging.getLogger(__name__)
+
+#: Text columns to index, as ``(table, column)`` pairs.
+INDEXED_COLUMNS = (('tracker_expenditure', 'description'),)
+
+
+class SearchBackend(object):
+    """Backend filtering with ``contains`` or ``icontains`` lookups."""
+
+    def setup(self, connection):
+        """Create the index structures."""
+        pass
+
+    def filter(self, qs, attr, keyword, ignore_case=True):
+        """Filter ``qs`` to objects whose ``attr`` contains ``keyword``."""
+        lookup = 'icontains' if ignore_case else 'contains'
+        return qs.filter(**{'{0}__{1}'.format(attr, lookup): keyword})
+
+    def get_column(self, qs, attr):
+        """Return the indexed ``(table, column)`` pair or ``None``."""
+        table = qs.model._meta.db_table
+        try:
+            column = qs.model._meta.get_field(attr).column
+        except Exception:
+            return None
+        return ((table, column) if (table, column) in INDEXED_COLUMNS
+                else None)
+
+
+class PostgresSearchBackend(SearchBackend):
+    """Backend relying on trigram indexes of PostgreSQL.
+
+    The ``pg_trgm`` extension makes ``LIKE`` patterns with leading
+    wildcards use an index, so filtering keeps the semantics of the
+    ``icontains`` lookup.
+    """
+    index_template = ('CREATE INDEX IF NOT EXISTS {table}_{column}_trgm '
+                      'ON {table} USING gin '
+                      '(UPPER({column}::text) gin_trgm_ops)')
+
+    def setup(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension "
+                           "WHERE extname = 'pg_trgm'")
+            if cursor.fetchone() is None:
+                try:
+                    with transaction.atomic(using=connection.alias):
+                        cursor.execute('CREATE EXTENSION pg_trgm')
+                except DatabaseError as e:
+                    logger.warning(
+                        'Search indexes not created, the pg_trgm extension '
+                        'is missing (%s). Run "CREATE EXTENSION pg_trgm" '
+                        'as a superuser in the database %s, then migrate '
+                        'again.', e, connection.settings_dict['NAME'])
+                    return
+            for table, column in INDEXED_COLUMNS:
+                cursor.execute(self.index_template.format(table=table,
+                                                          column=column))
+
+
+class SqliteSearchBackend(SearchBackend):
+    """Backend relying on FTS5 tables of SQLite.
+
+    The trigram tokenizer matches any substring of at least
+    ``min_length`` characters, ignoring case. Shorter keywords, case
+    sensitive filters and databases where the FTS5 table is missing
+    fall back to ``contains`` lookups.
+    """
+    min_length = 3
+    create_template = ("CREATE VIRTUAL TABLE {fts} USING fts5({column}, "
+                       "content='{table}', content_rowid='id', "
+                       "tokenize='trigram')")
+    trigger_templates = (
+        "CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} "
+        "BEGIN INSERT INTO {fts}(rowid, {column}) "
+        "VALUES (new.id, new.{column}); END",
+        "CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} "
+        "BEGIN INSERT INTO {fts}({fts}, rowid, {column}) "
+        "VALUES ('delete', old.id, old.{column}); END",
+        "CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {column} "
+        "ON {table} "
+        "BEGIN INSERT INTO {fts}({fts}, rowid, {column}) "
+        "VALUES ('delete', old.id, old.{column}); "
+        "INSERT INTO {fts}(rowid, {column}) "
+        "VALUES (new.id, new.{column}); END")
+
+    def __init__(self):
+        self.tables = {}
+
+    def get_fts_table(self, table, column):
+        return '{0}_{1}_fts'.format(table, column)
+
+    def setup(self, connection):
+        existing = connection.introspection.table_names()
+        with connection.cursor() as cursor:
+            for table, column in INDEXED_COLUMNS:
+                fts = self.get_fts_table(table, column)
+                names = {'fts': fts, 'table': table, 'column': column}
+                if fts not in existing:
+                    try:
+                        cursor.execute(self.create_template.format(**names))
+                    except Exception:
+                        # FTS5 or its trigram tokenizer is unavailable
+                        continue
+                    cursor.execute("INSERT INTO {fts}({fts}) "
+                                   "VALUES ('rebuild')".format(**names))
+                for template in self.trigger_templates:
+                    cursor.execute(template.format(**names))
+        self.tables.pop(connection.alias, None)
+
+    def has_fts_table(self, connection, fts):
+        """Check whether the FTS table exists, caching the result."""
+        if connection.alias not in self.tables:
+            names = connection.introspection.table_names()
+            self.tables[connection.alias] = set(n for n in names
+                                                if n.endswith('_fts'))
+        return fts in self.tables[connection.alias]
+
+    def filter(self, qs, attr, keyword, ignore_case=True):
+        target = self.get_column(qs, attr)
+        if target is None or not ignore_case or \
+           len(keyword) < self.min_length:
+            return super(SqliteSearchBackend, self).filter(qs, attr, keyword,
+                                                           ignore_case)
+        table, column = target
+        fts = self.get_fts_table(table, column)
+        if not self.has_fts_table(connections[qs.db], fts):
+            return super(SqliteSearchBackend, self).filter(qs, attr, keyword,
+                                                           ignore_case)
+        where = ('"{table}"."id" IN (SELECT rowid FROM {fts} '
+                 'WHERE {fts} MATCH %s)').format(table=table, fts=fts)
+        phrase = '"{0}"'.format(keyword.replace('"', '""'))
+        return qs.extra(where=[where], params=[phrase])
+
+
+BACKENDS = {'postgresql': PostgresSearchBackend(),
+            'sqlite': SqliteSearchBackend()}
+
+DEFAULT_BACKEND = SearchBackend()
+
+
+def get_backend(connection):
+    """Return the search backend suited to ``connection``."""
+    return BACKENDS.get(connection.vendor, DEFAULT_BACKEND)
+
+
+def setup(sender=None, using='default', **kwargs):
+    """Create the index structures of the database ``using``.
+
+    It is connected to the ``post_migrate`` signal.
+    """
+    connection = connections[using]
+    get_backend(connection).setup(connection)
+
+
+def filter_by_keywords(qs, keywords, attr='description', num_attr='amount',
+                       ignore_case=True):
+    """Filter ``qs`` so that objects match all the ``keywords``.
+
+    A keyword convertible to a decimal number that an amount can hold
+    matches objects whose ``num_attr`` field is equal to it, unless
+    ``num_attr`` is ``None``. Other keywords match objects whose ``attr`` field
+    contains them, using the search backend of the query set database.
+    """
+    backend = get_backend(connections[qs.db])
+    for f in keywords:
+        n = None
+        if num_attr is not None:
+            try:
+                n = Decimal(formats.sanitize_separators(f))
+            except InvalidOperation:
+                pass
+            else:
+                if n.is_finite() and abs(n) <= MAX_AMOUNT:
+                    qs = qs.filter(**{'{0}__exact'.format(num_attr): n})
+                else:
+                    n = None
+        if n is None:
+            qs = backend.filter(qs, attr, f, ignore_case)
+    return qs
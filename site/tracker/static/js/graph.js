@@ -136,9 +136,9 @@ function buildTagCloud(baseUrl, year) {
     var graph, countCloudBuilder, amountCloudBuilder,
         countExtent, amountExtent;
     
-    function getUrl(ordering) {
-        return baseUrl + '?limit=' +
-            wordsLimit + '&ordering=' + ordering + '&year=' + year;
+    function getUrl() {
+        return baseUrl + '?limit=' + wordsLimit +
+            '&ordering=-count&ordering=-amount&year=' + year;
     }
 
     graph = d3.select("#tags-container").append("svg")
@@ -191,9 +191,10 @@ function buildTagCloud(baseUrl, year) {
     }
     
     $.ajax({
-        url: getUrl('-count'),
+        url: getUrl(),
         cache: false
-    }).done(function(words) {
+    }).done(function(rankings) {
+        var words = rankings['-count'];
         if (words.length >= tagsThreshold) {
             countExtent = d3.extent(words, function(d) {
                 return d.count;
@@ -206,19 +207,13 @@ function buildTagCloud(baseUrl, year) {
 
             $('#amount-sort-btn').click(function () {
                 if (amountCloudBuilder === undefined) {
-                    $.ajax({
-                        url: getUrl('-amount'),
-                        cache: false
-                    }).done(function(words) {
-                        amountExtent = d3.extent(words, function(d) {
-                            return d.amount;
-                        });
-                        amountCloudBuilder = drawTemplate(words, amountSizeFunction);
-                        amountCloudBuilder();
+                    words = rankings['-amount'];
+                    amountExtent = d3.extent(words, function(d) {
+                        return d.amount;
                     });
-                } else {
-                    amountCloudBuilder();
+                    amountCloudBuilder = drawTemplate(words, amountSizeFunction);
                 }
+                amountCloudBuilder();
             });
             $('#count-sort-btn').click(function () {
                 countCloudBuilder();
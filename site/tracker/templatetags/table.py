@@ -11,13 +11,23 @@ register = template.Library()
 def do_header(context, field_names):
     """Include a template for a table header build from the given fields.
 
-    The columns order is the same as the one in field_names.
+    The columns order is the same as the one in field_names. The model
+    is read from the object list, or from the view when the object
+    list is a plain list (as for cursor pagination). Columns which
+    aren't model fields, such as annotations, are given as ``(name,
+    verbose_name)`` pairs.
 
     """
     datas = []
-    model = context['object_list'].model
+    try:
+        model = context['object_list'].model
+    except AttributeError:
+        model = context['view'].model
     fields = dict([(f.name, f) for f in model._meta.fields])
     for name in field_names:
+        if isinstance(name, tuple):
+            datas.append({'name': name[0], 'verbose_name': name[1]})
+            continue
         field = None
         try:
             field = fields[name]
@@ -4,8 +4,13 @@ import datetime
 from django import template
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
+from django.utils.html import escape
 from django.utils.http import urlencode
 from django.utils.safestring import mark_safe
+from django.utils.translation import get_language
+
+from tracker.cache import get_or_set
+from tracker.pagination import CursorPage
 
 register = template.Library()
 
@@ -34,10 +39,13 @@ def do_current_date():
     return datetime.date.today()
 
 
-def add_page_query(url, page=1, paginator=None, filt=None):
-    """Add page query to the given url."""
+def add_page_query(url, page=1, paginator=None, filt=None, cursor=None):
+    """Add page query to the given url.
+
+    When ``cursor`` is not ``None``, it replaces the page number.
+    """
     template = '{0}?{1}'
-    query = {'page': page}
+    query = {'cursor': cursor} if cursor is not None else {'page': page}
     if paginator is not None:
         query['paginate_by'] = paginator.per_page
     if filt is not None:
@@ -61,6 +69,8 @@ def do_pagination(context):
         filt = context.get('filter', None)
         if is_paginated is False:
             return ''
+        if isinstance(page, CursorPage):
+            return build_cursor_pagination(url, page, filt)
         anchor = u"""<a href="{url}">{number}</a>"""
 
         def build_element(i, cls=None):
@@ -95,6 +105,23 @@ def do_pagination(context):
         return mark_safe(' '.join(elements))
 
 
+def build_cursor_pagination(url, page, filt=None):
+    """Build the previous and next anchors of a cursor page."""
+    elements = ['<ul class="pagination">']
+    for token, label in [(page.previous_token, u'&laquo;'),
+                         (page.next_token, u'&raquo;')]:
+        if token is None:
+            elt = u"""<li class="disabled"><span>{0}</span></li>"""
+            elements.append(elt.format(label))
+        else:
+            lnk = add_page_query(url, paginator=page.paginator, filt=filt,
+                                 cursor=token)
+            elt = u"""<li><a href="{url}">{label}</a></li>"""
+            elements.append(elt.format(url=escape(lnk), label=label))
+    elements.append('</ul>')
+    return mark_safe(' '.join(elements))
+
+
 @register.simple_tag(takes_context=True)
 def email_admin(context):
     """Insert an anchor to mail to the first site admin."""
@@ -104,3 +131,48 @@ def email_admin(context):
         raise ImproperlyConfigured('The email_admin tag expects a non-empty '
                                    'ADMINS setting')
     return mark_safe('<a href="mailto:{0}">{1}</a>'.format(email, name))
+
+
+class PurseCacheNode(template.Node):
+    """Node rendering its content from the purse cache."""
+    def __init__(self, nodelist, purse, name, vary_on):
+        self.nodelist = nodelist
+        self.purse = purse
+        self.name = name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        purse = self.purse.resolve(context)
+        parts = [v.resolve(context) for v in self.vary_on]
+        parts.extend([get_language(), datetime.date.today()])
+        timeout = getattr(settings, 'TRACKER_CACHE_FRAGMENT_TIMEOUT', 300)
+        return mark_safe(get_or_set(purse, self.name.resolve(context),
+                                    parts,
+                                    lambda: self.nodelist.render(context),
+                                    timeout))
+
+
+@register.tag(name='purse_cache')
+def do_purse_cache(parser, token):
+    """Cache the rendering of a template fragment of a purse.
+
+    Usage::
+
+        {% purse_cache purse 'name' var1 var2 ... %}
+        ...
+        {% endpurse_cache %}
+
+    The fragment is cached until the purse changes, for at most
+    ``TRACKER_CACHE_FRAGMENT_TIMEOUT`` seconds (default to 5 minutes).
+    The rendering also depends on the values of the given variables,
+    on the active language and on the current date.
+    """
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(
+            "'{0}' tag requires at least 2 arguments".format(bits[0]))
+    nodelist = parser.parse(('endpurse_cache',))
+    parser.delete_first_token()
+    return PurseCacheNode(nodelist, parser.compile_filter(bits[1]),
+                          parser.compile_filter(bits[2]),
+                          [parser.compile_filter(b) for b in bits[3:]])
@@ -0,0 +1,79 @@
+"""Tests for the cache of tracker application."""
+
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.test import (TestCase, override_settings)
+from django.utils.six import StringIO
+from tracker import cache
+from tracker.models import (Expenditure, Purse, User)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests',
+    }
+}
+
+
+@override_settings(CACHES=CACHES, TRACKER_CACHE_STATS=True)
+class CacheTest(TestCase):
+    """Test cached reports."""
+    def setUp(self):
+        caches['default'].clear()
+        self.credentials = {'username': 'username',
+                            'password': 'password'}
+        self.user = User.objects.create_user(**self.credentials)
+        self.purse = Purse.objects.create(name='test')
+        self.purse.users.add(self.user)
+        Expenditure.objects.create(amount=10, date='2014-12-2',
+                                   description='desc', author=self.user,
+                                   purse=self.purse)
+
+    def tearDown(self):
+        caches['default'].clear()
+
+    def test_get_or_set(self):
+        """Entries are computed once per purse version."""
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return len(calls)
+
+        purse = Purse.objects.get(pk=self.purse.pk)
+        self.assertEqual(cache.get_or_set(purse, 'name', (1,), compute), 1)
+        self.assertEqual(cache.get_or_set(purse, 'name', (1,), compute), 1)
+        self.assertEqual(cache.get_or_set(purse, 'name', (2,), compute), 2)
+        Purse.objects.touch([purse.pk])
+        purse = Purse.objects.get(pk=self.purse.pk)
+        self.assertEqual(cache.get_or_set(purse, 'name', (1,), compute), 3)
+        self.assertEqual(cache.get_stats(), {'hits': 1, 'misses': 3})
+        out = StringIO()
+        call_command('cachestats', reset=True, stdout=out)
+        self.assertIn('Hits: 1, misses: 3', out.getvalue())
+        self.assertEqual(cache.get_stats(), {'hits': 0, 'misses': 0})
+
+    @override_settings(TRACKER_CACHE_STATS=False)
+    def test_stats_disabled(self):
+        """Hits and misses aren't counted by default."""
+        purse = Purse.objects.get(pk=self.purse.pk)
+        cache.get_or_set(purse, 'name', (1,), lambda: 1)
+        cache.get_or_set(purse, 'name', (1,), lambda: 1)
+        self.assertEqual(cache.get_stats(), {'hits': 0, 'misses': 0})
+
+    def test_views(self):
+        """Reports are read from the cache until the purse changes."""
+        self.client.login(**self.credentials)
+        url = reverse('tracker:summary', kwargs={'year': 2014})
+        self.client.get(url)
+        cache.reset_stats()
+        response = self.client.get(url)
+        self.assertEqual(response.context['totals']['amount'], 10)
+        self.assertEqual(cache.get_stats(), {'hits': 2, 'misses': 0})
+        Expenditure.objects.create(amount=5, date='2014-12-3',
+                                   description='desc', author=self.user,
+                                   purse=self.purse)
+        response = self.client.get(url)
+        self.assertEqual(response.context['totals']['amount'], 15)
+        self.assertEqual(cache.get_stats(), {'hits': 2, 'misses': 2})
@@ -0,0 +1,441 @@
+"""Tests for management commands of tracker application."""
+
+import json
+import os
+import tempfile
+from datetime import date
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import (IntegrityError, connection, transaction)
+from django.db.models import (Count, FloatField)
+from django.test import (TestCase, override_settings)
+from django.utils.six import StringIO
+from django.utils.timezone import now
+from tracker.models import (Expenditure, MonthStat, Purse, Recurrence,
+                            Tag, TagJob, TagStat)
+from users.models import Registration
+
+User = get_user_model()
+
+
+class CreateTagsTest(TestCase):
+    """Test tags creation command."""
+    def setUp(self):
+        u = User.objects.create(username='test',
+                                password='password',
+                                is_active=False)
+        self.p = Purse.objects.create(name='test')
+        self.p.users.add(u)
+        self.q = Purse.objects.create(name='other')
+        self.q.users.add(u)
+        for p in [self.p, self.q]:
+            for d in ['one two', 'two three', 'four']:
+                Expenditure.objects.create(amount=100, date=now(),
+                                           description=d, author=u,
+                                           purse=p)
+        Tag.objects.all().delete()
+
+    def test_rebuild(self):
+        """Test tags are rebuilt by chunks."""
+        out = StringIO()
+        call_command('createtags', chunk_size=1, stdout=out)
+        self.assertIn('Tags created: 8, updated: 2', out.getvalue())
+        self.assertEqual(self.p.tag_set.count(), 4)
+        self.assertEqual(self.q.tag_set.count(), 4)
+
+    def test_resume(self):
+        """Test a run is resumed from a checkpoint."""
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        with open(path, 'w') as f:
+            json.dump({str(self.p.pk): None}, f)
+        call_command('createtags', checkpoint=path, stdout=StringIO())
+        self.assertEqual(self.p.tag_set.count(), 0)
+        self.assertEqual(self.q.tag_set.count(), 4)
+        self.assertFalse(os.path.exists(path))
+
+
+class ExportExpendituresTest(TestCase):
+    """Test expenditures export command."""
+    def setUp(self):
+        u = User.objects.create(username='test', password='password')
+        self.p = Purse.objects.create(name='test')
+        self.p.users.add(u)
+        for d in ['one two', 'two three', 'four']:
+            Expenditure.objects.create(amount=100, date=now(),
+                                       description=d, author=u,
+                                       purse=self.p)
+
+    def test_export(self):
+        """Test filtered expenditures are exported by chunks."""
+        out = StringIO()
+        call_command('exportexpenditures', self.p.pk, format='ndjson',
+                     filter='two', chunk_size=1, stdout=out)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([r['description'] for r in rows],
+                         ['one two', 'two three'])
+
+    def test_round_trip(self):
+        """Test exported amounts are imported back exactly."""
+        amount = Decimal('90071992547409.93')
+        self.p.expenditure_set.update(amount=amount)
+        fd, path = tempfile.mkstemp(suffix='.ndjson')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                call_command('exportexpenditures', self.p.pk,
+                             format='ndjson', stdout=f)
+            q = Purse.objects.create(name='copy')
+            q.users.add(User.objects.get())
+            call_command('importexpenditures', q.pk, path,
+                         stdout=StringIO(), stderr=StringIO())
+        finally:
+            os.remove(path)
+        self.assertEqual(list(q.expenditure_set.values_list('amount',
+                                                            flat=True)),
+                         [amount] * 3)
+
+
+class ImportExpendituresTest(TestCase):
+    """Test expenditures import command."""
+    def setUp(self):
+        u = User.objects.create(username='test', password='password')
+        self.p = Purse.objects.create(name='test')
+        self.p.users.add(u)
+        fd, self.path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(fd, 'w') as f:
+            f.write('date,amount,description,author\n'
+                    '2015-01-02,10,bread jam,test\n'
+                    '2015-01-32,10,bread,test\n'
+                    '2015-02-01,5,bread,\n'
+                    '2015-02-01,5,bread,unknown\n'
+                    '2015-02-03,x,,test\n')
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_import(self):
+        """Test valid rows are imported, tagged and counted."""
+        out, err = StringIO(), StringIO()
+        call_command('importexpenditures', self.p.pk, self.path,
+                     author='test', batch_size=1, stdout=out, stderr=err)
+        self.assertIn('Imported: 2, rejected: 3, tags created: 2',
+                      out.getvalue())
+        self.assertEqual([line.split(':')[0]
+                          for line in err.getvalue().splitlines()],
+                         ['Line 3', 'Line 5', 'Line 6'])
+        self.assertEqual(self.p.expenditure_set.count(), 2)
+        tags = Tag.objects.get_tags_for(self.p, 2015)
+        self.assertEqual(sorted((t.name, t.count) for t in tags),
+                         [('bread', 2), ('jam', 1)])
+        stats = MonthStat.objects.filter(purse=self.p)
+        self.assertEqual(sorted(stats.values_list('month', 'amount')),
+                         [(1, 10), (2, 5)])
+
+
+class BenchmarkTest(TestCase):
+    """Test benchmark dataset generation and views benchmark."""
+    def test_seed(self):
+        """Test the dataset is generated with tags and statistics."""
+        call_command('seedbenchmark', users=3, purses=2, members=2,
+                     years=1, per_month=2, batch_size=5, stdout=StringIO())
+        purse = Purse.objects.get(name='bench 0')
+        self.assertEqual(purse.users.count(), 2)
+        self.assertEqual(purse.expenditure_set.count(), 24)
+        self.assertEqual(MonthStat.objects.check(purse), [])
+        e = purse.expenditure_set.first()
+        self.assertEqual(sorted(t.name for t in e.tag_set.all()),
+                         sorted(set(e.description.split())))
+
+    def test_run(self):
+        """Test views are timed and the report is saved."""
+        call_command('seedbenchmark', users=2, purses=1, members=2,
+                     years=1, per_month=1, stdout=StringIO())
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            call_command('runbenchmark', repeat=2, warmup=0,
+                         host='testserver', output=path, stdout=StringIO())
+            with open(path) as f:
+                report = json.load(f)
+        finally:
+            os.remove(path)
+        results = dict((r['name'], r) for r in report['results'])
+        self.assertEqual(results['archive']['status'], 200)
+        self.assertEqual(results['export']['status'], 200)
+        self.assertNotIn('logout', results)
+        self.assertGreater(results['archive']['queries'], 0)
+
+
+class ConvertRecurrencesTest(TestCase):
+    """Test recurrences conversion command."""
+    def setUp(self):
+        self.u = User.objects.create(username='test', password='password')
+        self.p = Purse.objects.create(name='test')
+        self.p.users.add(self.u)
+        values = {'amount': 10, 'description': 'rent', 'author': self.u,
+                  'purse': self.p}
+        Expenditure.objects.create(date='2015-01-31', **values)
+        for d in ['2015-02-28', '2015-03-31', '2015-04-30']:
+            Expenditure.objects.create(date=d, generated=True, **values)
+        Expenditure.objects.create(date='2015-06-15', generated=True,
+                                   amount=20, description='rent',
+                                   author=self.u, purse=self.p)
+
+    def test_convert(self):
+        """Test generated series are replaced by recurrences."""
+        out = StringIO()
+        call_command('convertrecurrences', dry_run=True, stdout=out)
+        self.assertIn('Series: 2, generated expenditures: 4',
+                      out.getvalue())
+        self.assertEqual(Recurrence.objects.count(), 0)
+        call_command('convertrecurrences', stdout=StringIO())
+        self.assertEqual(self.p.expenditure_set.count(), 1)
+        r = Recurrence.objects.get(amount=10)
+        self.assertEqual((r.start.isoformat(), r.count),
+                         ('2015-01-31', 3))
+        r = Recurrence.objects.get(amount=20)
+        self.assertEqual((r.start.isoformat(), r.count),
+                         ('2015-05-15', 1))
+        self.assertEqual(MonthStat.objects.check(self.p), [])
+
+
+class ConvertAmountsTest(TestCase):
+    """Test amounts conversion command."""
+    def setUp(self):
+        u = User.objects.create(username='test', password='password')
+        p = Purse.objects.create(name='test')
+        field = MonthStat._meta.get_field('amount')
+        self.old_field = FloatField('amount', default=0)
+        self.old_field.set_attributes_from_name('amount')
+        self.old_field.model = MonthStat
+        with connection.schema_editor() as editor:
+            editor.alter_field(MonthStat, field, self.old_field)
+        with connection.cursor() as cursor:
+            cursor.execute('INSERT INTO tracker_monthstat (purse_id, '
+                           'author_id, year, month, count, amount) '
+                           'VALUES (%s, %s, 2015, 1, 3, %s)',
+                           [p.pk, u.pk, 0.1 + 0.2])
+
+    def test_convert(self):
+        """Test float columns are converted to cents."""
+        out = StringIO()
+        call_command('convertamounts', dry_run=True, stdout=out)
+        self.assertIn('tracker_monthstat.amount: to convert',
+                      out.getvalue())
+        self.assertIn('tracker_expenditure.amount: already converted',
+                      out.getvalue())
+        out = StringIO()
+        call_command('convertamounts', stdout=out)
+        self.assertIn('tracker_monthstat.amount: converted',
+                      out.getvalue())
+        self.assertEqual(MonthStat.objects.get().amount, Decimal('0.30'))
+        out = StringIO()
+        call_command('convertamounts', stdout=out)
+        self.assertNotIn(': converted', out.getvalue())
+
+
+class DeduplicateTagsTest(TestCase):
+    """Test tags deduplication command."""
+    def setUp(self):
+        with connection.schema_editor() as editor:
+            editor.alter_unique_together(Tag, Tag._meta.unique_together,
+                                         [])
+        u = User.objects.create(username='test', password='password')
+        self.p = Purse.objects.create(name='test')
+        self.p.users.add(u)
+        es = [Expenditure.objects.create(amount=10, date='2015-01-02',
+                                         description=d, author=u,
+                                         purse=self.p)
+              for d in ['one two', 'two', 'three']]
+        duplicate = Tag.objects.create(name='two', purse=self.p)
+        duplicate.expenditures.add(es[0], es[2])
+        Tag.objects.create(name='one', purse=self.p)
+
+    def test_deduplicate(self):
+        """Test duplicate tags are merged."""
+        out = StringIO()
+        call_command('deduplicatetags', dry_run=True, stdout=out)
+        self.assertIn('(dry run) Duplicate tags merged: 2, links moved: 0',
+                      out.getvalue())
+        self.assertEqual(self.p.tag_set.count(), 5)
+        out = StringIO()
+        call_command('deduplicatetags', stdout=out)
+        self.assertIn('Duplicate tags merged: 2, links moved: 1',
+                      out.getvalue())
+        self.assertIn('Unique constraint created', out.getvalue())
+        tags = self.p.tag_set.annotate(n=Count('expenditures'))
+        self.assertEqual(sorted(tags.values_list('name', 'n')),
+                         [('one', 1), ('three', 1), ('two', 3)])
+        self.assertEqual(TagStat.objects.check(self.p), [])
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                Tag.objects.create(name='one', purse=self.p)
+
+
+@override_settings(TRACKER_TAG_QUEUE=True)
+class TagWorkerTest(TestCase):
+    """Test tag jobs processing commands."""
+    def setUp(self):
+        u = User.objects.create(username='test', password='password')
+        self.p = Purse.objects.create(name='test')
+        self.p.users.add(u)
+        e = Expenditure.objects.create(amount=10, date='2014-12-02',
+                                       description='one two', author=u,
+                                       purse=self.p)
+        e.date = now().replace(year=2015)
+        e.description = 'two'
+        e.save()
+        Expenditure.objects.create(amount=5, date='2015-01-03',
+                                   description='three', author=u,
+                                   purse=self.p)
+
+    def test_worker(self):
+        """Test jobs are merged and processed."""
+        self.assertEqual(self.p.tag_set.count(), 0)
+        out = StringIO()
+        call_command('tagqueue', stdout=out)
+        self.assertIn('Pending jobs: 3, expenditures: 2', out.getvalue())
+        self.assertIn('Purse {0}: 3 jobs'.format(self.p.pk),
+                      out.getvalue())
+        out = StringIO()
+        call_command('runtagworker', once=True, batch_size=1, stdout=out)
+        self.assertIn('3 jobs processed', out.getvalue())
+        self.assertIn('Tags created: 2, updated: 0', out.getvalue())
+        self.assertEqual(TagJob.objects.count(), 0)
+        self.assertEqual(sorted(self.p.tag_set.values_list('name',
+                                                           flat=True)),
+                         ['three', 'two'])
+        self.assertEqual(TagStat.objects.check(self.p), [])
+
+
+class PurgePursesTest(TestCase):
+    """Test deleted purses purge command."""
+    def setUp(self):
+        u = User.objects.create(username='test', password='password')
+        self.p = Purse.objects.create(name='deleted')
+        self.q = Purse.objects.create(name='kept')
+        for p in [self.p, self.q]:
+            p.users.add(u)
+            for d in ['one two', 'two', 'three']:
+                Expenditure.objects.create(amount=10, date='2015-01-02',
+                                           description=d, author=u,
+                                           purse=p)
+            Recurrence.objects.create(amount=5, description='rent',
+                                      author=u, purse=p,
+                                      start=date(2015, 1, 5), count=2)
+        u.default_purse = self.p
+        u.save()
+        self.p.mark_deleted()
+
+    def test_purge(self):
+        """Test the rows of deleted purses are deleted by chunks."""
+        self.assertEqual(User.objects.get().default_purse, None)
+        out = StringIO()
+        call_command('purgepurses', dry_run=True, stdout=out)
+        # 4 links, 3 tag and 1 month statistics, 1 recurrence, 3 tags,
+        # 3 expenditures, 1 membership and the purse
+        self.assertIn('(dry run) Purse {0}: 17 rows to delete'.format(
+            self.p.pk), out.getvalue())
+        out = StringIO()
+        call_command('purgepurses', budget=0, stdout=out)
+        self.assertIn('Time budget exhausted', out.getvalue())
+        self.assertEqual(Purse.deleted_objects.count(), 1)
+        out = StringIO()
+        call_command('purgepurses', batch_size=2, stdout=out)
+        self.assertIn('Purse {0} purged: 17 rows deleted'.format(self.p.pk),
+                      out.getvalue())
+        self.assertIn('Purses purged: 1', out.getvalue())
+        self.assertEqual(Purse.deleted_objects.count(), 0)
+        self.assertEqual(Expenditure.objects.count(), 3)
+        self.assertEqual(Tag.objects.count(), 3)
+        self.assertEqual(Tag.expenditures.through.objects.count(), 4)
+        self.assertEqual(Recurrence.objects.count(), 1)
+        self.assertEqual(TagStat.objects.check(), [])
+        self.assertEqual(MonthStat.objects.check(), [])
+
+
+class UpgradeSchemaTest(TestCase):
+    """Test schema upgrade command."""
+    def setUp(self):
+        self.p = Purse.objects.create(name='test')
+
+    def remove_field(self, model, name):
+        """Drop the column of a field from the test database."""
+        with connection.schema_editor() as editor:
+            editor.remove_field(model, model._meta.get_field(name))
+
+    def test_upgrade(self):
+        """Test missing columns are added and filled."""
+        self.remove_field(Purse, 'modified')
+        out = StringIO()
+        call_command('upgradeschema', dry_run=True, stdout=out)
+        self.assertIn('tracker_purse.version: already present',
+                      out.getvalue())
+        self.assertIn('tracker_purse.modified: to add', out.getvalue())
+        out = StringIO()
+        call_command('upgradeschema', stdout=out)
+        self.assertIn('tracker_purse.modified: added', out.getvalue())
+        self.assertGreaterEqual(Purse.objects.get().modified, self.p.created)
+        out = StringIO()
+        call_command('upgradeschema', stdout=out)
+        self.assertNotIn(': added', out.getvalue())
+
+    def test_version(self):
+        """Test versions of existing purses start at 0."""
+        self.remove_field(Purse, 'version')
+        call_command('upgradeschema', stdout=StringIO())
+        self.assertEqual(Purse.objects.get().version, 0)
+        Purse.objects.touch([self.p.pk])
+        self.assertEqual(Purse.objects.get().version, 1)
+
+    def test_deleted(self):
+        """Test existing purses aren't deleted."""
+        self.remove_field(Purse, 'deleted')
+        out = StringIO()
+        call_command('upgradeschema', stdout=out)
+        self.assertIn('tracker_purse.deleted: added', out.getvalue())
+        self.assertEqual(list(Purse.objects.all()), [self.p])
+        self.p.mark_deleted()
+        self.assertEqual(Purse.deleted_objects.get(), self.p)
+
+    def test_index(self):
+        """Test missing indexes are created."""
+        with connection.schema_editor() as editor:
+            editor.alter_index_together(Expenditure,
+                                        Expenditure._meta.index_together, [])
+        out = StringIO()
+        call_command('upgradeschema', dry_run=True, stdout=out)
+        self.assertIn('tracker_expenditure(purse_id, date) index: to create',
+                      out.getvalue())
+        out = StringIO()
+        call_command('upgradeschema', stdout=out)
+        self.assertIn('tracker_expenditure(purse_id, date) index: created',
+                      out.getvalue())
+        out = StringIO()
+        call_command('upgradeschema', stdout=out)
+        self.assertIn('tracker_expenditure(purse_id, date) index: '
+                      'already present', out.getvalue())
+
+    def test_field_index(self):
+        """Test missing indexes of fields are created."""
+        u = User.objects.create(username='test', password='password')
+        Registration.objects.create_registration(u)
+        field = Registration._meta.get_field('key')
+        path, args, kwargs = field.deconstruct()[1:]
+        kwargs['db_index'] = False
+        old_field = field.__class__(*args, **kwargs)
+        old_field.set_attributes_from_name('key')
+        old_field.model = Registration
+        with connection.schema_editor() as editor:
+            editor.alter_field(Registration, field, old_field)
+        out = StringIO()
+        call_command('upgradeschema', stdout=out)
+        self.assertIn('users_registration(key) index: created',
+                      out.getvalue())
+        self.assertIn('users_registration(created) index: already present',
+                      out.getvalue())
+        self.assertEqual(Registration.objects.count(), 1)
+        out = StringIO()
+        call_command('upgradeschema', stdout=out)
+        self.assertNotIn(': created', out.getvalue())
@@ -22,6 +22,16 @@ class ExpenditureFormTest(TestCase):
         self.assertFalse(form.is_valid())
         self.assertTrue('amount' in form.errors)
 
+    def test_amount_too_large(self):
+        """Check that amounts must fit in the database column."""
+        for amount in ('100000000000000000000', '99999999999999999.99'):
+            data = {'amount': amount,
+                    'date': '2014-05-01',
+                    'description': 'Test'}
+            form = ExpenditureForm(data)
+            self.assertFalse(form.is_valid())
+            self.assertTrue('amount' in form.errors)
+
     def test_empty_description(self):
         """Check that a form with an description made of whitespace characters
         is not valid.
@@ -1,11 +1,16 @@
 """Tests for models of tracker application."""
 
-from datetime import timedelta
+from datetime import (date, timedelta)
+from decimal import Decimal
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import connection
 from django.db.models import Count
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils.timezone import now
-from tracker.models import (Expenditure, Purse, Tag)
+from tracker.models import (Expenditure, MonthStat, Purse, Recurrence, Tag,
+                            TagStat)
 
 User = get_user_model()
 
@@ -30,6 +35,26 @@ class PurseTest(TestCase):
         self.assertIn('first', names)
         self.assertIn('second', names)
 
+    def test_version(self):
+        """Test the version is incremented on purse changes."""
+        u = User.objects.create(username='first', password='password')
+        p = Purse.objects.create(name='test')
+
+        def version():
+            return Purse.objects.get(pk=p.pk).version
+
+        self.assertEqual(version(), 0)
+        p.users.add(u)
+        self.assertEqual(version(), 1)
+        e = Expenditure.objects.create(amount=1, date=now(),
+                                       description='one', author=u,
+                                       purse=p)
+        self.assertEqual(version(), 2)
+        e.delete()
+        self.assertEqual(version(), 3)
+        u.purse_set.clear()
+        self.assertEqual(version(), 4)
+
 
 class ExpenditureTest(TestCase):
     """Test expenditures."""
@@ -109,3 +134,255 @@ class TagManagerTest(TestCase):
         e.save()
         qs = p.tag_set.order_by('id')
         self.assertEqual(qs.count(), 3)
+
+    def test_update_from_query_count(self):
+        """Test that tag update query count doesn't depend on descriptions."""
+        u = User.objects.create(username='test',
+                                password='password',
+                                is_active=False)
+        p = Purse.objects.create(name='test')
+        p.users.add(u)
+        short = Expenditure(amount=100, date=now(), description='one',
+                            author=u, purse=p)
+        short.save()
+        words = ' '.join('word{0}'.format(i) for i in range(50))
+        e = Expenditure(amount=100, date=now(), description='one',
+                        author=u, purse=p)
+        e.save()
+        e.description = 'two'
+        with self.assertNumQueries(14):
+            Tag.objects.update_from(e)
+        e.description = words + ' one'
+        with self.assertNumQueries(14):
+            Tag.objects.update_from(e)
+        self.assertEqual(e.tag_set.count(), 51)
+        self.assertEqual(short.tag_set.count(), 1)
+
+    def test_update_from_many(self):
+        """Test tag update of several expenditures."""
+        u = User.objects.create(username='test',
+                                password='password',
+                                is_active=False)
+        p = Purse.objects.create(name='test')
+        p.users.add(u)
+        es = [Expenditure.objects.create(amount=100, date=now(),
+                                         description=d, author=u, purse=p)
+              for d in ['one two', 'two three', 'four']]
+        es[0].description = 'one'
+        stats = Tag.objects.update_from_many(es, [0, 0])
+        self.assertEqual(stats, [0, 1])
+        qs = p.tag_set.order_by('id')
+        qs = qs.annotate(weight=Count('expenditures'))
+        tags = [d for d in qs.values('name', 'weight')]
+        expecting = [{'name': u'one', 'weight': 1},
+                     {'name': u'two', 'weight': 1},
+                     {'name': u'three', 'weight': 1},
+                     {'name': u'four', 'weight': 1}]
+        self.assertEqual(tags, expecting)
+
+    def test_create_missing(self):
+        """Test tags creation ignores existing tags."""
+        p = Purse.objects.create(name='test')
+        Tag.objects.create(name='one', purse=p)
+        Tag.objects.create_missing(p.pk, ['one', 'two', 'two', 'three'])
+        Tag.objects.create_missing(p.pk, ['three', 'four'])
+        self.assertEqual(sorted(p.tag_set.values_list('name', flat=True)),
+                         ['four', 'one', 'three', 'two'])
+
+
+class TagStatTest(TestCase):
+    """Test tag statistics."""
+    def setUp(self):
+        self.u = User.objects.create(username='test',
+                                     password='password',
+                                     is_active=False)
+        self.p = Purse.objects.create(name='test')
+        self.p.users.add(self.u)
+
+    def get_stats(self):
+        qs = TagStat.objects.order_by('tag__name', 'year')
+        return [(s.tag.name, s.year, s.count, s.amount) for s in qs]
+
+    def test_maintained(self):
+        """Test statistics follow expenditures changes."""
+        e = Expenditure.objects.create(amount=10, date='2014-12-2',
+                                       description='one two',
+                                       author=self.u, purse=self.p)
+        Expenditure.objects.create(amount=5, date='2014-1-2',
+                                   description='two',
+                                   author=self.u, purse=self.p)
+        self.assertEqual(self.get_stats(), [('one', 2014, 1, 10),
+                                            ('two', 2014, 2, 15)])
+        e = Expenditure.objects.get(pk=e.pk)
+        e.date = now().replace(year=2015)
+        e.amount = 20
+        e.description = 'one'
+        e.save()
+        self.assertEqual(self.get_stats(), [('one', 2015, 1, 20),
+                                            ('two', 2014, 1, 5)])
+        e.delete()
+        self.assertEqual(self.get_stats(), [('two', 2014, 1, 5)])
+        self.assertEqual(TagStat.objects.check(), [])
+
+    def test_cascade(self):
+        """Test statistics follow deletions by cascade and query sets."""
+        other = User.objects.create(username='other', password='password')
+        self.p.users.add(other)
+        Expenditure.objects.create(amount=10, date='2014-12-2',
+                                   description='one two',
+                                   author=self.u, purse=self.p)
+        Expenditure.objects.create(amount=5, date='2014-1-2',
+                                   description='two',
+                                   author=other, purse=self.p)
+        other.delete()
+        self.assertEqual(self.get_stats(), [('one', 2014, 1, 10),
+                                            ('two', 2014, 1, 10)])
+        self.assertEqual(MonthStat.objects.check(self.p), [])
+        Expenditure.objects.filter(purse=self.p).delete()
+        self.assertEqual(self.get_stats(), [])
+        self.assertEqual(MonthStat.objects.check(self.p), [])
+
+    def test_delete_queries(self):
+        """Test deletions refresh statistics once, whatever their size."""
+        counts = []
+        for size in (2, 6):
+            user = User.objects.create(username='user{0}'.format(size),
+                                       password='password')
+            self.p.users.add(user)
+            for i in range(size):
+                Expenditure.objects.create(amount=10, description='one two',
+                                           date=date(2014, 12, i + 1),
+                                           author=user, purse=self.p)
+            with CaptureQueriesContext(connection) as queries:
+                User.objects.filter(pk=user.pk).delete()
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_rebuild(self):
+        """Test statistics rebuild."""
+        Expenditure.objects.create(amount=10, date='2014-12-2',
+                                   description='one two',
+                                   author=self.u, purse=self.p)
+        TagStat.objects.all().delete()
+        self.assertEqual(len(TagStat.objects.check()), 2)
+        self.assertEqual(TagStat.objects.rebuild(), 2)
+        self.assertEqual(TagStat.objects.check(), [])
+        tags = Tag.objects.get_tags_for(self.p, 2014).order_by('name')
+        self.assertEqual(list(tags.values('name', 'count', 'amount')),
+                         [{'name': 'one', 'count': 1, 'amount': 10},
+                          {'name': 'two', 'count': 1, 'amount': 10}])
+        self.assertEqual(Tag.objects.get_tags_for(self.p, 2015).count(), 0)
+
+
+class MonthStatTest(TestCase):
+    """Test monthly statistics."""
+    def setUp(self):
+        self.u = User.objects.create(username='test',
+                                     password='password',
+                                     is_active=False)
+        self.p = Purse.objects.create(name='test')
+        self.p.users.add(self.u)
+
+    def get_stats(self):
+        qs = MonthStat.objects.order_by('year', 'month')
+        return [(s.year, s.month, s.count, s.amount) for s in qs]
+
+    def test_maintained(self):
+        """Test statistics follow expenditures changes."""
+        e = Expenditure.objects.create(amount=10, date='2014-12-2',
+                                       description='one',
+                                       author=self.u, purse=self.p)
+        Expenditure.objects.create(amount=5, date='2014-12-31',
+                                   description='two',
+                                   author=self.u, purse=self.p)
+        self.assertEqual(self.get_stats(), [(2014, 12, 2, 15)])
+        e = Expenditure.objects.get(pk=e.pk)
+        e.date = now().replace(year=2015, month=1, day=1)
+        e.save()
+        self.assertEqual(self.get_stats(), [(2014, 12, 1, 5),
+                                            (2015, 1, 1, 10)])
+        e.delete()
+        self.assertEqual(self.get_stats(), [(2014, 12, 1, 5)])
+        self.assertEqual(MonthStat.objects.check(), [])
+
+    def test_rebuild(self):
+        """Test statistics rebuild."""
+        Expenditure.objects.create(amount=10, date='2014-12-2',
+                                   description='one',
+                                   author=self.u, purse=self.p)
+        MonthStat.objects.all().delete()
+        self.assertEqual(len(MonthStat.objects.check()), 1)
+        self.assertEqual(MonthStat.objects.rebuild(), 1)
+        self.assertEqual(MonthStat.objects.check(), [])
+
+    def test_exact(self):
+        """Test amounts are stored and summed as exact decimals."""
+        for amount in [0.1, '0.2', Decimal('0.005')]:
+            Expenditure.objects.create(amount=amount, date='2014-12-2',
+                                       description='one',
+                                       author=self.u, purse=self.p)
+        self.assertEqual(self.get_stats(),
+                         [(2014, 12, 3, Decimal('0.31'))])
+        self.assertEqual(Expenditure.objects.filter(amount=0.2).count(), 1)
+        self.assertEqual(MonthStat.objects.get_totals(self.p, self.u,
+                                                      2014, 12),
+                         {'total_amount': Decimal('0.31'),
+                          'user_amount': Decimal('0.31')})
+
+    def test_from_db_value(self):
+        """Test loaded sums and averages keep every cent."""
+        field = MonthStat._meta.get_field('amount')
+        for value, expected in [(2 ** 60 + 1, '11529215046068469.77'),
+                                (Decimal('1152921504606846977'),
+                                 '11529215046068469.77'),
+                                (1234.5, '12.35')]:
+            self.assertEqual(field.from_db_value(value, None, None, None),
+                             Decimal(expected))
+
+
+class RecurrenceTest(TestCase):
+    """Test recurrences."""
+    def setUp(self):
+        self.u = User.objects.create(username='test', password='password')
+        self.p = Purse.objects.create(name='test')
+        self.p.users.add(self.u)
+
+    def test_clean(self):
+        """Recurrences require a count or an end date."""
+        r = Recurrence(amount=10, description='rent', author=self.u,
+                       purse=self.p, start=date(2015, 12, 31))
+        with self.assertRaises(ValidationError):
+            r.full_clean()
+        r.count = 3
+        r.full_clean()
+
+    def test_dates(self):
+        """Test occurrences fall back to the end of shorter months."""
+        r = Recurrence.objects.create(amount=10, description='rent',
+                                      author=self.u, purse=self.p,
+                                      start=date(2015, 12, 31), count=3)
+        self.assertEqual([d.isoformat() for d in r.get_dates()],
+                         ['2016-01-31', '2016-02-29', '2016-03-31'])
+        self.assertEqual(r.end, date(2016, 3, 31))
+        r.until = date(2016, 2, 29)
+        r.save()
+        self.assertEqual(r.end, date(2016, 2, 29))
+        self.assertEqual(len(Recurrence.objects.get_occurrences(
+            self.p, date(2016, 2, 1), date(2016, 12, 31))), 1)
+
+    def test_amounts(self):
+        """Test occurrences are included in monthly amounts."""
+        Expenditure.objects.create(amount=10, date='2016-01-02',
+                                   description='one',
+                                   author=self.u, purse=self.p)
+        Recurrence.objects.create(amount=5, description='rent',
+                                  author=self.u, purse=self.p,
+                                  start=date(2015, 12, 5),
+                                  until=date(2016, 2, 10))
+        summary = MonthStat.objects.get_summary(self.p, self.u, 2016)
+        self.assertEqual([(d['month'].month, d['amount'], d['count'])
+                          for d in summary],
+                         [(1, 15, 2), (2, 5, 1)])
+        self.assertEqual(MonthStat.objects.get_totals(self.p, self.u,
+                                                      2016, 2),
+                         {'total_amount': 5, 'user_amount': 5})
@@ -0,0 +1,82 @@
+"""Tests for keyset pagination."""
+
+import datetime
+
+from django.core.paginator import Paginator
+from django.test import TestCase
+from tracker.models import (Expenditure, Purse, Recurrence, User)
+from tracker.pagination import (CursorPaginator, MergedList)
+
+
+class MergedPaginationTest(TestCase):
+    """Test pagination of expenditures merged with occurrences."""
+
+    def setUp(self):
+        u = User.objects.create_user(username='username',
+                                     password='password')
+        self.purse = Purse.objects.create(name='test')
+        for day in (1, 3, 5, 7):
+            Expenditure.objects.create(amount=day, description='desc',
+                                       date=datetime.date(2014, 12, day),
+                                       author=u, purse=self.purse)
+        Recurrence.objects.create(amount=4, description='rent', author=u,
+                                  purse=self.purse, count=1,
+                                  start=datetime.date(2014, 11, 4))
+        Recurrence.objects.create(amount=8, description='rent', author=u,
+                                  purse=self.purse, count=1,
+                                  start=datetime.date(2014, 11, 8))
+        self.qs = Expenditure.objects.filter(purse=self.purse)
+        self.extra = Recurrence.objects.get_occurrences(
+            self.purse, datetime.date(2014, 12, 1),
+            datetime.date(2014, 12, 31))
+
+    def test_numbered(self):
+        """Pages of numbered paginators follow the ordering."""
+        paginator = Paginator(MergedList(self.qs, self.extra), 2)
+        self.assertEqual(paginator.count, 6)
+        self.assertEqual([[e.amount for e in paginator.page(n)]
+                          for n in paginator.page_range],
+                         [[8, 7], [5, 4], [3, 1]])
+
+    def test_cursor(self):
+        """Pages of cursor paginators follow the ordering."""
+        paginator = CursorPaginator(self.qs, 2, self.extra)
+        page, pages = paginator.page(), []
+        while True:
+            pages.append([e.amount for e in page])
+            if not page.has_next():
+                break
+            page = paginator.page(page.next_token)
+        self.assertEqual(pages, [[8, 7], [5, 4], [3, 1]])
+        page = paginator.page(page.previous_token)
+        self.assertEqual([e.amount for e in page], [5, 4])
+
+    def test_cursor_ties(self):
+        """Pages of cursor paginators follow ties on date and creation."""
+        other = User.objects.create_user(username='other',
+                                         password='password')
+        created = Expenditure.objects.get(amount=5).created
+        for author in (User.objects.get(username='username'), other):
+            Expenditure.objects.create(amount=10 + author.pk,
+                                       description='desc',
+                                       date=datetime.date(2014, 12, 5),
+                                       author=author, purse=self.purse)
+            Recurrence.objects.create(amount=20 + author.pk,
+                                      description='rent', author=author,
+                                      purse=self.purse, count=1,
+                                      start=datetime.date(2014, 11, 5))
+        Expenditure.objects.filter(date=datetime.date(2014, 12, 5)) \
+            .update(created=created)
+        Recurrence.objects.update(created=created)
+        extra = Recurrence.objects.get_occurrences(
+            self.purse, datetime.date(2014, 12, 5),
+            datetime.date(2014, 12, 5))
+        qs = self.qs.filter(date=datetime.date(2014, 12, 5))
+        paginator = CursorPaginator(qs, 1, extra)
+        page, amounts = paginator.page(), []
+        while True:
+            amounts.extend(e.amount for e in page)
+            if not page.has_next():
+                break
+            page = paginator.page(page.next_token)
+        self.assertEqual(amounts, [21, 5, 11, 22, 12])
@@ -0,0 +1,51 @@
+"""Tests for search backends of tracker application."""
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.utils.timezone import now
+from tracker.models import (Expenditure, Purse)
+from tracker.search import (SqliteSearchBackend, get_backend)
+
+User = get_user_model()
+
+
+class SearchBackendTest(TestCase):
+    """Test the search backend of the test database."""
+    def setUp(self):
+        u = User.objects.create(username='test',
+                                password='password',
+                                is_active=False)
+        p = Purse.objects.create(name='test')
+        self.e = Expenditure.objects.create(amount=10, date=now(),
+                                            description='Firstdesc unique',
+                                            author=u, purse=p)
+        Expenditure.objects.create(amount=10, date=now(),
+                                   description='otherdesc',
+                                   author=u, purse=p)
+        self.backend = get_backend(connection)
+
+    def search(self, keyword):
+        qs = self.backend.filter(Expenditure.objects.all(), 'description',
+                                 keyword)
+        return list(qs.order_by('pk').values_list('description', flat=True))
+
+    def test_filter(self):
+        """Test filtering on substrings."""
+        self.assertIsInstance(self.backend, SqliteSearchBackend)
+        self.assertTrue(self.backend.has_fts_table(
+            connection, 'tracker_expenditure_description_fts'))
+        self.assertEqual(self.search('DESC'), ['Firstdesc unique',
+                                               'otherdesc'])
+        self.assertEqual(self.search('niq'), ['Firstdesc unique'])
+        self.assertEqual(self.search('c u'), ['Firstdesc unique'])
+        self.assertEqual(self.search('"'), [])
+
+    def test_update(self):
+        """Test the index follows description changes."""
+        self.e.description = 'changed'
+        self.e.save()
+        self.assertEqual(self.search('unique'), [])
+        self.assertEqual(self.search('hanged'), ['changed'])
+        self.e.delete()
+        self.assertEqual(self.search('hanged'), [])
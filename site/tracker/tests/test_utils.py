@@ -21,6 +21,7 @@ class DictFetchAllTest(TestCase):
         dct = dictfetchall(cursor)
         self.assertEqual(len(dct), 3)
         self.assertEqual(dct[0].keys(),
-                         ['description', 'created', 'id', 'name'])
+                         ['description', 'created', 'deleted', 'modified',
+                          'version', 'id', 'name'])
         self.assertEqual(dct[0]['description'], 'desc1')
         self.assertEqual(dct[2]['name'], 'test3')
@@ -1,9 +1,15 @@
 """Tests for views of tracker application."""
 
+import datetime
+import json
 from django.contrib.auth import get_user_model
 from django.core.urlresolvers import reverse
-from django.test import TestCase
-from tracker.models import (Expenditure, Purse)
+from django.db import connection
+from django.test import (RequestFactory, TestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
+from tracker.context_processors import get_user_purses
+from tracker.models import (Expenditure, MonthStat, Purse, Recurrence)
+from users.models import OutboxEmail
 
 User = get_user_model()
 
@@ -129,6 +135,7 @@ class ExpenditureAddTest(TestCase):
         self.assertEqual(response.url, url)
         self.assertEqual(u.expenditure_set.count(), 1)
 
+    @override_settings(TRACKER_LAZY_RECURRENCES=True)
     def test_post_with_multiple_occurence(self):
         """Get page then post to create multiple expenditures."""
         credentials = {'username': 'username',
@@ -150,7 +157,36 @@ class ExpenditureAddTest(TestCase):
         self.assertEqual(response.status_code, 302)
         url = '/tracker/expenditures/'
         self.assertEqual(response.url, url)
-        self.assertEqual(u.expenditure_set.count(), 3)
+        self.assertEqual(u.expenditure_set.count(), 1)
+        r = Recurrence.objects.get()
+        self.assertEqual((r.start.isoformat(), r.count, r.end.isoformat()),
+                         ('2014-05-24', 2, '2014-07-24'))
+
+    def test_post_with_materialized_occurences(self):
+        """Post to create multiple expenditures without recurrence."""
+        credentials = {'username': 'username',
+                       'password': 'password'}
+        u = create_user(**credentials)
+        self.client.login(**credentials)
+        p = create_purse(u)
+        u.default_purse = p
+        u.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        token = response.cookies['csrftoken'].value
+        data = {'amount': 100,
+                'date': '24/05/2014',
+                'description': 'expenditure description',
+                'occurrences': '24',
+                'csrftoken': token}
+        response = self.client.post(self.url, data)
+        self.assertEqual(response.status_code, 302)
+        url = '/tracker/expenditures/'
+        self.assertEqual(response.url, url)
+        self.assertEqual(u.expenditure_set.count(), 24)
+        self.assertEqual(u.expenditure_set.filter(generated=True)
+                         .latest().date, datetime.date(2016, 4, 24))
+        self.assertEqual(MonthStat.objects.check(p), [])
 
 
 class ExpenditureDeleteTest(TestCase):
@@ -442,6 +478,21 @@ class ExpenditureFilteredListTest(TestCase):
         self.assertContains(response, 'Lastdesc')
         # REMARK Note that descriptions are capitalized
 
+    def test_get_huge_num_keyword(self):
+        """Get page for numeric keywords too large for an amount."""
+        self.client.login(**self.credentials)
+        u = User.objects.get(username='username')
+        p = create_purse(u)
+        create_expenditure(**{'amount': 100,
+                              'date': '2014-12-2',
+                              'description': 'otherdesc',
+                              'author': u,
+                              'purse': p})
+        for keyword in ('1e20', '1e30'):
+            response = self.client.get(self.url, {'filter': keyword})
+            self.assertEqual(response.status_code, 200)
+            self.assertNotContains(response, 'Otherdesc')
+
     def test_get_multiple_keywords(self):
         """Get page for multiple filter keywords."""
         self.client.login(**self.credentials)
@@ -468,6 +519,42 @@ class ExpenditureFilteredListTest(TestCase):
         self.assertNotContains(response, 'otherterm')
         self.assertNotContains(response, 'lastdesc')
 
+    def test_get_cursor_pages(self):
+        """Browse pages using cursor tokens."""
+        self.client.login(**self.credentials)
+        u = User.objects.get(username='username')
+        p = create_purse(u)
+        for i in range(5):
+            create_expenditure(**{'amount': 100 + i,
+                                  'date': '2014-12-{0}'.format(1 + i % 2),
+                                  'description': 'desc{0}'.format(i),
+                                  'author': u,
+                                  'purse': p})
+        expected = list(Expenditure.objects.values_list('pk', flat=True))
+        url = self.url + '?paginate_by=2'
+        response = self.client.get(url)
+        page = response.context['page_obj']
+        pks = [e.pk for e in page]
+        self.assertFalse(page.has_previous())
+        while page.has_next():
+            response = self.client.get(url + '&cursor=' + page.next_token)
+            page = response.context['page_obj']
+            pks += [e.pk for e in page]
+        self.assertEqual(pks, expected)
+        self.assertEqual(response.context['total_count'], 5)
+        response = self.client.get(url + '&cursor=' + page.previous_token)
+        page = response.context['page_obj']
+        self.assertEqual([e.pk for e in page], expected[2:4])
+        self.assertTrue(page.has_next())
+
+    def test_get_invalid_cursor(self):
+        """Get page for an invalid cursor."""
+        self.client.login(**self.credentials)
+        u = User.objects.get(username='username')
+        create_purse(u)
+        response = self.client.get(self.url + '?cursor=invalid')
+        self.assertEqual(response.status_code, 404)
+
 
 class PurseDeletionTest(TestCase):
     """Test purse deletion view."""
@@ -495,3 +582,324 @@ class PurseDeletionTest(TestCase):
         response = self.client.delete(self.url)
         self.assertEqual(response.status_code, 302)
         self.assertEqual(Purse.objects.count(), 0)
+        self.assertEqual(Purse.deleted_objects.count(), 1)
+        self.assertIsNone(User.objects.get().default_purse_id)
+        response = self.client.get(reverse('tracker:purse_list'))
+        self.assertEqual(response.url, reverse('tracker:purse_creation'))
+
+
+class TagViewTest(TestCase):
+    """Test tag list view."""
+
+    def setUp(self):
+        self.credentials = {'username': 'username',
+                            'password': 'password'}
+        u = create_user(**self.credentials)
+        p = create_purse(u)
+        for amount, desc in [(10, 'one two'), (20, 'two'), (50, 'three')]:
+            create_expenditure(**{'amount': amount,
+                                  'date': '2014-12-2',
+                                  'description': desc,
+                                  'author': u,
+                                  'purse': p})
+        self.url = reverse('tracker:tags')
+
+    def test_get_single_ordering(self):
+        """Get tags sorted by count."""
+        self.client.login(**self.credentials)
+        response = self.client.get(self.url + '?ordering=-count&limit=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content.decode('utf-8')),
+                         [{'name': 'two', 'count': 2, 'amount': 30}])
+
+    def test_get_multiple_orderings(self):
+        """Get tags sorted by count and amount in one request."""
+        self.client.login(**self.credentials)
+        response = self.client.get(self.url + '?ordering=-count'
+                                   '&ordering=-amount&limit=2&year=2014')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual([d['name'] for d in data['-count']],
+                         ['two', 'one'])
+        self.assertEqual([d['name'] for d in data['-amount']],
+                         ['three', 'two'])
+
+    def test_get_invalid_ordering(self):
+        """Get tags sorted by an unknown field."""
+        self.client.login(**self.credentials)
+        response = self.client.get(self.url + '?ordering=-id')
+        self.assertEqual(response.status_code, 400)
+
+
+class ExpenditureReportTest(TestCase):
+    """Test month list and year summary views."""
+
+    def setUp(self):
+        self.credentials = {'username': 'username',
+                            'password': 'password'}
+        u = create_user(**self.credentials)
+        other = create_user(username='other', password='password')
+        p = create_purse(u)
+        p.users.add(other)
+        for amount, date, author in [(10, '2014-12-2', u),
+                                     (20, '2014-12-3', other),
+                                     (5, '2014-11-3', u),
+                                     (7, '2015-01-3', u)]:
+            create_expenditure(**{'amount': amount,
+                                  'date': date,
+                                  'description': 'desc',
+                                  'author': author,
+                                  'purse': p})
+
+    def test_month_list(self):
+        """Get month totals."""
+        self.client.login(**self.credentials)
+        url = reverse('tracker:archive', kwargs={'year': 2014,
+                                                 'month': 12})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_amount'], 30)
+        self.assertEqual(response.context['user_amount'], 10)
+
+    def test_month_list_recurrences(self):
+        """Month lists include the occurrences of recurrences."""
+        self.client.login(**self.credentials)
+        Recurrence.objects.create(amount=3, description='rent',
+                                  author=Expenditure.objects.first().author,
+                                  purse=Purse.objects.get(), count=2,
+                                  start=datetime.date(2014, 11, 2))
+        url = reverse('tracker:archive', kwargs={'year': 2014,
+                                                 'month': 12})
+        response = self.client.get(url)
+        self.assertEqual([(e.date.day, e.amount, e.pk is None)
+                          for e in response.context['expenditures']],
+                         [(3, 20, False), (2, 3, True), (2, 10, False)])
+        self.assertEqual(response.context['total_amount'], 33)
+
+    def test_month_list_recurrences_pages(self):
+        """Occurrences are paginated with the expenditures."""
+        self.client.login(**self.credentials)
+        Recurrence.objects.create(amount=3, description='rent',
+                                  author=Expenditure.objects.first().author,
+                                  purse=Purse.objects.get(), count=2,
+                                  start=datetime.date(2014, 11, 2))
+        url = reverse('tracker:archive', kwargs={'year': 2014,
+                                                 'month': 12})
+        response = self.client.get(url, {'paginate_by': 1})
+        amounts = []
+        while True:
+            page = response.context['page_obj']
+            self.assertEqual(len(page.object_list), 1)
+            amounts.append(page.object_list[0].amount)
+            if not page.has_next():
+                break
+            response = self.client.get(url, {'paginate_by': 1,
+                                             'cursor': page.next_token})
+        self.assertEqual(amounts, [20, 3, 10])
+        response = self.client.get(url, {'paginate_by': 1,
+                                         'cursor': page.previous_token})
+        self.assertEqual([e.amount for e in response.context['page_obj']],
+                         [3])
+
+    def test_year_summary(self):
+        """Get year summary amounts."""
+        self.client.login(**self.credentials)
+        url = reverse('tracker:summary', kwargs={'year': 2014})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        amounts = response.context['amounts']
+        self.assertEqual([(a['month'].month, a['amount'], a['average'],
+                           a['delta']) for a in amounts],
+                         [(11, 5, 2.5, -2.5), (12, 10, 15, 5)])
+        self.assertEqual(response.context['totals'],
+                         {'amount': 15, 'average': 17.5, 'delta': 2.5})
+
+    def test_year_summary_span(self):
+        """Get summary amounts over several years."""
+        self.client.login(**self.credentials)
+        url = reverse('tracker:summary_span', kwargs={'year': 2014,
+                                                      'end_year': 2015})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        amounts = response.context['amounts']
+        self.assertEqual([(a['month'].year, a['month'].month, a['amount'])
+                          for a in amounts],
+                         [(2014, 11, 5), (2014, 12, 10), (2015, 1, 7)])
+        url = reverse('tracker:summary_span', kwargs={'year': 2015,
+                                                      'end_year': 2014})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 404)
+
+    def test_not_modified(self):
+        """Reports are not computed again while the purse is unchanged."""
+        self.client.login(**self.credentials)
+        url = reverse('tracker:summary', kwargs={'year': 2014})
+        self.client.get(url)
+        response = self.client.get(url)
+        etag = response['ETag']
+        with self.assertNumQueries(3):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(url, {'other': 1},
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(
+            reverse('tracker:tags'),
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+        create_expenditure(amount=1, date='2014-12-3', description='desc',
+                           author=response.wsgi_request.user,
+                           purse=Purse.objects.get())
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class ExpenditureExportTest(TestCase):
+    """Test expenditure export view."""
+
+    def setUp(self):
+        self.url = reverse('tracker:export')
+        self.credentials = {'username': 'username',
+                            'password': 'password'}
+        u = create_user(**self.credentials)
+        p = create_purse(u)
+        for amount, date, description in [(10, '2014-12-2', 'bread'),
+                                          (20, '2014-12-3', 'cheese'),
+                                          (5, '2015-01-3', 'bread, jam')]:
+            create_expenditure(**{'amount': amount,
+                                  'date': date,
+                                  'description': description,
+                                  'author': u,
+                                  'purse': p})
+
+    def get_content(self, response):
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_get_non_authentified(self):
+        """Get page while no user is authentified."""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+
+    def test_csv(self):
+        """Export expenditures as CSV."""
+        self.client.login(**self.credentials)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = self.get_content(response).splitlines()
+        self.assertEqual(lines[0],
+                         'id,date,amount,description,author,generated,'
+                         'created')
+        self.assertEqual([line.split(',')[1:3] for line in lines[1:]],
+                         [['2014-12-02', '10.00'],
+                          ['2014-12-03', '20.00'],
+                          ['2015-01-03', '5.00']])
+        self.assertIn('"bread, jam"', lines[3])
+
+    def test_ndjson(self):
+        """Export filtered expenditures as NDJSON."""
+        self.client.login(**self.credentials)
+        response = self.client.get(self.url, {'format': 'ndjson',
+                                              'filter': 'bread',
+                                              'end': '2014-12-31'})
+        self.assertEqual(response.status_code, 200)
+        rows = [json.loads(line)
+                for line in self.get_content(response).splitlines()]
+        self.assertEqual([(r['date'], r['amount'], r['author'])
+                          for r in rows],
+                         [('2014-12-02', '10.00', 'username')])
+
+    def test_invalid(self):
+        """Unknown formats and invalid dates are rejected."""
+        self.client.login(**self.credentials)
+        response = self.client.get(self.url, {'format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(self.url, {'start': '2014-13-01'})
+        self.assertEqual(response.status_code, 404)
+
+
+class UserPursesTest(TestCase):
+    """Test request-scoped loading of the user purses."""
+
+    def test_cached(self):
+        """Purses and member counts are loaded once per request."""
+        u = create_user(username='username', password='password')
+        other = create_user(username='other', password='password')
+        p = create_purse(u, name='one')
+        p.users.add(other)
+        create_purse(u, name='two')
+        create_purse(other, name='three')
+        request = RequestFactory().get('/')
+        request.user = u
+        with self.assertNumQueries(1):
+            purses = get_user_purses(request)
+            self.assertEqual(get_user_purses(request), purses)
+        self.assertEqual([(p.name, p.member_count) for p in purses],
+                         [('one', 2), ('two', 1)])
+
+    def test_shared_page(self):
+        """The shared purse flag is read from the cached member count."""
+        u = create_user(username='username', password='password')
+        create_purse(u, name='one')
+        self.client.login(username='username', password='password')
+        response = self.client.get(reverse('tracker:add'))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context['shared_purse'])
+
+
+class PurseListTest(TestCase):
+    """Test purse list view."""
+
+    def setUp(self):
+        self.url = reverse('tracker:purse_list')
+        self.credentials = {'username': 'username',
+                            'password': 'password'}
+        self.user = create_user(**self.credentials)
+        self.other = create_user(username='other', password='password')
+        p = create_purse(self.user, name='one')
+        p.users.add(self.other)
+        for amount, date in [(10, '2014-12-2'), (5, '2015-01-3')]:
+            create_expenditure(amount=amount, date=date, description='desc',
+                               author=self.user, purse=p)
+        create_purse(self.user, name='two')
+
+    def get(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(context.captured_queries)
+
+    def test_statistics(self):
+        """Purses are listed with their users and expenditures."""
+        self.client.login(**self.credentials)
+        response, _ = self.get()
+        self.assertEqual([(p.name, p.usernames(), p.expenditure_count,
+                           p.total_amount, p.last_expenditure.isoformat()
+                           if p.last_expenditure else None)
+                          for p in response.context['purses']],
+                         [('one', 'other, username', 2, 15, '2015-01-03'),
+                          ('two', 'username', 0, None, None)])
+
+    def test_queries(self):
+        """The number of queries doesn't depend on the number of purses."""
+        self.client.login(**self.credentials)
+        self.get()
+        _, count = self.get()
+        for name in ['three', 'four']:
+            create_purse(self.user, name=name).users.add(self.other)
+        _, other_count = self.get()
+        self.assertEqual(count, other_count)
+
+
+class PasswordResetTest(TestCase):
+    """Test password reset view."""
+    def test_post(self):
+        """Post queues the password reset email."""
+        create_user(username='username', password='password',
+                    email='test@example.com')
+        response = self.client.post(reverse('tracker:password_reset'),
+                                    {'email': 'test@example.com'})
+        self.assertEqual(response.status_code, 302)
+        email = OutboxEmail.objects.get()
+        self.assertEqual(email.to, 'test@example.com')
+        self.assertIn('/tracker/password_reset_confirm/', email.body)
@@ -20,6 +20,7 @@ from django.views.defaults import (server_error,
 from django.views.generic import TemplateView
 from tracker.views import (ExpenditureAdd,
                            ExpenditureDelete,
+                           ExpenditureExport,
                            ExpenditureUpdate,
                            ExpenditureFilteredList,
                            ExpenditureMonthList,
@@ -64,9 +65,15 @@ urlpatterns += [
     url(regex=r'^expenditures/summary/(?P<year>\d+)/$',
         view=ExpenditureYearSummary.as_view(),
         name='summary'),
+    url(regex=r'^expenditures/summary/(?P<year>\d+)/(?P<end_year>\d+)/$',
+        view=ExpenditureYearSummary.as_view(),
+        name='summary_span'),
     url(regex=r'^expenditures/search/$',
         view=ExpenditureFilteredList.as_view(),
         name='expenditure-search'),
+    url(regex=r'^expenditures/export/$',
+        view=ExpenditureExport.as_view(),
+        name='export'),
     url(regex=r'^expenditures/$',
         view=ExpenditureHome.as_view(),
         name='list')]
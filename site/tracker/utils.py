@@ -1,8 +1,117 @@
 """Tracker utilities."""
 
+import time
+
+from django.db import transaction
+
 
 def dictfetchall(cursor):
     """Returns all rows from a cursor as a dict."""
     desc = cursor.description
     return [dict(zip([col[0] for col in desc], row))
             for row in cursor.fetchall()]
+
+
+def add_months(date, months):
+    """Return ``date`` shifted by a number of months.
+
+    When the day doesn't exist in the target month, up to three
+    previous days are tried (end-of-month fallback), so that the 31st
+    of a month gives the last day of shorter months.
+    """
+    total = date.month - 1 + months
+    year, month = date.year + total // 12, total % 12 + 1
+    for i in range(4):
+        try:
+            return date.replace(day=date.day - i, month=month, year=year)
+        except ValueError:
+            pass
+    raise ValueError('No valid date {0} months after {1}'.format(months,
+                                                                 date))
+
+
+def chunks(values, size):
+    """Yield successive slices of ``values`` of length ``size``.
+
+    The last slice may be shorter.
+    """
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def unique(values):
+    """Return the list of distinct ``values`` in order of appearance."""
+    seen = set()
+    return [v for v in values if not (v in seen or seen.add(v))]
+
+
+def iter_chunks(qs, size, after=None):
+    """Yield successive lists of at most ``size`` objects of ``qs``.
+
+    Objects are ordered by primary key and each chunk is fetched by a
+    separate query filtering on primary keys greater than the last
+    one seen (keyset pagination). Thus memory usage doesn't depend on
+    the query set size and iteration may start after the primary key
+    ``after``.
+    """
+    qs = qs.order_by('pk')
+    while True:
+        chunk = list(qs.filter(pk__gt=after)[:size]
+                     if after is not None else qs[:size])
+        if not chunk:
+            break
+        yield chunk
+        after = chunk[-1].pk
+
+
+def delete_chunks(qs, size, pause=0, budget=None, dry_run=False,
+                  delete=None):
+    """Delete the objects of ``qs`` by chunks of at most ``size``.
+
+    Primary keys are read by keyset pagination as in ``iter_chunks``
+    and each chunk is deleted in its own transaction, so that the
+    objects collected for cascading deletions and the locks held
+    remain bounded. ``pause`` seconds are waited between chunks, and
+    no chunk is started once ``budget`` seconds have elapsed.
+
+    Chunks are deleted by the callable ``delete``, given the list of
+    primary keys and returning the number of deleted rows, by default
+    the deletion of the objects of ``qs`` having those keys (so that
+    objects which don't match anymore are kept). Nothing is deleted
+    when ``dry_run`` is true.
+
+    Yield the number of objects and of deleted rows of each chunk.
+    """
+    if delete is None:
+        def delete(pks):
+            return qs.filter(pk__in=pks).delete()[0]
+    start = time.time()
+    qs = qs.order_by('pk')
+    after = None
+    while budget is None or time.time() - start < budget:
+        if after is not None and pause:
+            time.sleep(pause)
+        chunk = qs.filter(pk__gt=after) if after is not None else qs
+        pks = list(chunk.values_list('pk', flat=True)[:size])
+        if not pks:
+            break
+        rows = 0
+        if not dry_run:
+            with transaction.atomic(using=qs.db):
+                rows = delete(pks)
+        after = pks[-1]
+        yield len(pks), rows
+
+
+def rank(rows, ordering, limit=None):
+    """Return at most ``limit`` dictionaries of ``rows`` sorted by a key.
+
+    The key is the ``ordering`` string with an optional ``-`` prefix
+    for descending order. Rows whose key value is ``None`` come last.
+    """
+    key = ordering.lstrip('-')
+    ranked = sorted([r for r in rows if r[key] is not None],
+                    key=lambda r: r[key],
+                    reverse=ordering.startswith('-'))
+    ranked += [r for r in rows if r[key] is None]
+    return ranked[:limit] if limit is not None else ranked
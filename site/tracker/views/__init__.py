@@ -1,5 +1,6 @@
 from tracker.views.base import (ExpenditureAdd,
                                 ExpenditureDelete,
+                                ExpenditureExport,
                                 ExpenditureUpdate,
                                 ExpenditureFilteredList,
                                 ExpenditureMonthList,
@@ -15,7 +16,8 @@ from tracker.views.base import (ExpenditureAdd,
                                 UserChange,
                                 UserDefaultPurse)
 
-__all__ = ('ExpenditureAdd', 'ExpenditureDelete', 'ExpenditureUpdate',
+__all__ = ('ExpenditureAdd', 'ExpenditureDelete', 'ExpenditureExport',
+           'ExpenditureUpdate',
            'ExpenditureMonthList',
            'ExpenditureYearSummary', 'ExpenditureFilteredList',
            'ExpenditureHome',
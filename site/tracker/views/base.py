@@ -3,12 +3,16 @@
 import datetime
 import json
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib import messages
 from django.core.urlresolvers import (reverse_lazy, reverse)
 from django.core.exceptions import ImproperlyConfigured
-from django.db.models import Sum
-from django.http import (HttpResponse, HttpResponseRedirect, Http404)
+from django.db import transaction
+from django.db.models import (Case, Count, Max, Sum, When)
+from django.http import (HttpResponse, HttpResponseBadRequest,
+                         HttpResponseRedirect, Http404,
+                         StreamingHttpResponse)
 from django.utils.encoding import force_text
 from django.utils.timezone import utc
 from django.utils.translation import ugettext_lazy as _
@@ -20,16 +24,22 @@ from django.views.generic import (CreateView,
                                   TemplateView,
                                   UpdateView,
                                   View)
+from django.views.generic.list import MultipleObjectMixin
 
-from tracker.models import (Expenditure, Purse, Tag)
+from tracker.models import (Expenditure, MonthStat, Purse, Recurrence,
+                            Tag)
+from tracker import cache
+from tracker.context_processors import get_user_purses
+from tracker.export import (CONTENT_TYPES, FORMATS, export, filter_dates)
 from tracker.forms import (ExpenditureForm,
                            MultipleExpenditureForm,
                            PurseForm,
                            PurseShareForm)
-from tracker.utils import dictfetchall
+from tracker.utils import (add_months, rank)
 from tracker.views.mixins import (EditableObjectMixin,
                                   FieldNamesMixin,
                                   ObjectOwnerMixin,
+                                  PurseConditionalMixin,
                                   QueryPaginationMixin,
                                   QueryFilterMixin,
                                   WithCurrentDateMixin)
@@ -90,7 +100,7 @@ class PurseCreation(LoginRequiredMixin,
     def get_context_data(self, **kwargs):
         context = super(PurseCreation, self).get_context_data(**kwargs)
         context.update({'user_has_purse':
-                        self.request.user.purse_set.count() > 0})
+                        len(get_user_purses(self.request)) > 0})
         return context
 
 
@@ -125,6 +135,9 @@ class DefaultPurseMixin(object):
     Messages notify the user of the purse creation or the change of
     default purse.
 
+    The user purses are read from the request-scoped cache of
+    ``tracker.context_processors.get_user_purses``.
+
     """
     @property
     def purse(self):
@@ -135,15 +148,19 @@ class DefaultPurseMixin(object):
                                        'LoginRequiredMixin')
         else:
             try:
-                return user.default_purse
+                purse_id = user.default_purse_id
             except AttributeError:
                 raise ImproperlyConfigured('User model does not define a '
                                            'purse_default attribute')
+            for purse in get_user_purses(self.request):
+                if purse.pk == purse_id:
+                    return purse
+            return user.default_purse
 
     def dispatch(self, *args, **kwargs):
         user = self.request.user
-        purses = Purse.objects.filter(users__pk=user.pk)
-        if not purses.exists():
+        purses = get_user_purses(self.request)
+        if not purses:
             msg = _('First, create a purse...')
             messages.info(self.request, msg)
             return HttpResponseRedirect(
@@ -157,7 +174,10 @@ class DefaultPurseMixin(object):
 
     def get_context_data(self, **kwargs):
         context = super(DefaultPurseMixin, self).get_context_data(**kwargs)
-        context.update({'shared_purse': self.purse.users.count() > 1})
+        count = getattr(self.purse, 'member_count', None)
+        if count is None:
+            count = self.purse.users.count()
+        context.update({'shared_purse': count > 1})
         return context
 
 
@@ -170,19 +190,34 @@ class PurseList(LoginRequiredMixin,
     """List the purses of the logged in account."""
     model = Purse
     context_object_name = 'purses'
-    field_names = ['name', 'users', 'description']
+    field_names = ['name', 'users',
+                   ('expenditure_count', _('expenditures')),
+                   ('total_amount', _('amount')),
+                   ('last_expenditure', _('last expenditure')),
+                   'description']
 
     def get_queryset(self):
-        qs = super(PurseList, self).get_queryset()
-        qs = qs.filter(users=self.request.user).select_related()
-        return qs
+        """Return the user purses with their expenditures statistics.
+
+        The purses are annotated with the number, total amount and
+        last date of their expenditures by one grouped query, and
+        their users are fetched by one more query.
+        """
+        qs = Purse.objects.for_user(self.request.user, members=False)
+        qs = qs.annotate(expenditure_count=Count('expenditure'),
+                         total_amount=Sum('expenditure__amount'),
+                         last_expenditure=Max('expenditure__date'))
+        return qs.prefetch_related('users')
 
 
 class PurseDelete(LoginRequiredMixin,
                   WithCurrentDateMixin,
                   ObjectOwnerMixin,
                   DeleteView):
-    """View to delete a purse."""
+    """View to delete a purse.
+
+    The purse is only marked as deleted, its rows are purged later.
+    """
     model = Purse
     context_object_name = 'purse'
     success_url = reverse_lazy('tracker:purse_list')
@@ -190,6 +225,11 @@ class PurseDelete(LoginRequiredMixin,
     def is_owner(self, user, obj):
         return user in obj.users.all()
 
+    def delete(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        self.object.mark_deleted()
+        return HttpResponseRedirect(self.get_success_url())
+
 
 class UserPurseMixin(object):
     """Set choices for the attribute whose name is ``purse_field_name``.
@@ -204,7 +244,7 @@ class UserPurseMixin(object):
     def get_form(self):
         try:
             form = super(UserPurseMixin, self).get_form()
-            purses = self.request.user.purse_set.all()
+            purses = get_user_purses(self.request)
         except AttributeError:
             raise ImproperlyConfigured('UserPurseMixin requires the mixin '
                                        'LoginRequiredMixin and FormMixin')
@@ -331,15 +371,38 @@ class ExpenditureAdd(LoginRequiredMixin,
         return reverse_lazy('tracker:list')
 
     def form_valid(self, form):
-        """Completes then saves a valid form."""
+        """Completes then saves a valid form.
+
+        The following occurrences are recorded as a recurrence when the
+        ``TRACKER_LAZY_RECURRENCES`` setting is true, and saved as
+        generated expenditures otherwise. In the latter case, they are
+        inserted by a single bulk query, in the same transaction as the
+        expenditure, and the monthly statistics of all their months
+        are refreshed at once (generated expenditures aren't tagged).
+        """
         form.instance.author = self.request.user
         form.instance.purse = self.purse
-        response = super(ExpenditureAdd, self).form_valid(form)
-        for date in form.other_dates:
-            self.object.pk = None
-            self.object.date = date
-            self.object.generated = True
-            self.object.save()
+        with transaction.atomic():
+            response = super(ExpenditureAdd, self).form_valid(form)
+            if not form.other_dates:
+                return response
+            e = self.object
+            if getattr(settings, 'TRACKER_LAZY_RECURRENCES', False):
+                Recurrence.objects.create(amount=e.amount,
+                                          description=e.description,
+                                          author=e.author, purse=e.purse,
+                                          start=e.date,
+                                          count=len(form.other_dates))
+                return response
+            Expenditure.objects.bulk_create(
+                [Expenditure(amount=e.amount, date=date,
+                             description=e.description, author=e.author,
+                             purse=e.purse, generated=True)
+                 for date in form.other_dates])
+            MonthStat.objects.refresh(e.purse_id,
+                                      set((d.year, d.month)
+                                          for d in form.other_dates))
+            Purse.objects.touch([e.purse_id])
         return response
 
 
@@ -391,6 +454,8 @@ class ExpenditureFilteredList(LoginRequiredMixin,
     allow_future = True
     filter_description = _('Filter expenditures')
     template_name = 'tracker/expenditure_filtered_list.html'
+    cursor_pagination = True
+    read_replica = True
 
     def get_queryset(self):
         """Filter the default query set.
@@ -415,14 +480,16 @@ class ExpenditureFilteredList(LoginRequiredMixin,
         user = self.request.user if self.request else None
         if user:
             qs = self.object_list.all()
-            context.update(qs.aggregate(total_amount=Sum('amount')))
-            context.update(qs.filter(author_id__exact=user.id)
-                           .aggregate(user_amount=Sum('amount')))
+            user_amount = Case(When(author_id=user.id, then='amount'))
+            context.update(qs.aggregate(total_amount=Sum('amount'),
+                                        total_count=Count('id'),
+                                        user_amount=Sum(user_amount)))
         return context
 
 
 class ExpenditureMonthList(LoginRequiredMixin,
                            DefaultPurseMixin,
+                           PurseConditionalMixin,
                            FieldNamesMixin,
                            WithCurrentDateMixin,
                            QueryPaginationMixin,
@@ -442,26 +509,36 @@ class ExpenditureMonthList(LoginRequiredMixin,
     allow_empty = True
     allow_future = True
     template_name = 'tracker/expenditure_month_list.html'
+    cursor_pagination = True
+    read_replica = True
 
     def get_queryset(self):
         qs = super(ExpenditureMonthList, self).get_queryset()
         qs = qs.filter(purse=self.purse).select_related('author')
         return qs
 
+    def get_extra_objects(self):
+        """Return the occurrences of recurrences in the month."""
+        first = datetime.date(int(self.get_year()), int(self.get_month()), 1)
+        last = add_months(first, 1) - datetime.timedelta(1)
+        return Recurrence.objects.get_occurrences(self.purse, first, last)
+
     def get_context_data(self, **kwargs):
         """Extends the context with view's specific data.
 
         Table field names and various data computed from the
-        expenditures amounts are added.
+        expenditures amounts are added. Amounts are read from the
+        monthly statistics.
 
         """
         context = super(ExpenditureMonthList, self).get_context_data(**kwargs)
         user = self.request.user if self.request else None
         if user:
-            qs = self.object_list.all()
-            context.update(qs.aggregate(total_amount=Sum('amount')))
-            context.update(qs.filter(author_id__exact=user.id)
-                           .aggregate(user_amount=Sum('amount')))
+            year, month = int(self.get_year()), int(self.get_month())
+            context.update(cache.get_or_set(
+                self.purse, 'month_totals', (user.pk, year, month),
+                lambda: MonthStat.objects.get_totals(self.purse, user,
+                                                     year, month)))
         context['params'] = {'month': self.get_month(),
                              'year': self.get_year()}
         return context
@@ -469,14 +546,20 @@ class ExpenditureMonthList(LoginRequiredMixin,
 
 class ExpenditureYearSummary(LoginRequiredMixin,
                              DefaultPurseMixin,
+                             PurseConditionalMixin,
                              WithCurrentDateMixin,
                              TemplateView):
-    """Summary of expenditures in a year."""
+    """Summary of expenditures in a year.
+
+    When the URL also captures an ``end_year``, the summary spans all
+    the years from ``year`` to ``end_year``.
+    """
     template_name = 'tracker/expenditure_year_summary.html'
+    read_replica = True
 
-    def get_date(self):
+    def get_date(self, kwarg='year'):
         try:
-            year = int(self.kwargs['year'])
+            year = int(self.kwargs[kwarg])
         except KeyError:
             raise Http404("No year specified")
         try:
@@ -490,29 +573,23 @@ class ExpenditureYearSummary(LoginRequiredMixin,
         context = super(ExpenditureYearSummary,
                         self).get_context_data(**kwargs)
         date = self.get_date()
-        next_year = date.replace(year=date.year + 1, month=1, day=1)
+        end_date = (self.get_date('end_year') if 'end_year' in self.kwargs
+                    else date)
+        if end_date < date:
+            raise Http404("Invalid years span")
+        next_year = end_date.replace(year=end_date.year + 1, month=1, day=1)
         previous_year = date.replace(year=date.year - 1, month=1, day=1)
         context.update({'year': date,
+                        'end_year': end_date,
+                        'span': end_date != date,
                         'next_year': next_year,
                         'previous_year': previous_year})
 
-        users = self.purse.users.count()
-        from django.db import connection
-        cursor = connection.cursor()
-        cursor.execute('SELECT t.*, t.average - t.amount AS delta FROM '
-                       '(SELECT date_trunc(\'month\', date) AS month, '
-                       'SUM(CASE WHEN author_id=%s THEN amount ELSE 0 END)'
-                       ' AS amount, '
-                       'SUM(amount)/%s AS average, '
-                       'COUNT(id) AS count '
-                       'FROM tracker_expenditure '
-                       'WHERE EXTRACT(YEAR FROM date)=%s AND purse_id=%s '
-                       'GROUP BY month ORDER BY month) AS t;',
-                       [self.request.user.id,
-                        users,
-                        date.year,
-                        self.purse.id])
-        values = dictfetchall(cursor)
+        user = self.request.user
+        values = cache.get_or_set(
+            self.purse, 'year_summary', (user.pk, date.year, end_date.year),
+            lambda: MonthStat.objects.get_summary(self.purse, user,
+                                                  date.year, end_date.year))
         flat = [[d['amount'] for d in values],
                 [d['average'] for d in values],
                 [d['delta'] for d in values]]
@@ -523,6 +600,52 @@ class ExpenditureYearSummary(LoginRequiredMixin,
         return context
 
 
+class ExpenditureExport(LoginRequiredMixin,
+                        DefaultPurseMixin,
+                        QueryFilterMixin,
+                        MultipleObjectMixin,
+                        View):
+    """Export of the expenditures of the default purse.
+
+    The query parameter `format` selects CSV (default) or NDJSON
+    output. Expenditures can be restricted to those matching the
+    `filter` keywords and to a date range with the query parameters
+    `start` and `end` (formatted as `YYYY-MM-DD`). The response is
+    streamed.
+    """
+    model = Expenditure
+    http_method_names = ['get', 'head', 'options', 'trace']
+    read_replica = True
+
+    def get_date_param(self, name):
+        try:
+            value = self.request.GET[name]
+        except KeyError:
+            return None
+        try:
+            return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise Http404("Invalid date string '{0}'".format(value))
+
+    def get_queryset(self):
+        qs = super(ExpenditureExport, self).get_queryset()
+        qs = qs.filter(purse=self.purse)
+        return filter_dates(qs, self.get_date_param('start'),
+                            self.get_date_param('end'))
+
+    def get(self, request, *args, **kwargs):
+        """Stream the expenditures."""
+        fmt = request.GET.get('format', 'csv')
+        if fmt not in FORMATS:
+            return HttpResponseBadRequest()
+        response = StreamingHttpResponse(export(self.get_queryset(), fmt),
+                                         content_type=CONTENT_TYPES[fmt])
+        filename = 'expenditures.{0}'.format(fmt)
+        response['Content-Disposition'] = ('attachment; '
+                                           'filename="{0}"'.format(filename))
+        return response
+
+
 class ExpenditureHome(RedirectView):
     """Start page when browsing expenditures."""
     url = reverse_lazy('tracker:archive',
@@ -535,36 +658,58 @@ class ExpenditureHome(RedirectView):
 
 class TagView(LoginRequiredMixin,
               DefaultPurseMixin,
+              PurseConditionalMixin,
               View):
     """List of tags.
 
     The query parameter `limit` can be used to limit the number of
-    tags in the list.
+    tags in the list, and the query parameter `ordering` to sort
+    them. The query parameter `year` restricts tags to the
+    expenditures of a year.
+
+    Several rankings can be requested at once by repeating the
+    `ordering` parameter, with one `limit` per ordering or a single
+    one for all. The tags are then fetched once and the response is an
+    object mapping each ordering to its list of tags.
     """
     http_method_names = ['get', 'head', 'options', 'trace']
+    ordering_fields = ('name', 'count', 'amount')
+    read_replica = True
 
     def get(self, request, *args, **kwargs):
         """Return list of tag names."""
         try:
-            limit = int(request.GET['limit'])
-        except (KeyError, ValueError):
-            limit = None
-        try:
-            ordering = request.GET['ordering']
-        except KeyError:
-            ordering = None
+            limits = [int(v) for v in request.GET.getlist('limit')]
+        except ValueError:
+            limits = []
+        orderings = request.GET.getlist('ordering')
+        if any(o.lstrip('-') not in self.ordering_fields for o in orderings):
+            return HttpResponseBadRequest()
         try:
-            year = request.GET['year']
-        except KeyError:
+            year = int(request.GET['year'])
+        except (KeyError, ValueError):
             year = None
-        purse = self.purse
-        lookup_params = None
-        if year is not None:
-            lookup_params = {'expenditures__date__year': year}
-        tags = Tag.objects.get_tags_for(purse, lookup_params)
-        if ordering is not None:
-            tags = tags.order_by(ordering)
-        if limit is not None:
-            tags = tags[:limit]
-        data = json.dumps(list(tags.values('name', 'count', 'amount')))
-        return HttpResponse(data, content_type='application/json')
+        data = cache.get_or_set(self.purse, 'tags',
+                                (year, orderings, limits),
+                                lambda: self.get_tags(year, orderings,
+                                                      limits))
+        return HttpResponse(json.dumps(data, default=float),
+                            content_type='application/json')
+
+    def get_tags(self, year, orderings, limits):
+        """Return the tags of a year sorted and limited."""
+        tags = Tag.objects.get_tags_for(self.purse, year)
+        if len(orderings) > 1:
+            if len(limits) == 1:
+                limits = limits * len(orderings)
+            limits = limits + [None] * (len(orderings) - len(limits))
+            rows = list(tags.values(*self.ordering_fields))
+            data = dict((o, rank(rows, o, l))
+                        for o, l in zip(orderings, limits))
+        else:
+            if orderings:
+                tags = tags.order_by(orderings[0])
+            if limits:
+                tags = tags[:limits[0]]
+            data = list(tags.values(*self.ordering_fields))
+        return data
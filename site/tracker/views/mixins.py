@@ -1,12 +1,23 @@
 """Module defining generic view mixins."""
 
+import hashlib
+
+from django.contrib import messages
 from django.core.exceptions import ImproperlyConfigured
-from django.http import Http404
-from django.utils import formats
-from django.utils.timezone import now
+from django.http import (Http404, HttpResponseNotModified)
+from django.utils.cache import (patch_cache_control, patch_vary_headers)
+from django.utils.encoding import force_bytes
+from django.utils.http import (http_date, parse_etags, parse_http_date_safe,
+                               quote_etag)
+from django.utils import dateformat
+from django.utils.timezone import (is_aware, localtime, now)
+from django.utils.translation import get_language
 from django.utils.translation import ungettext
 from django.utils.translation import ugettext_lazy as _
 
+from tracker.pagination import (CursorPaginator, InvalidCursor, MergedList)
+from tracker.search import filter_by_keywords
+
 
 class WithCurrentDateMixin(object):
     """Extends a view context with the current datetime."""
@@ -39,8 +50,18 @@ class QueryPaginationMixin(object):
 
     The configuration is read from the query parameters.
 
+    When the attribute ``cursor_pagination`` is ``True``, pages are
+    located by the opaque token found in the query parameter named
+    ``cursor`` instead of a page number (see
+    ``tracker.pagination.CursorPaginator``).
+
+    The unsaved objects returned by ``get_extra_objects`` are merged
+    into the pages according to the ordering of the model.
+
     """
     paginate_by = 15
+    cursor_pagination = False
+    cursor_kwarg = 'cursor'
 
     def get_paginate_by(self, queryset):
         """Returns the number of items to paginate by.
@@ -59,6 +80,25 @@ class QueryPaginationMixin(object):
             paginate_by = self.paginate_by
         return paginate_by
 
+    def get_extra_objects(self):
+        """Return the unsaved objects to merge into the pages."""
+        return []
+
+    def paginate_queryset(self, queryset, page_size):
+        """Paginate the queryset, using cursors if configured to."""
+        extra = self.get_extra_objects()
+        if not self.cursor_pagination:
+            if extra:
+                queryset = MergedList(queryset, extra)
+            return super(QueryPaginationMixin,
+                         self).paginate_queryset(queryset, page_size)
+        paginator = CursorPaginator(queryset, page_size, extra)
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        except InvalidCursor:
+            raise Http404('Invalid cursor')
+        return (paginator, page, page.object_list, page.has_other_pages())
+
     def get_context_data(self, **kwargs):
         """Extends the context data with info on the request path."""
         context = super(QueryPaginationMixin, self).get_context_data(**kwargs)
@@ -79,7 +119,7 @@ class QueryFilterMixin(object):
 
     When the attribute ``filter_num_attr`` is set, filtering also
     applies to the specified field but only for keywords convertible
-    to float.
+    to decimal numbers.
 
     All filters are combined using logical AND operations.
     """
@@ -117,26 +157,15 @@ class QueryFilterMixin(object):
         return context
 
     def get_queryset(self):
-        """Filter the default query set."""
+        """Filter the default query set.
+
+        Text filtering is delegated to the search backend of the
+        database (see ``tracker.search``).
+        """
         qs = super(QueryFilterMixin, self).get_queryset()
-        kw = '{0}__{1}'.format(self.filter_attr,
-                               'icontains' if self.filter_ignore_case
-                               else 'contains')
-        if self.filter_num_attr is not None:
-            okw = '{0}__{1}'.format(self.filter_num_attr, 'exact')
-
-        for f in self.get_filter_keywords():
-            dct, n = {}, None
-            if self.filter_num_attr is not None:
-                try:
-                    n = float(formats.sanitize_separators(f))
-                    dct[okw] = n
-                except ValueError:
-                    pass
-            if n is None:
-                dct[kw] = f
-            qs = qs.filter(**dct)
-        return qs
+        return filter_by_keywords(qs, self.get_filter_keywords(),
+                                  self.filter_attr, self.filter_num_attr,
+                                  self.filter_ignore_case)
 
 
 class ObjectOwnerMixin(object):
@@ -186,3 +215,77 @@ class EditableObjectMixin(object):
             raise ImproperlyConfigured('EditableObjectMixin requires '
                                        'the is_editable attribute')
         return super(EditableObjectMixin, self).dispatch(*args, **kwargs)
+
+
+class PurseConditionalMixin(object):
+    """Answer conditional GET requests from the purse version.
+
+    The ``ETag`` of a response is derived from the version of the
+    purse given by the ``purse`` attribute, the logged in user, the
+    requested URL, the language, the CSRF token and the current date.
+    The ``Last-Modified`` date is the purse modification date, or the
+    start of the current day if more recent. When the request
+    conditions match, a ``304 Not Modified`` response is returned
+    before the view computes anything.
+
+    Purse versions are incremented on every change of the purse, its
+    expenditures or its users (see ``PurseManager.touch``). Responses
+    are only conditional when no message is pending.
+
+    This mixin must come after the one defining ``purse`` since the
+    conditions are checked when dispatching the request.
+    """
+    def get_etag(self):
+        """Return the entity tag of the response."""
+        purse = self.purse
+        values = [purse.pk, purse.version, self.request.user.pk,
+                  self.request.get_full_path(), get_language(),
+                  self.request.META.get('CSRF_COOKIE'),
+                  self.get_today().date()]
+        key = ':'.join(u'{0}'.format(v) for v in values)
+        return hashlib.md5(force_bytes(key)).hexdigest()
+
+    def get_today(self):
+        """Return the start of the current day."""
+        current = now()
+        if is_aware(current):
+            current = localtime(current)
+        return current.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def get_last_modified(self):
+        """Return the modification timestamp of the response."""
+        modified = max(self.purse.modified, self.get_today())
+        return int(dateformat.format(modified, 'U'))
+
+    def is_not_modified(self, request, etag, last_modified):
+        """Check the request conditions against the response validators.
+
+        ``If-Modified-Since`` is only used without ``If-None-Match``.
+        """
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            return (if_none_match.strip() == '*' or
+                    etag in parse_etags(if_none_match))
+        since = request.META.get('HTTP_IF_MODIFIED_SINCE')
+        since = parse_http_date_safe(since) if since else None
+        return since is not None and last_modified <= since
+
+    def dispatch(self, request, *args, **kwargs):
+        if (request.method not in ('GET', 'HEAD') or
+                len(messages.get_messages(request))):
+            return super(PurseConditionalMixin, self).dispatch(
+                request, *args, **kwargs)
+        etag = self.get_etag()
+        last_modified = self.get_last_modified()
+        if self.is_not_modified(request, etag, last_modified):
+            response = HttpResponseNotModified()
+        else:
+            response = super(PurseConditionalMixin, self).dispatch(
+                request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = quote_etag(etag)
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ('Cookie', 'Accept-Language'))
+        return response
@@ -9,7 +9,7 @@ from django.template.loader import render_to_string
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
-from users.models import Registration
+from users.models import (OutboxEmail, Registration)
 
 from bootstrap.forms import BootstrapWidgetMixin
 
@@ -73,8 +73,8 @@ class UserCreationForm(BootstrapWidgetMixin, ModelForm):
              message_template_name='users/user_creation_email.html'):
         """Save inactive user.
 
-        A registration instance is created and sent to the user email
-        address.
+        A registration instance is created and its key is queued to
+        be sent to the user email address.
 
         """
         user = super(UserCreationForm, self).save(commit=False)
@@ -95,7 +95,7 @@ class UserCreationForm(BootstrapWidgetMixin, ModelForm):
             subject = render_to_string(subject_template_name, c)
             subject = ''.join(subject.splitlines())
             email = render_to_string(message_template_name, c)
-            user.email_user(subject, email)
+            OutboxEmail.objects.enqueue(subject, email, user.email)
         return user
 
 
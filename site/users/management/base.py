@@ -0,0 +1,66 @@
+"""Base classes of the users management commands."""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from tracker.utils import delete_chunks
+
+
+class ChunkedDeletionCommand(BaseCommand):
+    """Command deleting the objects of a query set by chunks.
+
+    Subclasses implement ``get_queryset`` and may override ``delete``
+    to handle the deletion of a chunk of primary keys (see
+    ``tracker.utils.delete_chunks``). The ``label`` attribute names
+    the deleted objects in the messages.
+    """
+    label = 'objects'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            dest='batch_size',
+                            help='maximal number of objects per '
+                            'transaction')
+        parser.add_argument('--pause', type=float, default=0,
+                            help='delay, in seconds, between transactions')
+        parser.add_argument('--time-budget', type=float, dest='budget',
+                            help='duration, in seconds, after which no '
+                            'transaction is started')
+        parser.add_argument('--dry-run', action='store_true',
+                            dest='dry_run',
+                            help='only count the objects to delete')
+
+    def get_queryset(self):
+        """Return the query set of the objects to delete."""
+        raise NotImplementedError
+
+    def delete(self, pks):
+        """Delete the objects of a chunk and return the rows count."""
+        return self.get_queryset().filter(pk__in=pks).delete()[0]
+
+    def handle(self, *args, **options):
+        objects, rows, start = 0, 0, time.time()
+        for count, deleted in delete_chunks(self.get_queryset(),
+                                            options['batch_size'],
+                                            options['pause'],
+                                            options['budget'],
+                                            options['dry_run'],
+                                            self.delete):
+            objects += count
+            rows += deleted
+            if not options['dry_run']:
+                elapsed = time.time() - start
+                msg = '{0} {1} deleted ({2} rows, {3:.0f} rows/s)\n'
+                self.stdout.write(msg.format(objects, self.label, rows,
+                                             rows / elapsed
+                                             if elapsed else 0))
+        if options['dry_run']:
+            msg = '(dry run) {0} {1} to delete\n'
+            self.stdout.write(msg.format(objects, self.label))
+        elif not objects:
+            self.stdout.write('No {0} found\n'.format(self.label))
+        budget = options['budget']
+        if budget is not None and time.time() - start >= budget:
+            self.stdout.write('Time budget exhausted, remaining {0} are '
+                              'left\n'.format(self.label))
@@ -1,19 +1,11 @@
-from django.core.management.base import BaseCommand
-
+from users.management.base import ChunkedDeletionCommand
 from users.models import Registration
 
 
-class Command(BaseCommand):
+class Command(ChunkedDeletionCommand):
     """Command to delete registrations which have expired."""
     help = 'Delete registrations that have expired'
+    label = 'expired registrations'
 
-    def handle(self, *args, **options):
-        qs = Registration.expired_objects.all()
-        count = qs.count()
-        if count > 0:
-            msg = 'Deleting {0} expired registration\n'
-            self.stdout.write(msg.format(count))
-            qs.delete()
-        else:
-            msg = 'No expired registration found\n'
-            self.stdout.write(msg)
+    def get_queryset(self):
+        return Registration.expired_objects.all()
@@ -1,23 +1,28 @@
 from django.contrib.auth import get_user_model
-from django.core.management.base import BaseCommand
 
-from users.models import Registration
+from tracker.models import Purse
+from users.management.base import ChunkedDeletionCommand
 
 User = get_user_model()
 
 
-class Command(BaseCommand):
-    """Command to delete inactive accounts without registration."""
+class Command(ChunkedDeletionCommand):
+    """Command to delete inactive accounts without registration.
+
+    The expenditures of the deleted accounts are deleted too, which
+    refreshes their statistics. The purses the accounts were members
+    of are recorded as changed.
+    """
     help = 'Delete inactive account without registration'
+    label = 'expired user accounts'
+
+    def get_queryset(self):
+        return User.objects.filter(is_active=False,
+                                   registration__isnull=True)
 
-    def handle(self, *args, **options):
-        qs = User.objects.filter(is_active=False)
-        qs = qs.filter(registration__lte=0)
-        count = qs.count()
-        if count > 0:
-            msg = 'Deleting {0} expired user account\n'
-            self.stdout.write(msg.format(count))
-            qs.delete()
-        else:
-            msg = 'No user account as expired\n'
-            self.stdout.write(msg)
+    def delete(self, pks):
+        purse_ids = set(Purse.objects.filter(users__in=pks)
+                        .values_list('pk', flat=True))
+        rows = super(Command, self).delete(pks)
+        Purse.objects.touch(purse_ids)
+        return rows
@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.models import OutboxEmail
+
+
+class Command(BaseCommand):
+    """Command to send the emails waiting in the outbox.
+
+    Emails are sent by batches, each one through a single connection
+    to the email backend. When no email is pending, the command waits
+    ``--sleep`` seconds before polling the outbox again, unless
+    ``--once`` is given. Only one instance should run at a time.
+    """
+    help = 'Send the emails waiting in the outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            dest='batch_size',
+                            help='maximal number of emails per connection')
+        parser.add_argument('--sleep', type=float, default=10,
+                            help='delay, in seconds, between polls of an '
+                            'empty outbox')
+        parser.add_argument('--once', action='store_true',
+                            help='exit once no email is pending')
+
+    def handle(self, *args, **options):
+        total_sent, total_failed = 0, 0
+        try:
+            while True:
+                sent, failed = OutboxEmail.objects.send_pending(
+                    options['batch_size'])
+                total_sent += sent
+                total_failed += failed
+                if sent or failed:
+                    msg = 'Sent: {0}, failed: {1}\n'
+                    self.stdout.write(msg.format(sent, failed))
+                if sent + failed < options['batch_size']:
+                    if options['once']:
+                        break
+                    time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            pass
+        pending = OutboxEmail.objects.filter(next_attempt__isnull=False)
+        msg = ('Total sent: {0}, failed attempts: {1}, pending: {2}, '
+               'abandoned: {3}\n')
+        self.stdout.write(msg.format(
+            total_sent, total_failed, pending.count(),
+            OutboxEmail.objects.filter(next_attempt__isnull=True).count()))
@@ -4,9 +4,12 @@ import hashlib
 import random
 from datetime import timedelta
 from django.conf import settings
+from django.core.mail import (EmailMultiAlternatives, get_connection)
 from django.db.models import (CharField, DateTimeField,
-                              ForeignKey, Manager, Model)
+                              ForeignKey, Manager, Model,
+                              PositiveSmallIntegerField, Q, TextField)
 from django.utils import timezone
+from django.utils.encoding import force_text
 from django.utils.translation import ugettext_lazy as _
 
 
@@ -41,7 +44,7 @@ class ExpiredRegistrationManager(Manager):
         end_date = timezone.now()
         start_date = end_date - timedelta(days=Registration.validity_delay)
         qs = super(ExpiredRegistrationManager, self).get_queryset()
-        return qs.exclude(created__range=(start_date, end_date))
+        return qs.filter(Q(created__lt=start_date) | Q(created__gt=end_date))
 
 
 class Registration(Model):
@@ -51,8 +54,8 @@ class Registration(Model):
 
     """
     user = ForeignKey(settings.AUTH_USER_MODEL)
-    key = CharField(_('key'), max_length=40)
-    created = DateTimeField(_('created'), auto_now_add=True)
+    key = CharField(_('key'), max_length=40, db_index=True)
+    created = DateTimeField(_('created'), auto_now_add=True, db_index=True)
     validity_delay = 30
 
     objects = RegistrationManager()
@@ -69,3 +72,107 @@ class Registration(Model):
     class Meta(object):
         verbose_name = _('account registration')
         verbose_name_plural = _('account registrations')
+
+
+class OutboxEmailManager(Manager):
+    """Manager of the ``OutboxEmail`` model."""
+    def enqueue(self, subject, body, to, from_email=None, html_body=''):
+        """Record an email to send to the address ``to``."""
+        from_email = from_email or settings.DEFAULT_FROM_EMAIL
+        return self.create(subject=subject, body=body, html_body=html_body,
+                           from_email=from_email, to=to)
+
+    def get_pending(self):
+        """Return a query set for the emails to send now."""
+        return self.filter(next_attempt__lte=timezone.now())
+
+    def send_pending(self, batch_size=100, connection=None):
+        """Send at most ``batch_size`` pending emails.
+
+        Emails are sent by a single connection to the email backend,
+        opened by ``django.core.mail.get_connection`` unless given.
+        Sent emails are deleted and failed ones are postponed (see
+        ``OutboxEmail.postpone``).
+
+        Return the numbers of sent and failed emails.
+        """
+        emails = list(self.get_pending().order_by('next_attempt',
+                                                  'pk')[:batch_size])
+        if not emails:
+            return 0, 0
+        connection = connection or get_connection()
+        sent, failed = [], 0
+        try:
+            connection.open()
+        except Exception as e:
+            for email in emails:
+                email.postpone(e)
+            return 0, len(emails)
+        try:
+            for email in emails:
+                try:
+                    connection.send_messages([email.get_message()])
+                except Exception as e:
+                    email.postpone(e)
+                    failed += 1
+                else:
+                    sent.append(email.pk)
+        finally:
+            connection.close()
+        self.filter(pk__in=sent).delete()
+        return len(sent), failed
+
+
+class OutboxEmail(Model):
+    """Model for emails waiting to be sent.
+
+    Emails are recorded while handling requests and sent later by the
+    ``sendemails`` command, so that requests don't wait for the mail
+    server. A failed email is tried again after ``retry_delay``
+    seconds, a delay doubled after each attempt, until
+    ``max_attempts`` attempts have failed.
+
+    """
+    subject = CharField(_('subject'), max_length=255)
+    body = TextField(_('body'))
+    html_body = TextField(_('HTML body'), blank=True)
+    from_email = CharField(_('sender'), max_length=254)
+    to = CharField(_('recipient'), max_length=254)
+    created = DateTimeField(_('created'), auto_now_add=True)
+    attempts = PositiveSmallIntegerField(_('attempts'), default=0)
+    next_attempt = DateTimeField(_('next attempt'), default=timezone.now,
+                                 null=True, db_index=True)
+    last_error = TextField(_('last error'), blank=True)
+    retry_delay = 60
+    max_attempts = 8
+
+    objects = OutboxEmailManager()
+
+    def __str__(self):
+        return u'Email to {0}: {1}'.format(self.to, self.subject)
+
+    def get_message(self):
+        """Return the email message to send."""
+        message = EmailMultiAlternatives(self.subject, self.body,
+                                         self.from_email, [self.to])
+        if self.html_body:
+            message.attach_alternative(self.html_body, 'text/html')
+        return message
+
+    def postpone(self, error):
+        """Record a failed attempt and schedule the next one.
+
+        No attempt is scheduled after ``max_attempts`` attempts.
+        """
+        self.attempts += 1
+        self.last_error = force_text(error)
+        if self.attempts < self.max_attempts:
+            delay = self.retry_delay * 2 ** (self.attempts - 1)
+            self.next_attempt = timezone.now() + timedelta(seconds=delay)
+        else:
+            self.next_attempt = None
+        self.save(update_fields=['attempts', 'last_error', 'next_attempt'])
+
+    class Meta(object):
+        verbose_name = _('outbox email')
+        verbose_name_plural = _('outbox emails')
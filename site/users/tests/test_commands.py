@@ -0,0 +1,77 @@
+"""Tests for management commands of the users application."""
+
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils.six import StringIO
+from django.utils.timezone import now
+from tracker.models import (Expenditure, Purse, TagStat)
+from users.models import Registration
+
+User = get_user_model()
+
+
+class CleanupRegistrationsTest(TestCase):
+    def setUp(self):
+        for i in range(3):
+            u = User.objects.create(username='test{0}'.format(i))
+            r = Registration.objects.create_registration(u)
+            if i:
+                r.created = now() - timedelta(days=31)
+                r.save()
+
+    def test_cleanup(self):
+        """Test expired registrations are deleted by chunks."""
+        out = StringIO()
+        call_command('cleanupregistrations', dry_run=True, stdout=out)
+        self.assertIn('(dry run) 2 expired registrations to delete',
+                      out.getvalue())
+        self.assertEqual(Registration.objects.count(), 3)
+        out = StringIO()
+        call_command('cleanupregistrations', batch_size=1, stdout=out)
+        self.assertIn('1 expired registrations deleted (1 rows',
+                      out.getvalue())
+        self.assertIn('2 expired registrations deleted (2 rows',
+                      out.getvalue())
+        self.assertEqual(Registration.objects.count(), 1)
+        out = StringIO()
+        call_command('cleanupregistrations', stdout=out)
+        self.assertIn('No expired registrations found', out.getvalue())
+
+    def test_time_budget(self):
+        """Test no deletion is started after the time budget."""
+        out = StringIO()
+        call_command('cleanupregistrations', budget=0, stdout=out)
+        self.assertIn('Time budget exhausted', out.getvalue())
+        self.assertEqual(Registration.objects.count(), 3)
+
+
+class CleanupUsersTest(TestCase):
+    def setUp(self):
+        self.active = User.objects.create(username='active')
+        self.inactive = User.objects.create(username='inactive',
+                                            is_active=False)
+        self.registered = User.objects.create(username='registered',
+                                              is_active=False)
+        Registration.objects.create_registration(self.registered)
+        self.p = Purse.objects.create(name='test')
+        self.p.users.add(self.active, self.inactive)
+        for u in [self.active, self.inactive]:
+            Expenditure.objects.create(amount=10, date='2015-01-02',
+                                       description='bread', author=u,
+                                       purse=self.p)
+
+    def test_cleanup(self):
+        """Test inactive accounts without registration are deleted."""
+        version = Purse.objects.get().version
+        out = StringIO()
+        call_command('cleanupusers', stdout=out)
+        self.assertIn('1 expired user accounts deleted', out.getvalue())
+        self.assertEqual(sorted(User.objects.values_list('username',
+                                                         flat=True)),
+                         ['active', 'registered'])
+        self.assertEqual(self.p.expenditure_set.count(), 1)
+        self.assertEqual(TagStat.objects.get().amount, 10)
+        self.assertEqual(TagStat.objects.check(), [])
+        self.assertGreater(Purse.objects.get().version, version)
@@ -2,9 +2,11 @@
 
 from django.contrib.auth import get_user_model
 from django.core import mail
+from django.core.management import call_command
 from django.test import TestCase
+from django.utils.six import StringIO
 
-from users.models import Registration
+from users.models import (OutboxEmail, Registration)
 from users.forms import UserCreationForm
 
 User = get_user_model()
@@ -24,7 +26,11 @@ class UserCreationFormTest(TestCase):
         form.save()
         self.assertEqual(User.objects.count(), 1)
         self.assertEqual(Registration.objects.count(), 1)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboxEmail.objects.get().to, 'test@example.com')
+        call_command('sendemails', once=True, stdout=StringIO())
         self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(OutboxEmail.objects.count(), 0)
 
     def test_password_missmatch(self):
         """Check that a form with different passwords is not valid."""
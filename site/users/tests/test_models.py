@@ -3,9 +3,10 @@
 from datetime import timedelta
 from django.contrib.auth import get_user_model
 from django.core import mail
-from django.test import TestCase
+from django.core.mail.backends.base import BaseEmailBackend
+from django.test import (TestCase, override_settings)
 from django.utils.timezone import now
-from users.models import Registration
+from users.models import (OutboxEmail, Registration)
 
 User = get_user_model()
 
@@ -52,3 +53,47 @@ class RegistrationTest(TestCase):
         reg.created = now() - timedelta(days=31)
         reg.save()
         self.assertEqual(Registration.expired_objects.count(), 1)
+
+
+class FailingBackend(BaseEmailBackend):
+    """Email backend failing to send messages."""
+    def send_messages(self, email_messages):
+        raise IOError('Connection refused')
+
+
+class OutboxEmailTest(TestCase):
+    def setUp(self):
+        for i in range(3):
+            OutboxEmail.objects.enqueue('Subject', 'Body',
+                                        'test{0}@example.com'.format(i),
+                                        html_body='<p>Body</p>')
+
+    def test_send(self):
+        """Test pending emails are sent by batches."""
+        self.assertEqual(OutboxEmail.objects.send_pending(2), (2, 0))
+        self.assertEqual(OutboxEmail.objects.send_pending(2), (1, 0))
+        self.assertEqual(OutboxEmail.objects.send_pending(2), (0, 0))
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox),
+                         ['test0@example.com', 'test1@example.com',
+                          'test2@example.com'])
+        self.assertEqual(mail.outbox[0].alternatives,
+                         [('<p>Body</p>', 'text/html')])
+        self.assertEqual(OutboxEmail.objects.count(), 0)
+
+    @override_settings(
+        EMAIL_BACKEND='users.tests.test_models.FailingBackend')
+    def test_retry(self):
+        """Test failed emails are postponed, then abandoned."""
+        self.assertEqual(OutboxEmail.objects.send_pending(), (0, 3))
+        self.assertEqual(OutboxEmail.objects.send_pending(), (0, 0))
+        email = OutboxEmail.objects.first()
+        self.assertEqual(email.attempts, 1)
+        self.assertEqual(email.last_error, 'Connection refused')
+        delay = email.next_attempt - now()
+        self.assertTrue(50 < delay.total_seconds() <= 60)
+        OutboxEmail.objects.update(next_attempt=now(),
+                                   attempts=OutboxEmail.max_attempts - 1)
+        self.assertEqual(OutboxEmail.objects.send_pending(), (0, 3))
+        self.assertEqual(OutboxEmail.objects.filter(
+            next_attempt__isnull=True).count(), 3)
+        self.assertEqual(OutboxEmail.objects.get_pending().count(), 0)
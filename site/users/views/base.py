@@ -13,7 +13,7 @@ from django.views.generic import (CreateView, DeleteView, FormView,
 from users.forms import (UserChangeForm,
                          UserCreationForm,
                          SetPasswordForm)
-from users.models import Registration
+from users.models import (OutboxEmail, Registration)
 from users.views.mixins import LoginRequiredMixin
 
 User = get_user_model()
@@ -72,7 +72,7 @@ class UserDeletion(LoginRequiredMixin, DeleteView):
         subject = render_to_string(self.subject_template_name, c)
         subject = ''.join(subject.splitlines())
         email = render_to_string(self.email_template_name, c)
-        self.object.email_user(subject, email)
+        OutboxEmail.objects.enqueue(subject, email, self.object.email)
         return HttpResponseRedirect(self.get_success_url())
 
 